@@ -2,4 +2,5 @@ from .modelComida import comida
 from .modelMenu import menu
 from .modelTipoComidas import tipoComida
 from .modelAlimento import Alimento, Tipo, Unidad
-__all__ = ['comida', 'menu', 'tipoComida', 'Alimento', 'Tipo', 'Unidad']
\ No newline at end of file
+from .modelMenuBien import Menu_Bien
+__all__ = ['comida', 'menu', 'tipoComida', 'Alimento', 'Tipo', 'Unidad', 'Menu_Bien']
\ No newline at end of file
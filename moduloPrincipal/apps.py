@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ModuloprincipalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'moduloPrincipal'
+
+    def ready(self):
+        # Registra las senales que mantienen el mapa de ocupacion de las citas
+        from . import signals  # noqa: F401
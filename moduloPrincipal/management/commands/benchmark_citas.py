@@ -0,0 +1,158 @@
+"""
+Benchmark de las consultas sobre Cita.
+
+Llena la base de datos con una tabla de citas grande dentro de una
+transaccion, imprime el plan de ejecucion (EXPLAIN) y los tiempos de las
+consultas que usan las vistas de citas, y al final deshace todo, de modo que
+la base de datos queda igual que antes de correrlo::
+
+    python manage.py benchmark_citas --citas 200000 --repeticiones 30
+"""
+import random
+import statistics
+import time as reloj
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Max
+
+from moduloPrincipal.models import Cita, Especialidades, Especialista, OcupacionDia, Paciente, Usuario
+from moduloPrincipal.utils import ocupacion
+from moduloPrincipal.utils.calendario import citas_del_calendario
+from moduloPrincipal.utils.horario import compilar_horario, minutos_a_time
+from moduloPrincipal.utils.reservas import citas_del_paciente
+
+HORARIO = "8:00-16:00;8:00-16:00;8:00-16:00;8:00-16:00;8:00-16:00;;"
+SLOTS_POR_DIA = 16
+ESTATUS_PASADAS = (["A", "B", "C", "P"], [70, 15, 10, 5])
+ESTATUS_FUTURAS = (["P", "C", "B"], [50, 40, 10])
+
+
+class Command(BaseCommand):
+    help = "Genera citas de prueba y mide el plan y el tiempo de las consultas de las vistas de citas"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--citas", type=int, default=100000)
+        parser.add_argument("--especialistas", type=int, default=40)
+        parser.add_argument("--pacientes", type=int, default=5000)
+        parser.add_argument("--repeticiones", type=int, default=20)
+        parser.add_argument("--semilla", type=int, default=0)
+
+    def handle(self, *args, **options):
+        aleatorio = random.Random(options["semilla"])
+        with transaction.atomic():
+            especialistas, pacientes = self.generar_datos(options, aleatorio)
+            if connection.vendor == "sqlite":
+                # Sin estadisticas el planificador de SQLite no elige bien entre indices
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+            for nombre, consulta in self.consultas(especialistas, pacientes, aleatorio):
+                self.medir(nombre, consulta, options["repeticiones"])
+            # Nada de lo generado se queda en la base de datos
+            transaction.set_rollback(True)
+
+    def generar_datos(self, options, aleatorio):
+        inicio = reloj.perf_counter()
+        total_especialistas = options["especialistas"]
+        total_pacientes = options["pacientes"]
+
+        usuarios = User.objects.bulk_create(
+            [User(username=f"benchmark_{n}", password="!") for n in range(total_especialistas + total_pacientes)],
+            batch_size=1000,
+        )
+        perfiles = Usuario.objects.bulk_create(
+            [Usuario(id_usuario=usuario, fecha_nacimiento=date(1990, 1, 1), foto="",
+                     tipo="E" if n < total_especialistas else "P")
+             for n, usuario in enumerate(usuarios)],
+            batch_size=1000,
+        )
+        especialidad = Especialidades.objects.create(nombre="Benchmark", descripcion="")
+        compilado = compilar_horario(HORARIO)
+        especialistas = Especialista.objects.bulk_create(
+            [Especialista(id_usuario=perfil, id_especialidad=especialidad, cedula="0", info_ad="",
+                          horario=HORARIO, horario_compilado=compilado, estatus="1")
+             for perfil in perfiles[:total_especialistas]],
+        )
+        pacientes = Paciente.objects.bulk_create(
+            [Paciente(id_usuario=perfil, peso=70, talla=170, estado_civil="S", estilo_vida="A")
+             for perfil in perfiles[total_especialistas:]],
+            batch_size=1000,
+        )
+
+        # Cada especialista recibe los horarios en orden, asi no se repite (especialista, fecha, hora).
+        # Dos tercios de los dias quedan en el pasado y el resto en el futuro.
+        hoy = date.today()
+        dias = -(-options["citas"] // (total_especialistas * SLOTS_POR_DIA))
+        primer_dia = hoy - timedelta(days=dias * 2 // 3)
+        citas = []
+        for n in range(options["citas"]):
+            especialista = especialistas[n % total_especialistas]
+            dia, slot = divmod(n // total_especialistas, SLOTS_POR_DIA)
+            fecha = primer_dia + timedelta(days=dia)
+            estatus, pesos = ESTATUS_PASADAS if fecha < hoy else ESTATUS_FUTURAS
+            citas.append(Cita(id_especialista=especialista, id_paciente=aleatorio.choice(pacientes),
+                              fecha=fecha, hora=minutos_a_time(8 * 60 + 30 * slot),
+                              estatus=aleatorio.choices(estatus, pesos)[0], motivo=""))
+        Cita.objects.bulk_create(citas, batch_size=2000)
+        # bulk_create no dispara las senales que llenan el mapa de ocupacion
+        ocupacion.reconstruir()
+
+        self.stdout.write(f"{len(citas)} citas, {total_especialistas} especialistas y {total_pacientes} pacientes "
+                          f"generados en {reloj.perf_counter() - inicio:.1f} s")
+        return especialistas, pacientes
+
+    def consultas(self, especialistas, pacientes, aleatorio):
+        """Las mismas consultas que hacen las vistas, con un especialista y un paciente al azar."""
+        hoy = date.today()
+        lunes = hoy - timedelta(days=hoy.weekday())
+        especialista = aleatorio.choice(especialistas)
+        paciente = aleatorio.choice(pacientes)
+        return [
+            ("Agendar.post (mapa de ocupacion del especialista)",
+             OcupacionDia.objects.filter(id_especialista_id=especialista.id, fecha=hoy).values_list("mapa")),
+            ("Agendar.post (citas del paciente)",
+             citas_del_paciente(paciente.id, hoy)),
+            ("Disponibilidad",
+             OcupacionDia.objects.filter(id_especialista_id=especialista.id,
+                                         fecha__range=(hoy, hoy + timedelta(days=30))).values_list("fecha", "mapa")),
+            ("ListarCitas_Especialista (todas, pendientes)",
+             Cita.objects.filter(id_especialista=especialista.id, estatus="P")
+             .select_related("id_paciente__id_usuario__id_usuario").order_by("fecha", "hora", "id")[:51]),
+            ("ListarCitas_Especialista (todas, confirmadas y atendidas)",
+             Cita.objects.filter(id_especialista=especialista.id, estatus__in=["C", "A"])
+             .select_related("id_paciente__id_usuario__id_usuario").order_by("fecha", "hora", "id")[:51]),
+            ("ListarCitas_Especialista (agenda semanal, pendientes)",
+             Cita.objects.filter(id_especialista=especialista.id, estatus="P",
+                                 fecha__range=(lunes, lunes + timedelta(days=6)))
+             .select_related("id_paciente__id_usuario__id_usuario").order_by("fecha", "hora", "id")[:51]),
+            ("ListarCitas_Especialista (solo exploracion fisica)",
+             Cita.objects.filter(fecha__gt=hoy, estatus="C", fecha__range=(lunes, lunes + timedelta(days=6)))
+             .select_related("id_paciente__id_usuario__id_usuario").order_by("fecha", "hora", "id")[:51]),
+            ("ListarCitas_Paciente",
+             Cita.objects.filter(id_paciente=paciente.id)),
+            ("Informacion_Paciente_full",
+             Cita.objects.filter(id_paciente=paciente.id).filter(id_especialista=especialista.id)
+             .exclude(estatus="B").exclude(estatus="P").order_by("-fecha")),
+            ("Citas pendientes vencidas",
+             Cita.objects.filter(estatus="P", fecha__lt=hoy)),
+            ("Calendario_especialista (ETag: ultimo cambio y numero de citas)",
+             Cita.objects.filter(id_especialista_id=especialista.id).values("id_especialista_id")
+             .annotate(ultima=Max("actualizada"), total=Count("id"))),
+            ("Calendario_especialista (citas confirmadas)",
+             citas_del_calendario(especialista.id)),
+        ]
+
+    def medir(self, nombre, consulta, repeticiones):
+        tiempos = []
+        filas = 0
+        for _ in range(max(repeticiones, 1)):
+            inicio = reloj.perf_counter()
+            filas = len(list(consulta.all()))
+            tiempos.append((reloj.perf_counter() - inicio) * 1000)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(nombre))
+        self.stdout.write(consulta.explain())
+        self.stdout.write(f"{filas} filas | mediana {statistics.median(tiempos):.2f} ms | "
+                          f"min {min(tiempos):.2f} ms | max {max(tiempos):.2f} ms\n")
@@ -0,0 +1,70 @@
+"""
+Cierra las citas vencidas que se quedaron pendientes o confirmadas.
+
+Una cita pendiente (``P``) cuya fecha ya paso nunca fue aceptada y pasa a
+baja (``B``). Una confirmada (``C``) que sigue asi varios dias despues nunca
+se atendio: pasa a ``N`` (no asistio) y no a baja, para que las curvas de
+demanda (``utils.demanda``) la sigan contando como inasistencia y no como
+cancelacion. A las confirmadas se les da un margen mayor para que el
+especialista pueda registrar la consulta tarde.
+
+Las bajas se hacen con ``update()`` por rangos de id, cada rango en su
+propia transaccion, para no bloquear la tabla de citas mucho tiempo. Pensado
+para correr a diario (cron)::
+
+    python manage.py depurar_citas --dry-run
+    python manage.py depurar_citas --lote 10000
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, Count, Max, Min, Q, Value, When
+from django.utils import timezone
+
+from moduloPrincipal.models import Cita, OcupacionDia
+
+
+class Command(BaseCommand):
+    help = "Cierra por lotes las citas pendientes o confirmadas cuya fecha ya paso"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Solo muestra cuantas citas se cerrarian, sin modificarlas")
+        parser.add_argument("--lote", type=int, default=5000,
+                            help="Tamano de cada rango de ids que se actualiza en una transaccion")
+        parser.add_argument("--gracia-pendientes", type=int, default=0,
+                            help="Dias despues de la fecha de la cita para dar de baja las pendientes")
+        parser.add_argument("--gracia-confirmadas", type=int, default=7,
+                            help="Dias despues de la fecha de la cita para marcar las confirmadas como no asistidas")
+
+    def handle(self, *args, **options):
+        hoy = timezone.localdate()
+        vencidas = (
+            Q(estatus="P", fecha__lt=hoy - timedelta(days=options["gracia_pendientes"]))
+            | Q(estatus="C", fecha__lt=hoy - timedelta(days=options["gracia_confirmadas"]))
+        )
+        resumen = Cita.objects.filter(vencidas).aggregate(
+            pendientes=Count("id", filter=Q(estatus="P")),
+            confirmadas=Count("id", filter=Q(estatus="C")),
+            primera=Min("id"),
+            ultima=Max("id"),
+        )
+        self.stdout.write(f"Citas vencidas: {resumen['pendientes']} pendientes y {resumen['confirmadas']} confirmadas")
+        if options["dry_run"] or resumen["primera"] is None:
+            return
+
+        lote = max(options["lote"], 1)
+        total = 0
+        ahora = timezone.now()
+        # Las pendientes se dan de baja y las confirmadas quedan como no asistidas
+        nuevo_estatus = Case(When(estatus="C", then=Value("N")), default=Value("B"))
+        for inicio in range(resumen["primera"], resumen["ultima"] + 1, lote):
+            with transaction.atomic():
+                total += Cita.objects.filter(vencidas, id__gte=inicio, id__lt=inicio + lote).update(
+                    estatus=nuevo_estatus, actualizada=ahora)
+
+        # update() no pasa por las senales; los mapas de dias pasados ya no se consultan (solo se agenda a partir
+        # de manana), asi que se borran en lugar de recalcularlos
+        OcupacionDia.objects.filter(fecha__lt=hoy).delete()
+        self.stdout.write(self.style.SUCCESS(f"{total} citas vencidas cerradas"))
@@ -0,0 +1,35 @@
+"""
+Ofrece los horarios liberados a los pacientes en lista de espera y vence las
+ofertas que no se aceptaron a tiempo.
+
+Se puede correr periodicamente (cron) o dejarlo corriendo con
+``--continuo``::
+
+    python manage.py procesar_lista_espera
+    python manage.py procesar_lista_espera --continuo --intervalo 15
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from moduloPrincipal.utils.lista_espera import procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = "Ofrece los horarios de citas canceladas al siguiente paciente en lista de espera"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=100, help="Eventos que se procesan por vuelta")
+        parser.add_argument("--continuo", action="store_true", help="Sigue revisando cada --intervalo segundos")
+        parser.add_argument("--intervalo", type=float, default=30)
+
+    def handle(self, *args, **options):
+        while True:
+            procesados, ofrecidos = procesar_pendientes(max(options["lote"], 1))
+            if procesados or not options["continuo"]:
+                self.stdout.write(f"{procesados} horarios liberados procesados, {ofrecidos} horarios ofrecidos")
+            if not options["continuo"]:
+                return
+            # Si el lote se lleno puede haber mas eventos esperando
+            if procesados < options["lote"]:
+                time.sleep(options["intervalo"])
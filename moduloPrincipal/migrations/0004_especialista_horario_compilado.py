@@ -0,0 +1,50 @@
+from django.db import migrations, models
+
+
+# Copia congelada de utils.horario.compilar_horario (sin validacion estricta) para que la migracion no cambie si
+# cambia el codigo de la aplicacion
+def compilar_horario(texto):
+    dias = (texto or '').split(';')
+    compilado = []
+    for indice in range(7):
+        segmento = dias[indice] if indice < len(dias) else ''
+        intervalos = []
+        for turno in segmento.split(','):
+            inicio, _, fin = turno.partition('-')
+            try:
+                horas_inicio, minutos_inicio = (int(parte) for parte in inicio.strip().split(':'))
+                horas_fin, minutos_fin = (int(parte) for parte in fin.strip().split(':'))
+            except ValueError:
+                continue
+            if not (0 <= horas_inicio <= 24 and 0 <= minutos_inicio < 60 and 0 <= horas_fin <= 24 and 0 <= minutos_fin < 60):
+                continue
+            inicio_min, fin_min = horas_inicio * 60 + minutos_inicio, horas_fin * 60 + minutos_fin
+            if inicio_min < fin_min <= 24 * 60:
+                intervalos.append([inicio_min, fin_min])
+        intervalos.sort()
+        compilado.append(intervalos)
+    return compilado
+
+
+def compilar_horarios(apps, schema_editor):
+    Especialista = apps.get_model('moduloPrincipal', 'Especialista')
+    especialistas = list(Especialista.objects.only('id', 'horario'))
+    for especialista in especialistas:
+        especialista.horario_compilado = compilar_horario(especialista.horario)
+    Especialista.objects.bulk_update(especialistas, ['horario_compilado'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moduloPrincipal', '0003_alter_diagnostico_id_cita_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='especialista',
+            name='horario_compilado',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(compilar_horarios, migrations.RunPython.noop),
+    ]
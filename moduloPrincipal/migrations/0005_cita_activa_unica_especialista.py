@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-17 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moduloPrincipal', '0004_especialista_horario_compilado'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='cita',
+            constraint=models.UniqueConstraint(condition=models.Q(('estatus', 'B'), _negated=True), fields=('id_especialista', 'fecha', 'hora'), name='cita_activa_unica_especialista'),
+        ),
+    ]
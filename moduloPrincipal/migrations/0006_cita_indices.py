@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-17 17:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moduloPrincipal', '0005_cita_activa_unica_especialista'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cita',
+            name='id_especialista',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='moduloPrincipal.especialista'),
+        ),
+        migrations.AlterField(
+            model_name='cita',
+            name='id_paciente',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='moduloPrincipal.paciente'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['id_especialista', 'fecha', 'hora'], name='cita_especialista_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['id_paciente', 'fecha'], name='cita_paciente_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['estatus', 'fecha'], name='cita_estatus_fecha'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-17 17:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copia congelada de utils.ocupacion.calcular_mapas (bloques de 30 minutos) para que la migracion no cambie si
+# cambia el codigo de la aplicacion
+def calcular_mapas(citas):
+    mapas = {}
+    for id_especialista, fecha, hora in citas:
+        llave = (id_especialista, fecha)
+        mapas[llave] = mapas.get(llave, 0) | (1 << ((hora.hour * 60 + hora.minute) // 30))
+    return mapas
+
+
+def generar_mapas(apps, schema_editor):
+    Cita = apps.get_model('moduloPrincipal', 'Cita')
+    OcupacionDia = apps.get_model('moduloPrincipal', 'OcupacionDia')
+    citas = Cita.objects.exclude(estatus='B').values_list('id_especialista_id', 'fecha', 'hora').iterator()
+    OcupacionDia.objects.bulk_create(
+        [OcupacionDia(id_especialista_id=especialista, fecha=fecha, mapa=mapa)
+         for (especialista, fecha), mapa in calcular_mapas(citas).items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moduloPrincipal', '0006_cita_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcupacionDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('mapa', models.BigIntegerField(default=0)),
+                ('id_especialista', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='moduloPrincipal.especialista')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('id_especialista', 'fecha'), name='ocupacion_unica_especialista_fecha')],
+            },
+        ),
+        migrations.RunPython(generar_mapas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-17 17:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moduloPrincipal', '0007_ocupaciondia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExcepcionHorario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_inicio', models.DateField()),
+                ('fecha_fin', models.DateField()),
+                ('hora_inicio', models.TimeField(blank=True, null=True)),
+                ('hora_fin', models.TimeField(blank=True, null=True)),
+                ('motivo', models.CharField(blank=True, default='', max_length=200)),
+                ('id_especialista', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='moduloPrincipal.especialista')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['id_especialista', 'fecha_fin'], name='excepcion_especialista_fin')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-17 17:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moduloPrincipal', '0008_excepcionhorario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HorarioLiberado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('hora', models.TimeField()),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('id_especialista', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='moduloPrincipal.especialista')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ListaEspera',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_desde', models.DateField()),
+                ('fecha_hasta', models.DateField()),
+                ('motivo', models.TextField(blank=True, default='')),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('estatus', models.CharField(default='E', max_length=1)),
+                ('id_cita', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='moduloPrincipal.cita')),
+                ('id_especialista', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='moduloPrincipal.especialista')),
+                ('id_paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='moduloPrincipal.paciente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['id_especialista', 'estatus', 'creada'], name='espera_especialista_turno')],
+            },
+        ),
+    ]
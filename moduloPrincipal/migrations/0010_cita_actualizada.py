@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-17 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moduloPrincipal', '0009_lista_espera'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita',
+            name='actualizada',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['id_especialista', 'actualizada'], name='cita_especialista_actualizada'),
+        ),
+    ]
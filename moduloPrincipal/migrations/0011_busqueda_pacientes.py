@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-17 18:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moduloPrincipal', '0010_cita_actualizada'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ant_patologicos',
+            name='id_paciente',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='moduloPrincipal.paciente'),
+        ),
+        migrations.AlterField(
+            model_name='solicitudes',
+            name='id_especialista',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='moduloPrincipal.especialista'),
+        ),
+        migrations.AddIndex(
+            model_name='ant_patologicos',
+            index=models.Index(fields=['id_paciente', 'patologia'], name='patologico_paciente'),
+        ),
+        migrations.AddIndex(
+            model_name='solicitudes',
+            index=models.Index(fields=['id_especialista', 'estatus', 'id_paciente'], name='solicitud_especialista'),
+        ),
+    ]
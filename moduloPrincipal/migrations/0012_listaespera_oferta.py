@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moduloPrincipal', '0011_busqueda_pacientes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listaespera',
+            name='oferta_fecha',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listaespera',
+            name='oferta_hora',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listaespera',
+            name='oferta_vence',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
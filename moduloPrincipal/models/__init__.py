@@ -6,12 +6,16 @@ from .modelCita import Cita
 from .modelDiagnostico import Diagnostico
 from .modelEspecialidades import Especialidades
 from .modelEspecialista import Especialista
+from .modelExcepcionHorario import ExcepcionHorario
 from .modelExploracion_fisica import Exploracion_fisica
 from .modelHistoriales import Historiales
+from .modelHorarioLiberado import HorarioLiberado
+from .modelListaEspera import ListaEspera
+from .modelOcupacionDia import OcupacionDia
 from .modelPaciente import Paciente
 from .modelSolicitudes import Solicitudes
 from .modelToxicomania import Toxicomania
 from .modelTratamiento import Tratamiento
 from .modelUsuario import Usuario
 from .modelVacunacion import Vacunacion
-__all__ = ['Alergias', 'Ant_Patologicos', 'Ant_quirurjicos', 'Ant_transfusionales', 'Cita', 'Diagnostico', 'Especialidades', 'Especialista', 'Exploracion_fisica', 'Historiales', 'Paciente', 'Solicitudes', 'Toxicomania', 'Tratamiento','Usuario', 'Vacunacion']
\ No newline at end of file
+__all__ = ['Alergias', 'Ant_Patologicos', 'Ant_quirurjicos', 'Ant_transfusionales', 'Cita', 'Diagnostico', 'Especialidades', 'Especialista', 'ExcepcionHorario', 'Exploracion_fisica', 'Historiales', 'HorarioLiberado', 'ListaEspera', 'OcupacionDia', 'Paciente', 'Solicitudes', 'Toxicomania', 'Tratamiento','Usuario', 'Vacunacion']
\ No newline at end of file
@@ -3,8 +3,13 @@ from django.db import models
 from django.contrib.auth.models import User
 from .modelPaciente import Paciente
 class Ant_Patologicos(models.Model):
-    id_paciente = models.ForeignKey(Paciente, on_delete=models.DO_NOTHING)
+    # Sin indice propio: el indice compuesto de Meta empieza por esta columna
+    id_paciente = models.ForeignKey(Paciente, on_delete=models.DO_NOTHING, db_index=False)
     patologia = models.CharField(max_length=100)
 
     class Meta:
-        app_label = 'moduloPrincipal'
\ No newline at end of file
+        app_label = 'moduloPrincipal'
+        indexes = [
+            # Antecedentes del paciente y busqueda de pacientes por patologia
+            models.Index(fields=['id_paciente', 'patologia'], name='patologico_paciente'),
+        ]
\ No newline at end of file
@@ -4,13 +4,31 @@ from django.contrib.auth.models import User
 from .modelEspecialista import Especialista
 from .modelPaciente import Paciente
 class Cita(models.Model):
-    id_especialista = models.ForeignKey(Especialista, on_delete=models.DO_NOTHING)
-    id_paciente = models.ForeignKey(Paciente, on_delete=models.DO_NOTHING)
+    # Sin indice propio: los indices compuestos de Meta empiezan por estas columnas
+    id_especialista = models.ForeignKey(Especialista, on_delete=models.DO_NOTHING, db_index=False)
+    id_paciente = models.ForeignKey(Paciente, on_delete=models.DO_NOTHING, db_index=False)
     fecha = models.DateField()
     hora = models.TimeField()
     motivo = models.TextField()
-    estatus = models.CharField(max_length=1)  # P=pendiente, B=baja, C=confirmada, A=atendida
+    estatus = models.CharField(max_length=1)  # P=pendiente, B=baja, C=confirmada, A=atendida, N=no asistio
     imagen = models.ImageField(upload_to='imagenes_citas', default='')
+    # Ultimo cambio de la cita; los update() masivos deben asignarlo explicitamente
+    actualizada = models.DateTimeField(auto_now=True)
 
     class Meta:
-        app_label = 'moduloPrincipal'
\ No newline at end of file
+        app_label = 'moduloPrincipal'
+        constraints = [
+            # Un especialista no puede tener 2 citas activas (estatus distinto de baja) el mismo dia a la misma hora
+            models.UniqueConstraint(fields=['id_especialista', 'fecha', 'hora'], condition=~models.Q(estatus='B'),
+                                    name='cita_activa_unica_especialista'),
+        ]
+        indexes = [
+            # Agenda del especialista, disponibilidad y validacion de choques al agendar
+            models.Index(fields=['id_especialista', 'fecha', 'hora'], name='cita_especialista_fecha'),
+            # Citas del paciente (lista de citas, historial con un especialista, choques del mismo dia)
+            models.Index(fields=['id_paciente', 'fecha'], name='cita_paciente_fecha'),
+            # Citas por estatus en un rango de fechas (confirmadas proximas, pendientes vencidas)
+            models.Index(fields=['estatus', 'fecha'], name='cita_estatus_fecha'),
+            # Version del calendario del especialista (ultimo cambio y numero de citas) sin leer la tabla
+            models.Index(fields=['id_especialista', 'actualizada'], name='cita_especialista_actualizada'),
+        ]
@@ -3,6 +3,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from .modelUsuario import Usuario
 from .modelEspecialidades import Especialidades
+from moduloPrincipal.utils.horario import compilar_horario
 class Especialista(models.Model):
     id_usuario = models.ForeignKey(Usuario, on_delete=models.DO_NOTHING)
     id_especialidad = models.ForeignKey(Especialidades, on_delete=models.DO_NOTHING)
@@ -16,7 +17,18 @@ class Especialista(models.Model):
         10:00-13:00, 14:00-18:00;
         10:00-14:00;
         """
+    # Horario ya separado por dias: 7 listas (lunes a domingo) de intervalos [inicio, fin] en minutos
+    horario_compilado = models.JSONField(default=list, blank=True)
     estatus = models.CharField(max_length=1)  # 0 = dado de baja, 1=Activo
 
     class Meta:
-        app_label = 'moduloPrincipal'
\ No newline at end of file
+        app_label = 'moduloPrincipal'
+
+    def save(self, *args, **kwargs):
+        # El horario se compila una sola vez al guardar y no en cada peticion; la ventana de horario lo valida antes
+        # de guardarlo, aqui no se rechazan los horarios que ya estaban guardados
+        self.horario_compilado = compilar_horario(self.horario, estricto=False)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'horario' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'horario_compilado'}
+        super().save(*args, **kwargs)
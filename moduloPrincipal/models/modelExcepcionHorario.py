@@ -0,0 +1,18 @@
+from django.db import models
+from .modelEspecialista import Especialista
+class ExcepcionHorario(models.Model):
+    id_especialista = models.ForeignKey(Especialista, on_delete=models.CASCADE, db_index=False)
+    # Dias que abarca la excepcion (vacaciones, dias festivos...), ambos inclusive
+    fecha_inicio = models.DateField()
+    fecha_fin = models.DateField()
+    # Si se indican, solo se bloquea ese horario en cada dia del rango; si no, el dia completo
+    hora_inicio = models.TimeField(null=True, blank=True)
+    hora_fin = models.TimeField(null=True, blank=True)
+    motivo = models.CharField(max_length=200, blank=True, default="")
+
+    class Meta:
+        app_label = 'moduloPrincipal'
+        indexes = [
+            # Excepciones vigentes de un especialista
+            models.Index(fields=['id_especialista', 'fecha_fin'], name='excepcion_especialista_fin'),
+        ]
@@ -0,0 +1,11 @@
+from django.db import models
+from .modelEspecialista import Especialista
+class HorarioLiberado(models.Model):
+    # Evento pendiente de procesar: se libero el horario de una cita (baja, cambio de fecha u hora, o se borro)
+    id_especialista = models.ForeignKey(Especialista, on_delete=models.CASCADE, db_index=False)
+    fecha = models.DateField()
+    hora = models.TimeField()
+    creado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'moduloPrincipal'
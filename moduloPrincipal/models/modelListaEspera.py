@@ -0,0 +1,26 @@
+from django.db import models
+from .modelCita import Cita
+from .modelEspecialista import Especialista
+from .modelPaciente import Paciente
+class ListaEspera(models.Model):
+    id_especialista = models.ForeignKey(Especialista, on_delete=models.CASCADE, db_index=False)
+    id_paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE)
+    # Dias en los que al paciente le sirve una cita que se libere, ambos inclusive
+    fecha_desde = models.DateField()
+    fecha_hasta = models.DateField()
+    motivo = models.TextField(blank=True, default="")
+    creada = models.DateTimeField(auto_now_add=True)
+    estatus = models.CharField(max_length=1, default="E")  # E=esperando, O=oferta, A=asignada, C=cancelada, V=vencida
+    # Horario liberado que se le ofrece al paciente y hasta cuando puede aceptarlo
+    oferta_fecha = models.DateField(null=True, blank=True)
+    oferta_hora = models.TimeField(null=True, blank=True)
+    oferta_vence = models.DateTimeField(null=True, blank=True)
+    # Cita que se le agendo al aceptar la oferta
+    id_cita = models.ForeignKey(Cita, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        app_label = 'moduloPrincipal'
+        indexes = [
+            # Turno de espera de cada especialista: primero el que se anoto antes
+            models.Index(fields=['id_especialista', 'estatus', 'creada'], name='espera_especialista_turno'),
+        ]
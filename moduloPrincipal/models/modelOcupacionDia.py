@@ -0,0 +1,14 @@
+from django.db import models
+from .modelEspecialista import Especialista
+class OcupacionDia(models.Model):
+    # Sin indice propio: la restriccion unica de Meta empieza por esta columna
+    id_especialista = models.ForeignKey(Especialista, on_delete=models.CASCADE, db_index=False)
+    fecha = models.DateField()
+    # Un bit por cada bloque de 30 minutos del dia (bit 0 = 00:00, bit 16 = 08:00...), 1 = ocupado por una cita activa
+    mapa = models.BigIntegerField(default=0)
+
+    class Meta:
+        app_label = 'moduloPrincipal'
+        constraints = [
+            models.UniqueConstraint(fields=['id_especialista', 'fecha'], name='ocupacion_unica_especialista_fecha'),
+        ]
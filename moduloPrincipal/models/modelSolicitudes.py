@@ -5,9 +5,14 @@ from .modelEspecialista import Especialista
 from .modelPaciente import Paciente
 
 class Solicitudes(models.Model):
-    id_especialista = models.ForeignKey(Especialista, on_delete=models.DO_NOTHING)
+    # Sin indice propio: el indice compuesto de Meta empieza por esta columna
+    id_especialista = models.ForeignKey(Especialista, on_delete=models.DO_NOTHING, db_index=False)
     id_paciente = models.ForeignKey(Paciente, on_delete=models.DO_NOTHING)
     estatus = models.CharField(max_length=1)  # ACEPTADA (A), RECHAZADA(R), PENDIENTE(P), BAJA(B)
 
     class Meta:
-        app_label = 'moduloPrincipal'
\ No newline at end of file
+        app_label = 'moduloPrincipal'
+        indexes = [
+            # Pacientes de un especialista por estatus de la solicitud (listado y busqueda de pacientes)
+            models.Index(fields=['id_especialista', 'estatus', 'id_paciente'], name='solicitud_especialista'),
+        ]
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+Senales que mantienen al dia el mapa de ocupacion (``OcupacionDia``) y el
+cache del expediente clinico de cada paciente, y que avisan a la lista de
+espera cuando una cita libera su horario.
+
+Al cargar una cita se recuerda el bloque que ocupaba (especialista, fecha,
+hora) si estaba activa. Al guardarla se compara con el bloque que ocupa
+ahora y solo se toca el mapa si cambio, asi que ediciones que no mueven la
+cita (motivo, imagen, confirmarla o atenderla) no hacen consultas extra.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from moduloPrincipal.models import (Alergias, Ant_Patologicos, Ant_quirurjicos, Ant_transfusionales, Cita,
+                                    Paciente, Toxicomania, Usuario, Vacunacion)
+from moduloPrincipal.utils import ocupacion
+from moduloPrincipal.utils.expediente import invalidar_expediente
+from moduloPrincipal.utils.lista_espera import avisar_horario_liberado
+
+CAMPOS_OCUPACION = ("id_especialista_id", "fecha", "hora", "estatus")
+# La cita se cargo sin alguno de esos campos (``only``/``defer``)
+DESCONOCIDO = object()
+
+
+def bloque_ocupado(id_especialista, fecha, hora, estatus):
+    """(especialista, fecha, hora) que ocupa la cita, o ``None`` si no ocupa ninguno."""
+    if estatus == "B" or None in (id_especialista, fecha, hora):
+        return None
+    return (id_especialista, Cita._meta.get_field("fecha").to_python(fecha),
+            Cita._meta.get_field("hora").to_python(hora))
+
+
+def bloque_de_cita(cita):
+    return bloque_ocupado(*(getattr(cita, campo) for campo in CAMPOS_OCUPACION))
+
+
+@receiver(post_init, sender=Cita)
+def recordar_bloque(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._bloque_original = None
+    elif any(campo in instance.get_deferred_fields() for campo in CAMPOS_OCUPACION):
+        instance._bloque_original = DESCONOCIDO
+    else:
+        instance._bloque_original = bloque_de_cita(instance)
+
+
+@receiver(pre_save, sender=Cita)
+@receiver(pre_delete, sender=Cita)
+def cargar_bloque_desconocido(sender, instance, raw=False, **kwargs):
+    if raw or instance._bloque_original is not DESCONOCIDO:
+        return
+    valores = Cita.objects.filter(pk=instance.pk).values_list(*CAMPOS_OCUPACION).first()
+    instance._bloque_original = bloque_ocupado(*valores) if valores else None
+
+
+@receiver(post_save, sender=Cita)
+def actualizar_ocupacion(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    anterior = instance._bloque_original
+    actual = bloque_de_cita(instance)
+    if anterior != actual:
+        if anterior:
+            ocupacion.liberar(*anterior)
+            avisar_horario_liberado(*anterior)
+        if actual:
+            ocupacion.marcar(*actual)
+    instance._bloque_original = actual
+
+
+@receiver(post_delete, sender=Cita)
+def liberar_ocupacion(sender, instance, **kwargs):
+    if instance._bloque_original:
+        ocupacion.liberar(*instance._bloque_original)
+        avisar_horario_liberado(*instance._bloque_original)
+
+
+def invalidar_expedientes(ids_pacientes):
+    # Se vuelve a invalidar al confirmar la transaccion por si otra peticion guardo en el cache los datos anteriores
+    ids_pacientes = list(ids_pacientes)
+
+    def invalidar():
+        for id_paciente in ids_pacientes:
+            invalidar_expediente(id_paciente)
+
+    invalidar()
+    transaction.on_commit(invalidar)
+
+
+@receiver(post_save, sender=Paciente)
+@receiver(post_delete, sender=Paciente)
+def invalidar_expediente_paciente(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidar_expedientes([instance.id])
+
+
+@receiver(post_save, sender=Toxicomania)
+@receiver(post_delete, sender=Toxicomania)
+@receiver(post_save, sender=Ant_Patologicos)
+@receiver(post_delete, sender=Ant_Patologicos)
+@receiver(post_save, sender=Ant_quirurjicos)
+@receiver(post_delete, sender=Ant_quirurjicos)
+@receiver(post_save, sender=Ant_transfusionales)
+@receiver(post_delete, sender=Ant_transfusionales)
+@receiver(post_save, sender=Alergias)
+@receiver(post_delete, sender=Alergias)
+@receiver(post_save, sender=Vacunacion)
+@receiver(post_delete, sender=Vacunacion)
+def invalidar_expediente_antecedente(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidar_expedientes([instance.id_paciente_id])
+
+
+@receiver(post_save, sender=Usuario)
+def invalidar_expediente_usuario(sender, instance, raw=False, **kwargs):
+    if not raw and instance.tipo == "P":
+        invalidar_expedientes(Paciente.objects.filter(id_usuario=instance.id).values_list("id", flat=True))
+
+
+@receiver(post_save, sender=User)
+def invalidar_expediente_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Iniciar sesion solo actualiza last_login, que no se muestra en el expediente
+    if raw or (update_fields and set(update_fields) <= {"last_login"}):
+        return
+    invalidar_expedientes(Paciente.objects.filter(id_usuario__id_usuario=instance.id).values_list("id", flat=True))
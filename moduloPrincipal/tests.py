@@ -1,7 +1,74 @@
 import json
+import tempfile
+from datetime import date, time, timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-from django.test import Client, TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+
+from moduloPrincipal.models import (Alergias, Ant_Patologicos, Cita, Diagnostico, Especialidades, Especialista, ExcepcionHorario,
+                                    Exploracion_fisica, HorarioLiberado, ListaEspera, OcupacionDia, Paciente, Solicitudes,
+                                    Tratamiento, Usuario, Vacunacion)
+from moduloPrincipal.utils import excepciones, ocupacion
+from moduloPrincipal.utils.actor import resolver_actor
+from moduloPrincipal.utils.demanda import curvas_de_demanda
+from moduloPrincipal.utils.disponibilidad import horarios_libres, primeros_libres
+from moduloPrincipal.utils.exportar import COLUMNAS_PACIENTES
+from moduloPrincipal.utils.expediente import cargar_expediente, contexto_expediente, expediente_de
+from moduloPrincipal.utils.historial import ORDEN_HISTORIAL, consulta_a_json, consultas_del_paciente
+from moduloPrincipal.utils.lista_espera import aceptar_oferta, procesar_pendientes
+from moduloPrincipal.utils.paginacion import pagina_keyset
+from moduloPrincipal.utils.metricas import (calcular_edad, calcular_fgm, calcular_imc, edad_en_bd, edades, fgms, imcs,
+                                           metricas_de_pacientes, rango_de_nacimiento)
+from moduloPrincipal.utils.horario import (HorarioInvalido, compilar_horario, horario_por_dia, horas_por_dia, tiene_horario,
+                                          turnos_por_dia)
+from moduloPrincipal.utils.reservas import ReservaError, dar_de_baja_fuera_de_horario, reservar_cita, reservar_serie
+from moduloPrincipal.views.viewAdmin import Pacientes_Admin
+from moduloPrincipal.views.viewEspecialista import Buscar_pacientes, ListarCitas_Especialista
+from moduloPrincipal.views.viewPacientes import Especialistas
+
+
+HORARIO_POR_DEFECTO = (
+    "8:00-13:00, 14:00-17:00;8:00-13:00, 14:00-17:00;8:00-13:00, 14:00-17:00;"
+    "8:00-13:00, 14:00-17:00;8:00-13:00, 14:00-17:00;8:00-13:00;"
+)
+
+
+def horarios_libres_de(especialista, fecha):
+    return horarios_libres(especialista, fecha, fecha)[fecha.isoformat()]
+
+
+class DatosCitasMixin:
+    """Crea un especialista y un paciente con solicitud aceptada."""
+
+    def crear_especialista(self, username="especialista", horario=HORARIO_POR_DEFECTO, especialidad=None):
+        user = User.objects.create_user(username, username + "@correo.com", "password")
+        usuario = Usuario.objects.create(id_usuario=user, fecha_nacimiento=date(1980, 1, 1), foto="", tipo="E")
+        if especialidad is None:
+            especialidad = Especialidades.objects.create(nombre="Nutricion", descripcion="Nutricion")
+        especialista = Especialista.objects.create(id_usuario=usuario, id_especialidad=especialidad,
+                                                   cedula="12345678", info_ad="", horario=horario, estatus="1")
+        return especialista
+
+    def crear_paciente(self, username="paciente", fecha_nacimiento=date(1990, 5, 1)):
+        user = User.objects.create_user(username, username + "@correo.com", "password")
+        usuario = Usuario.objects.create(id_usuario=user, fecha_nacimiento=fecha_nacimiento, foto="", tipo="P")
+        return Paciente.objects.create(id_usuario=usuario, peso=70, talla=1.70, estado_civil="S", estilo_vida="A",
+                                       estatus="1")
+
+    def siguiente_dia(self, weekday):
+        """Primer dia a partir de manana que cae en el dia de la semana indicado (0 = lunes)."""
+        dia = timezone.localdate() + timedelta(days=1)
+        while dia.weekday() != weekday:
+            dia += timedelta(days=1)
+        return dia
 
 
 class PerfilNutricionalAPITests(TestCase):
@@ -64,3 +131,1000 @@ class PerfilNutricionalAPITests(TestCase):
         self.assertIn("model_probabilities", data)
         self.assertGreater(data["model_probabilities"]["alto"], 0.9)
         self.assertIn("model_metadata", data)
+
+
+class HorarioCompiladoTests(DatosCitasMixin, TestCase):
+    def test_compilar_horario_por_defecto(self):
+        compilado = compilar_horario(
+            "8:00-13:00, 14:00-17:00;8:00-13:00, 14:00-17:00;8:00-13:00, 14:00-17:00;"
+            "8:00-13:00, 14:00-17:00;8:00-13:00, 14:00-17:00;8:00-13:00;"
+        )
+        self.assertEqual(len(compilado), 7)
+        self.assertEqual(compilado[0], [[480, 780], [840, 1020]])
+        self.assertEqual(compilado[5], [[480, 780]])
+        self.assertEqual(compilado[6], [])
+
+    def test_compilar_horario_vacio_o_mal_formado(self):
+        self.assertFalse(tiene_horario(compilar_horario(";;;;;;;")))
+        for texto in ("8:xx-13:00;;;;;;", ";;10:00-9:00;;;;", "8:00-13:75;;;;;;", "8:00-13:00, 12:00-14:00;;;;;;"):
+            with self.assertRaises(HorarioInvalido):
+                compilar_horario(texto)
+        # Los horarios ya guardados se compilan ignorando los turnos mal formados
+        self.assertEqual(compilar_horario("8:xx-13:00;;10:00-9:00;;;;", estricto=False)[0], [])
+        self.assertEqual(compilar_horario("8:xx-13:00;;10:00-9:00;;;;", estricto=False)[2], [])
+
+    def test_horas_y_turnos_por_dia(self):
+        compilado = compilar_horario("9:00-10:30;;;;;;")
+        self.assertEqual(horas_por_dia(compilado)[0], ["09:00", "09:30", "10:00"])
+        self.assertEqual(horario_por_dia(compilado)["Lunes"], "9:00-10:30")
+        turnos = turnos_por_dia(compilado)["Lunes"]
+        self.assertEqual((turnos["hora2_turno1"], turnos["min2_turno1"]), ("10", "30"))
+        self.assertEqual(turnos["hora1_turno2"], "")
+
+    def test_ventanas_usan_el_horario_compilado(self):
+        especialista = self.crear_especialista(horario="8:00-13:00, 14:00-17:00;8:00-13:00;;;;;")
+        paciente = self.crear_paciente()
+        Solicitudes.objects.create(id_especialista=especialista, id_paciente=paciente, estatus="A")
+        client = Client()
+        client.login(username="paciente", password="password")
+        response = client.get(reverse("agendarcita", args=[especialista.id]))
+        self.assertEqual(response.context["horas_lunes"][:3], ["08:00", "08:30", "09:00"])
+        self.assertEqual(response.context["horario"]["Martes"], "8:00-13:00")
+        self.assertEqual(response.context["horario"]["Miercoles"], "")
+
+        client.login(username="especialista", password="password")
+        response = client.get(reverse("horario_especialista"))
+        self.assertEqual(response.context["datos"]["horario"]["Lunes"]["hora2_turno2"], "17")
+        # Guardar el horario vuelve a compilarlo
+        client.post(reverse("horario_especialista"), {"_put": "1", "martes-hora1": "9", "martes-min1": "00",
+                                                      "martes-hora1-2": "12", "martes-min1-2": "30"})
+        especialista.refresh_from_db()
+        self.assertEqual(especialista.horario, ";9:00-12:30;;;;;")
+        self.assertEqual(especialista.horario_compilado, [[], [[540, 750]], [], [], [], [], []])
+
+
+class DisponibilidadTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        self.paciente = self.crear_paciente()
+        self.client = Client()
+        self.client.login(username="paciente", password="password")
+        self.url = reverse("disponibilidad", args=[self.especialista.id])
+
+    def test_excluye_citas_activas(self):
+        lunes = self.siguiente_dia(0)
+        Cita.objects.create(id_especialista=self.especialista, id_paciente=self.paciente, fecha=lunes,
+                            hora=time(8, 0), motivo="", estatus="C")
+        Cita.objects.create(id_especialista=self.especialista, id_paciente=self.paciente, fecha=lunes,
+                            hora=time(8, 30), motivo="", estatus="B")
+        response = self.client.get(self.url, {"desde": lunes.isoformat(), "hasta": lunes.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        libres = response.json()["disponibilidad"][lunes.isoformat()]
+        self.assertNotIn("08:00", libres)
+        self.assertIn("08:30", libres)
+        self.assertEqual(len(libres), 15)
+
+    def test_omite_dias_sin_horario(self):
+        domingo = self.siguiente_dia(6)
+        response = self.client.get(self.url, {"desde": domingo.isoformat(), "hasta": domingo.isoformat()})
+        self.assertEqual(response.json()["disponibilidad"], {})
+
+    def test_rango_invalido(self):
+        response = self.client.get(self.url, {"desde": "2030-01-10", "hasta": "2030-01-01"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {"desde": "10/01/2030"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["Descripcion"], "Las fechas deben tener el formato AAAA-MM-DD")
+
+
+
+class PrimerosDisponiblesTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.primero = self.crear_especialista("primero", horario="8:00-9:00;;;;;;")
+        self.segundo = self.crear_especialista("segundo", horario="8:30-10:00;;;;;;",
+                                               especialidad=self.primero.id_especialidad)
+        self.paciente = self.crear_paciente()
+        self.lunes = self.siguiente_dia(0)
+
+    def test_intercala_especialistas_en_orden(self):
+        reservar_cita(self.primero.id, self.paciente.id, self.lunes, "08:00")
+        # Se usa el horario ya compilado al guardar el especialista
+        with mock.patch("moduloPrincipal.utils.horario.compilar_horario") as compilar:
+            slots = primeros_libres([self.primero, self.segundo], self.lunes, self.lunes + timedelta(days=6), 3)
+        compilar.assert_not_called()
+        self.assertEqual(slots, [(self.lunes, 510, self.primero.id), (self.lunes, 510, self.segundo.id),
+                                 (self.lunes, 540, self.segundo.id)])
+
+    def test_endpoint(self):
+        self.segundo.estatus = "0"
+        self.segundo.save()
+        client = Client()
+        client.login(username="paciente", password="password")
+        url = reverse("primeros_disponibles", args=[self.primero.id_especialidad_id])
+        response = client.get(url, {"desde": self.lunes.isoformat(), "n": 3})
+        self.assertEqual(response.status_code, 200)
+        horarios = response.json()["horarios"]
+        self.assertEqual([h["hora"] for h in horarios], ["08:00", "08:30", "08:00"])
+        self.assertEqual({h["id_especialista"] for h in horarios}, {self.primero.id})
+        self.assertEqual(horarios[2]["fecha"], (self.lunes + timedelta(days=7)).isoformat())
+        self.assertEqual(client.get(reverse("primeros_disponibles", args=[999])).status_code, 404)
+
+class ReservaCitaTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        self.paciente = self.crear_paciente()
+        self.lunes = self.siguiente_dia(0)
+
+    def test_reserva_y_choques(self):
+        cita = reservar_cita(self.especialista.id, self.paciente.id, self.lunes.isoformat(), "08:00", "Control")
+        self.assertEqual(cita.estatus, "P")
+
+        otro = self.crear_paciente("otro")
+        with self.assertRaisesMessage(ReservaError, "no estan disponibles"):
+            reservar_cita(self.especialista.id, otro.id, self.lunes, "08:00")
+        with self.assertRaisesMessage(ReservaError, "mismo especialista"):
+            reservar_cita(self.especialista.id, self.paciente.id, self.lunes, "09:00")
+
+        segundo = self.crear_especialista("segundo", especialidad=self.especialista.id_especialidad)
+        with self.assertRaisesMessage(ReservaError, "misma hora"):
+            reservar_cita(segundo.id, self.paciente.id, self.lunes, "08:00")
+
+    def test_cita_dada_de_baja_libera_el_horario(self):
+        cita = reservar_cita(self.especialista.id, self.paciente.id, self.lunes, "08:00")
+        cita.estatus = "B"
+        cita.save()
+        reservar_cita(self.especialista.id, self.crear_paciente("otro").id, self.lunes, "08:00")
+        self.assertEqual(Cita.objects.filter(fecha=self.lunes, hora=time(8, 0)).count(), 2)
+
+    def test_fuera_de_horario(self):
+        with self.assertRaisesMessage(ReservaError, "fuera del horario"):
+            reservar_cita(self.especialista.id, self.paciente.id, self.lunes, "13:30")
+        with self.assertRaisesMessage(ReservaError, "fuera del horario"):
+            reservar_cita(self.especialista.id, self.paciente.id, self.siguiente_dia(6), "08:00")
+
+    def test_restriccion_unica_en_bd(self):
+        Cita.objects.create(id_especialista=self.especialista, id_paciente=self.paciente, fecha=self.lunes,
+                            hora=time(8, 0), motivo="", estatus="P")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cita.objects.create(id_especialista=self.especialista, id_paciente=self.crear_paciente("otro"),
+                                fecha=self.lunes, hora=time(8, 0), motivo="", estatus="C")
+
+    def test_agendar_post(self):
+        client = Client()
+        client.login(username="paciente", password="password")
+        otro = self.crear_paciente("otro")
+        datos = {"fecha": self.lunes.isoformat(), "hora": "10:00", "id_paciente": str(otro.id),
+                 "id_especialista": str(self.especialista.id), "motivo": "Consulta"}
+        # Sin una solicitud aceptada no se puede agendar con el especialista
+        response = client.post("/agendarcita/", data=json.dumps(datos), content_type="application/json")
+        self.assertEqual(response.status_code, 403)
+        Solicitudes.objects.create(id_especialista=self.especialista, id_paciente=self.paciente, estatus="A")
+        self.assertEqual(client.post("/agendarcita/", data="x", content_type="application/json").status_code, 400)
+        self.assertEqual(client.post("/agendarcita/", data=json.dumps({"fecha": datos["fecha"]}),
+                                     content_type="application/json").status_code, 400)
+
+        # El id_paciente del JSON se ignora, la cita es del paciente que inicio sesion
+        response = client.post("/agendarcita/", data=json.dumps(datos), content_type="application/json")
+        self.assertEqual(response.json(), {"Success": True})
+        self.assertEqual(Cita.objects.get().id_paciente_id, self.paciente.id)
+        response = client.post("/agendarcita/", data=json.dumps(datos), content_type="application/json")
+        self.assertTrue(response.json()["Error"])
+
+
+
+
+
+class ExcepcionHorarioTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        self.paciente = self.crear_paciente()
+        self.lunes = self.siguiente_dia(0)
+        self.client = Client()
+        self.client.login(username="especialista", password="password")
+        self.url = reverse("excepciones_horario")
+
+    def test_bloqueos(self):
+        bloqueos = excepciones.Bloqueos.unir(
+            excepciones.intervalos_de_excepcion(self.lunes, self.lunes + timedelta(days=1), time(8, 0), time(9, 0))
+            + excepciones.intervalos_de_excepcion(self.lunes + timedelta(days=5), self.lunes + timedelta(days=6)))
+        self.assertEqual(len(bloqueos.inicios), 3)
+        self.assertTrue(bloqueos.bloqueado(self.lunes, 8 * 60 + 30))
+        self.assertFalse(bloqueos.bloqueado(self.lunes, 9 * 60))
+        self.assertTrue(bloqueos.bloqueado(self.lunes, 7 * 60 + 45))
+        self.assertEqual(bloqueos.mascara(self.lunes), (1 << 16) | (1 << 17))
+        self.assertEqual(bloqueos.mascara(self.lunes + timedelta(days=6)), (1 << 48) - 1)
+        self.assertEqual(bloqueos.mascara(self.lunes + timedelta(days=2)), 0)
+
+    def test_agregar_consultar_y_eliminar(self):
+        reservar_cita(self.especialista.id, self.paciente.id, self.lunes, "08:00")
+        response = self.client.post(self.url, json.dumps({"fecha_inicio": self.lunes.isoformat(), "hora_inicio": "08:00",
+                                                          "hora_fin": "10:00", "motivo": "Congreso"}),
+                                    content_type="application/json")
+        self.assertEqual(response.json()["citas_afectadas"], 1)
+        id_excepcion = response.json()["id"]
+
+        libres = horarios_libres_de(self.especialista, self.lunes)
+        self.assertEqual(libres[0], "10:00")
+        with self.assertRaisesMessage(ReservaError, "no atiende"):
+            reservar_cita(self.especialista.id, self.crear_paciente("otro").id, self.lunes, "09:30")
+        self.assertEqual(len(self.client.get(self.url).json()["excepciones"]), 1)
+
+        self.assertEqual(self.client.delete(reverse("excepciones_horario", args=[id_excepcion])).status_code, 200)
+        self.assertEqual(horarios_libres_de(self.especialista, self.lunes)[0], "08:30")
+
+    def test_cita_que_termina_dentro_del_rango(self):
+        # La cita de 08:30 a 09:00 choca con un bloqueo de 08:45 a 10:00, la de 08:00 no
+        reservar_cita(self.especialista.id, self.paciente.id, self.lunes, "08:30")
+        reservar_cita(self.especialista.id, self.crear_paciente("otro").id, self.lunes, "08:00")
+        response = self.client.post(self.url, json.dumps({"fecha_inicio": self.lunes.isoformat(), "hora_inicio": "08:45",
+                                                          "hora_fin": "10:00"}),
+                                    content_type="application/json")
+        self.assertEqual(response.json()["citas_afectadas"], 1)
+
+    def test_rango_invalido(self):
+        response = self.client.post(self.url, json.dumps({"fecha_inicio": self.lunes.isoformat(), "hora_inicio": "10:00"}),
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExcepcionHorario.objects.exists())
+
+
+class SerieCitasTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        self.paciente = self.crear_paciente()
+        self.lunes = self.siguiente_dia(0)
+        # La tercera cita de la serie choca con otra cita ya agendada
+        reservar_cita(self.especialista.id, self.crear_paciente("otro").id, self.lunes + timedelta(days=28), "08:00")
+
+    def test_todo_o_nada(self):
+        creadas, conflictos = reservar_serie(self.especialista.id, self.paciente.id, self.lunes, "08:00", 14, 4)
+        self.assertEqual(creadas, [])
+        self.assertEqual(conflictos, [{"fecha": (self.lunes + timedelta(days=28)).isoformat(),
+                                       "descripcion": "Ese dia y hora no estan disponibles para cita"}])
+        self.assertEqual(Cita.objects.filter(id_paciente=self.paciente).count(), 0)
+
+    def test_parcial_y_mapas(self):
+        creadas, conflictos = reservar_serie(self.especialista.id, self.paciente.id, self.lunes, "08:00", 14, 4,
+                                             parcial=True)
+        self.assertEqual([cita.fecha for cita in creadas],
+                         [self.lunes, self.lunes + timedelta(days=14), self.lunes + timedelta(days=42)])
+        self.assertEqual(len(conflictos), 1)
+        for cita in creadas:
+            self.assertEqual(ocupacion.mapa_de_dia(self.especialista.id, cita.fecha), 1 << 16)
+        with self.assertRaisesMessage(ReservaError, "mismo especialista"):
+            reservar_cita(self.especialista.id, self.paciente.id, self.lunes + timedelta(days=14), "09:00")
+
+    def test_no_agenda_en_el_pasado(self):
+        with self.assertRaisesMessage(ReservaError, "a partir de manana"):
+            reservar_serie(self.especialista.id, self.paciente.id, timezone.localdate(), "08:00", 7, 2)
+
+    def test_endpoint(self):
+        client = Client()
+        client.login(username="paciente", password="password")
+        datos = {"id_especialista": self.especialista.id, "id_paciente": self.paciente.id, "fecha": self.lunes.isoformat(),
+                 "hora": "09:00", "cada_dias": 7, "repeticiones": 3, "motivo": "Seguimiento"}
+        url = reverse("agendarserie")
+        # Sin una solicitud aceptada no se puede agendar con el especialista
+        self.assertEqual(client.post(url, json.dumps(datos), content_type="application/json").status_code, 403)
+        Solicitudes.objects.create(id_especialista=self.especialista, id_paciente=self.paciente, estatus="A")
+        self.assertEqual(client.post(url, json.dumps([datos]), content_type="application/json").status_code, 400)
+
+        # El id_paciente del JSON se ignora, la serie es del paciente que inicio sesion
+        otro = Paciente.objects.get(id_usuario__id_usuario__username="otro")
+        response = client.post(url, json.dumps(dict(datos, id_paciente=otro.id)), content_type="application/json")
+        self.assertTrue(response.json()["Success"])
+        self.assertEqual(len(response.json()["citas"]), 3)
+        self.assertEqual(Cita.objects.filter(id_paciente=self.paciente).count(), 3)
+
+class ListaEsperaTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        self.lunes = self.siguiente_dia(0)
+        self.cita = reservar_cita(self.especialista.id, self.crear_paciente().id, self.lunes, "08:00")
+        self.primero = self.crear_paciente("primero")
+        self.segundo = self.crear_paciente("segundo")
+        for paciente in (self.primero, self.segundo):
+            ListaEspera.objects.create(id_especialista=self.especialista, id_paciente=paciente,
+                                       fecha_desde=self.lunes, fecha_hasta=self.lunes + timedelta(days=7))
+
+    def test_cancelar_ofrece_al_siguiente(self):
+        # El primero en la lista ya tiene otra cita a esa hora, el horario se le ofrece al segundo
+        reservar_cita(self.crear_especialista("otro").id, self.primero.id, self.lunes, "08:00")
+        self.cita.estatus = "B"
+        self.cita.save()
+        self.assertEqual(HorarioLiberado.objects.count(), 1)
+        self.assertEqual(ocupacion.mapa_de_dia(self.especialista.id, self.lunes), 0)
+
+        self.assertEqual(procesar_pendientes(), (1, 1))
+        espera = ListaEspera.objects.get(id_paciente=self.segundo)
+        self.assertEqual((espera.estatus, espera.oferta_fecha, espera.oferta_hora), ("O", self.lunes, time(8, 0)))
+        self.assertLessEqual(espera.oferta_vence, timezone.now() + timedelta(hours=12))
+        self.assertEqual(ListaEspera.objects.get(id_paciente=self.primero).estatus, "E")
+        self.assertFalse(HorarioLiberado.objects.exists())
+        # Hasta que el paciente acepta no se agenda nada
+        self.assertEqual(ocupacion.mapa_de_dia(self.especialista.id, self.lunes), 0)
+
+        cita = aceptar_oferta(espera.id, self.segundo.id)
+        espera.refresh_from_db()
+        self.assertEqual((espera.estatus, espera.id_cita), ("A", cita))
+        self.assertEqual((cita.fecha, cita.hora, cita.estatus), (self.lunes, time(8, 0), "P"))
+        self.assertEqual(ocupacion.mapa_de_dia(self.especialista.id, self.lunes), 1 << 16)
+        with self.assertRaisesMessage(ReservaError, "oferta pendiente"):
+            aceptar_oferta(espera.id, self.segundo.id)
+
+    def test_oferta_vencida_pasa_al_siguiente(self):
+        self.cita.estatus = "B"
+        self.cita.save()
+        procesar_pendientes()
+        ListaEspera.objects.filter(id_paciente=self.primero).update(oferta_vence=timezone.now() - timedelta(minutes=1))
+        with self.assertRaisesMessage(ReservaError, "ya vencio"):
+            aceptar_oferta(ListaEspera.objects.get(id_paciente=self.primero).id, self.primero.id)
+
+        self.assertEqual(procesar_pendientes(), (1, 1))
+        self.assertEqual(ListaEspera.objects.get(id_paciente=self.primero).estatus, "V")
+        segundo = ListaEspera.objects.get(id_paciente=self.segundo)
+        self.assertEqual((segundo.estatus, segundo.oferta_hora), ("O", time(8, 0)))
+
+    def test_oferta_ya_tomada(self):
+        # Otro paciente agenda el horario antes de que se acepte la oferta
+        self.cita.estatus = "B"
+        self.cita.save()
+        procesar_pendientes()
+        reservar_cita(self.especialista.id, self.crear_paciente("rapido").id, self.lunes, "08:00")
+        espera = ListaEspera.objects.get(id_paciente=self.primero)
+        with self.assertRaisesMessage(ReservaError, "no estan disponibles"):
+            aceptar_oferta(espera.id, self.primero.id)
+        espera.refresh_from_db()
+        self.assertEqual((espera.estatus, espera.oferta_fecha), ("E", None))
+        self.assertFalse(HorarioLiberado.objects.exists())
+
+    def test_horario_ya_ocupado(self):
+        self.cita.estatus = "B"
+        self.cita.save()
+        reservar_cita(self.especialista.id, self.crear_paciente("rapido").id, self.lunes, "08:00")
+        call_command("procesar_lista_espera", stdout=StringIO())
+        self.assertFalse(ListaEspera.objects.exclude(estatus="E").exists())
+        self.assertFalse(HorarioLiberado.objects.exists())
+
+    def test_endpoint(self):
+        otro = self.crear_especialista("otro")
+        Solicitudes.objects.create(id_especialista=otro, id_paciente=self.primero, estatus="A")
+        client = Client()
+        client.login(username="primero", password="password")
+        datos = {"id_especialista": otro.id, "desde": self.lunes.isoformat(),
+                 "hasta": (self.lunes + timedelta(days=3)).isoformat()}
+        response = client.post(reverse("lista_espera"), json.dumps(datos), content_type="application/json")
+        self.assertTrue(response.json()["Success"])
+        response = client.post(reverse("lista_espera"), json.dumps(datos), content_type="application/json")
+        self.assertTrue(response.json()["Error"])
+
+        self.assertEqual(len(client.get(reverse("lista_espera")).json()["lista_espera"]), 2)
+        espera = ListaEspera.objects.get(id_paciente=self.primero, id_especialista=otro)
+        self.assertTrue(client.delete(reverse("lista_espera", args=[espera.id])).json()["Success"])
+        self.assertEqual(ListaEspera.objects.get(id=espera.id).estatus, "C")
+
+        # La oferta se ve en la lista de espera y se acepta con su propio endpoint
+        self.cita.estatus = "B"
+        self.cita.save()
+        procesar_pendientes()
+        espera = ListaEspera.objects.get(id_paciente=self.primero, id_especialista=self.especialista)
+        oferta = next(registro["oferta"] for registro in client.get(reverse("lista_espera")).json()["lista_espera"]
+                      if registro["id"] == espera.id)
+        self.assertEqual((oferta["fecha"], oferta["hora"]), (self.lunes.isoformat(), "08:00"))
+        response = client.post(reverse("aceptar_oferta", args=[espera.id]))
+        self.assertTrue(response.json()["Success"])
+        self.assertEqual(Cita.objects.get(id=response.json()["id_cita"]).id_paciente, self.primero)
+
+class CambioHorarioTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        self.paciente = self.crear_paciente()
+        self.lunes = self.siguiente_dia(0)
+        self.sabado = self.siguiente_dia(5)
+
+    def test_da_de_baja_las_citas_fuera_del_nuevo_horario(self):
+        queda = reservar_cita(self.especialista.id, self.paciente.id, self.lunes, "08:00")
+        tarde = reservar_cita(self.especialista.id, self.paciente.id, self.lunes + timedelta(days=1), "15:00")
+        sabado = reservar_cita(self.especialista.id, self.paciente.id, self.sabado, "09:00")
+        atendida = reservar_cita(self.especialista.id, self.paciente.id, self.lunes + timedelta(days=2), "16:00")
+        atendida.estatus = "A"
+        atendida.save()
+
+        client = Client()
+        client.login(username="especialista", password="password")
+        datos = {"_put": "1"}
+        for dia in ("lunes", "martes", "miercoles", "jueves", "viernes"):
+            datos.update({dia + "-hora1": "8", dia + "-min1": "00", dia + "-hora1-2": "13", dia + "-min1-2": "00"})
+        # Primero se avisa cuantas citas quedarian fuera del horario sin guardar nada
+        response = client.post(reverse("horario_especialista"), datos)
+        self.assertEqual(response.context["citas_afectadas"], 2)
+        self.assertEqual(Cita.objects.filter(estatus="B").count(), 0)
+        response = client.post(reverse("horario_especialista"), dict(datos, confirmar="1"))
+        self.assertRedirects(response, reverse("horario_especialista") + "?citas_canceladas=2")
+
+        estatus = dict(Cita.objects.values_list("id", "estatus"))
+        self.assertEqual(estatus, {queda.id: "P", tarde.id: "B", sabado.id: "B", atendida.id: "A"})
+        self.assertEqual(ocupacion.mapa_de_dia(self.especialista.id, self.sabado), 0)
+        self.assertEqual(ocupacion.mapa_de_dia(self.especialista.id, self.lunes), 1 << 16)
+
+    def test_turno_invalido_no_guarda_nada(self):
+        cita = reservar_cita(self.especialista.id, self.paciente.id, self.lunes, "08:00")
+        client = Client()
+        client.login(username="especialista", password="password")
+        datos = {"_put": "1", "lunes-hora1": "13", "lunes-min1": "00", "lunes-hora1-2": "8", "lunes-min1-2": "00",
+                 "confirmar": "1"}
+        response = client.post(reverse("horario_especialista"), datos)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Lunes", response.json()["Descripcion"])
+        self.assertEqual(Cita.objects.get(id=cita.id).estatus, "P")
+        self.especialista.refresh_from_db()
+        self.assertEqual(self.especialista.horario, HORARIO_POR_DEFECTO)
+
+    def test_sin_cambios_no_toca_citas(self):
+        reservar_cita(self.especialista.id, self.paciente.id, self.lunes, "16:30")
+        self.assertEqual(dar_de_baja_fuera_de_horario(self.especialista), 0)
+
+class OcupacionDiaTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        self.paciente = self.crear_paciente()
+        self.lunes = self.siguiente_dia(0)
+
+    def mapa(self, fecha=None):
+        return ocupacion.mapa_de_dia(self.especialista.id, fecha or self.lunes)
+
+    def test_sigue_los_cambios_de_la_cita(self):
+        cita = reservar_cita(self.especialista.id, self.paciente.id, self.lunes, "08:30")
+        self.assertEqual(self.mapa(), 1 << 17)
+
+        cita.hora = time(9, 0)
+        cita.save()
+        self.assertEqual(self.mapa(), 1 << 18)
+
+        cita.estatus = "B"
+        cita.save()
+        self.assertEqual(self.mapa(), 0)
+
+        cita.estatus = "P"
+        cita.fecha = self.lunes + timedelta(days=7)
+        cita.save()
+        self.assertEqual(self.mapa(cita.fecha), 1 << 18)
+
+        Cita.objects.get(id=cita.id).delete()
+        self.assertEqual(self.mapa(cita.fecha), 0)
+
+    def test_cita_cargada_sin_campos_de_ocupacion(self):
+        cita = reservar_cita(self.especialista.id, self.paciente.id, self.lunes, "08:00")
+        parcial = Cita.objects.only("id", "estatus").get(id=cita.id)
+        parcial.estatus = "B"
+        parcial.save()
+        self.assertEqual(self.mapa(), 0)
+
+    def test_reconstruir(self):
+        reservar_cita(self.especialista.id, self.paciente.id, self.lunes, "08:00")
+        OcupacionDia.objects.all().delete()
+        self.assertEqual(ocupacion.reconstruir(self.especialista.id), 1)
+        self.assertEqual(self.mapa(), 1 << 16)
+
+
+class AgendaEspecialistaTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        self.paciente = self.crear_paciente()
+        self.lunes = self.siguiente_dia(0)
+        for dia, hora in ((0, "08:00"), (0, "08:30"), (2, "09:00"), (7, "08:00")):
+            reservar_cita(self.especialista.id, self.crear_paciente("p%d%s" % (dia, hora[:2] + hora[3:])).id,
+                          self.lunes + timedelta(days=dia), hora)
+        self.client = Client()
+        self.client.login(username="especialista", password="password")
+        self.url = reverse("listarcitasespecialista")
+
+    def test_todas_por_defecto(self):
+        Cita.objects.filter(hora=time(9, 0)).update(estatus="C")
+        response = self.client.get(self.url)
+        # Sin vista se listan todas las citas, tambien las pendientes de semanas siguientes
+        self.assertEqual([c.fecha for c in response.context["pendientes"]],
+                         [self.lunes, self.lunes, self.lunes + timedelta(days=7)])
+        self.assertEqual([c.hora for c in response.context["confirmadas"]], [time(9, 0)])
+        with mock.patch.object(ListarCitas_Especialista, "CITAS_POR_PAGINA", 2):
+            primera = self.client.get(self.url)
+            segunda = self.client.get(self.url, {"despues_pendientes": primera.context["siguiente_pendientes"],
+                                                 "lista": "pendientes"})
+        self.assertEqual([c.fecha for c in segunda.context["pendientes"]], [self.lunes + timedelta(days=7)])
+
+    def test_semana_y_dia(self):
+        response = self.client.get(self.url, {"fecha": (self.lunes + timedelta(days=3)).isoformat(), "vista": "semana"})
+        self.assertEqual(len(response.context["pendientes"]), 3)
+        self.assertEqual(response.context["desde"], self.lunes)
+        response = self.client.get(self.url, {"fecha": self.lunes.isoformat(), "vista": "dia"})
+        self.assertEqual([c.hora for c in response.context["pendientes"]], [time(8, 0), time(8, 30)])
+
+    def test_paginacion_por_llave(self):
+        citas = Cita.objects.filter(fecha__lt=self.lunes + timedelta(days=7))
+        primera, cursor = pagina_keyset(citas, ("fecha", "hora", "id"), None, 2)
+        segunda, fin = pagina_keyset(citas, ("fecha", "hora", "id"), cursor, 2)
+        self.assertEqual([c.hora for c in primera + segunda], [time(8, 0), time(8, 30), time(9, 0)])
+        self.assertIsNone(fin)
+        self.assertEqual(len(pagina_keyset(citas, ("fecha", "hora", "id"), "basura", 10)[0]), 3)
+
+    def test_calendario_ics(self):
+        Cita.objects.filter(hora=time(8, 30)).update(estatus="C", motivo="Dolor, fiebre; revision")
+        url = self.client.get(self.url).context["url_calendario"]
+        calendario = Client()
+        response = calendario.get(url)
+        contenido = b"".join(response.streaming_content).decode()
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        self.assertEqual(contenido.count("BEGIN:VEVENT"), 1)
+        self.assertIn("DESCRIPTION:Dolor\\, fiebre\\; revision\r\n", contenido)
+
+        self.assertEqual(calendario.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        cita = Cita.objects.get(hora=time(9, 0))
+        cita.estatus = "C"
+        cita.save()
+        response = calendario.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(b"".join(response.streaming_content).decode().count("BEGIN:VEVENT"), 2)
+        self.assertEqual(calendario.get(url.replace(".ics", "x.ics")).status_code, 404)
+
+
+class DemandaCitasTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        paciente = self.crear_paciente()
+        # Dos semanas completas que terminan el domingo pasado
+        self.hasta = date.today() - timedelta(days=date.today().weekday() + 1)
+        self.desde = self.hasta - timedelta(days=13)
+        for dias, hora, estatus in ((0, time(8, 0), "A"), (7, time(8, 0), "P"), (7, time(8, 15), "A"),
+                                    (0, time(9, 0), "B"), (2, time(10, 0), "A")):
+            Cita.objects.create(id_especialista=self.especialista, id_paciente=paciente, motivo="",
+                                fecha=self.desde + timedelta(days=dias), hora=hora, estatus=estatus)
+
+    def test_curvas(self):
+        curvas = curvas_de_demanda(self.desde, self.hasta)
+        self.assertEqual(curvas["especialistas"].tolist(), [self.especialista.id])
+        # Lunes a las 8:00 (bloque 16): 3 citas en 2 lunes, 1 sin atender
+        self.assertEqual(curvas["citas"][0, 0, 16], 3)
+        self.assertAlmostEqual(curvas["citas_por_semana"][0, 0, 16], 1.5)
+        self.assertAlmostEqual(curvas["tasa_inasistencia"][0, 0, 16], 1 / 3)
+        self.assertAlmostEqual(curvas["tasa_cancelacion"][0, 0, 18], 1.0)
+        self.assertAlmostEqual(curvas["citas_por_semana"][0, 2, 20], 0.5)
+        self.assertEqual(curvas["citas"].sum(), 4)
+
+    def test_endpoint_admin(self):
+        User.objects.create_user("admin", "admin@correo.com", "password", is_staff=True)
+        client = Client()
+        client.login(username="admin", password="password")
+        response = client.get(reverse("demanda_citas_admin"),
+                              {"desde": self.desde.isoformat(), "hasta": self.hasta.isoformat()})
+        dias = response.json()["especialistas"][0]["dias"]
+        self.assertEqual(sorted(dias), ["Lunes", "Miercoles"])
+        self.assertEqual(dias["Lunes"][0]["hora"], "08:00")
+        self.assertEqual(client.get(reverse("demanda_citas_admin"), {"desde": "ayer"}).status_code, 400)
+
+class ExpedienteTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.paciente = self.crear_paciente(fecha_nacimiento=date(1990, 1, 1))
+        for nombre in ("Polen", "Penicilina"):
+            Alergias.objects.create(id_paciente=self.paciente, nombre=nombre)
+        Vacunacion.objects.create(id_paciente=self.paciente, nombre="Influenza", dosis=1, año=2024)
+
+    def test_consultas_fijas(self):
+        with self.assertNumQueries(7):
+            paciente = cargar_expediente(id=self.paciente.id)
+            contexto = contexto_expediente(paciente, nombres_consulta=True)
+            self.assertEqual(paciente.id_usuario.id_usuario.username, "paciente")
+        self.assertEqual([alergia.nombre for alergia in contexto["AP_al"]], ["Polen", "Penicilina"])
+        self.assertEqual(len(contexto["AP_vac"]), 1)
+        self.assertEqual(contexto["imc"], 24.22)
+        self.assertEqual(contexto["fgm"], 0)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                                           "LOCATION": tempfile.mkdtemp()}})
+    def test_cache_e_invalidacion(self):
+        self.assertEqual(len(expediente_de(self.paciente.id).lista_alergias), 2)
+        with mock.patch("moduloPrincipal.utils.expediente.cargar_expediente") as cargar, \
+                mock.patch("moduloPrincipal.utils.expediente.cache.get", wraps=cache.get) as leer:
+            paciente = expediente_de(self.paciente.id)
+        cargar.assert_not_called()
+        leer.assert_called_once_with("expediente:%d" % self.paciente.id)
+        self.assertEqual([alergia.nombre for alergia in paciente.lista_alergias], ["Polen", "Penicilina"])
+        self.assertEqual(paciente.id_usuario.fecha_nacimiento, date(1990, 1, 1))
+        # La contrasena del usuario no se guarda en el cache
+        self.assertIn("password", paciente.id_usuario.id_usuario.get_deferred_fields())
+
+        alergia = Alergias.objects.create(id_paciente=self.paciente, nombre="Latex")
+        self.assertEqual(len(expediente_de(self.paciente.id).lista_alergias), 3)
+        Alergias.objects.filter(id=alergia.id).delete()
+        self.assertEqual(len(expediente_de(self.paciente.id).lista_alergias), 2)
+
+        user = self.paciente.id_usuario.id_usuario
+        user.first_name = "Ana"
+        user.save()
+        self.assertEqual(expediente_de(self.paciente.id).id_usuario.id_usuario.first_name, "Ana")
+        client = Client()
+        client.login(username="paciente", password="password")
+        client.post(reverse("guardar_ficha"), {"sexo": "F", "estado_civil": "C", "estilo_vida": "A",
+                                               "peso": "60", "talla": "1.60"})
+        self.assertEqual(expediente_de(self.paciente.id).peso, 60)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_sin_cache_por_proceso(self):
+        # Con un cache por proceso los cambios hechos en otro proceso no invalidarian el expediente
+        expediente_de(self.paciente.id)
+        with mock.patch("moduloPrincipal.utils.expediente.cargar_expediente") as cargar:
+            expediente_de(self.paciente.id)
+        cargar.assert_called_once_with(id=self.paciente.id)
+
+    def test_perfil_clinico(self):
+        client = Client()
+        client.login(username="paciente", password="password")
+        response = client.get(reverse("perfil_clinico"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["alergias"]), 2)
+        self.assertEqual(response.context["edad"], calcular_edad(date(1990, 1, 1)))
+
+class MetricasTests(DatosCitasMixin, TestCase):
+    HOY = date(2024, 3, 1)
+    NACIMIENTOS = [date(2000, 3, 1), date(2000, 3, 2), date(2000, 2, 29), date(1990, 12, 31), date(2023, 3, 1)]
+
+    def test_cohorte_igual_que_por_paciente(self):
+        pesos = [70, 0, 55.5, 90, 4]
+        tallas = [1.75, 1.6, 0, 1.8, 0.5]
+        creatininas = [1.1, 0.9, 0, 1.3, 0.4]
+        generos = ["M", "F", "F", "M", "F"]
+        edad = edades(self.NACIMIENTOS, self.HOY)
+        self.assertEqual(edad.tolist(), [calcular_edad(fecha, self.HOY) for fecha in self.NACIMIENTOS])
+        self.assertEqual(edad.tolist(), [24, 23, 24, 33, 1])
+        self.assertEqual(imcs(pesos, tallas).tolist(), [calcular_imc(p, t) for p, t in zip(pesos, tallas)])
+        esperados = [calcular_fgm(e, p, c, g) for e, p, c, g in zip(edad.tolist(), pesos, creatininas, generos)]
+        for calculado, esperado in zip(fgms(edad, pesos, creatininas, generos).tolist(), esperados):
+            self.assertAlmostEqual(calculado, esperado)
+
+    def test_pacientes_y_edad_en_bd(self):
+        for indice, nacimiento in enumerate(self.NACIMIENTOS):
+            self.crear_paciente("paciente%d" % indice, fecha_nacimiento=nacimiento)
+        metricas = metricas_de_pacientes(Paciente.objects.order_by("id"), self.HOY)
+        self.assertEqual(metricas["edad"].tolist(), [24, 23, 24, 33, 1])
+        self.assertEqual(metricas["imc"].tolist(), [24.22] * 5)
+        en_bd = Paciente.objects.annotate(edad=edad_en_bd(hoy=self.HOY)).order_by("id").values_list("edad", flat=True)
+        self.assertEqual(list(en_bd), [24, 23, 24, 33, 1])
+        self.assertEqual(metricas_de_pacientes(Paciente.objects.none())["imc"].size, 0)
+
+    def test_grafica_imc(self):
+        especialista = self.crear_especialista()
+        for indice in range(3):
+            Solicitudes.objects.create(id_especialista=especialista, id_paciente=self.crear_paciente("p%d" % indice),
+                                       estatus="A")
+        response = Client().get(reverse("grafica_exp", args=[especialista.id, 5]))
+        self.assertContains(response, "data:image/png;base64")
+
+class DepurarCitasTests(DatosCitasMixin, TestCase):
+    def test_cierra_las_vencidas(self):
+        especialista = self.crear_especialista()
+        paciente = self.crear_paciente()
+        hoy = timezone.localdate()
+        citas = {}
+        for hora, (nombre, dias, estatus) in enumerate((("pendiente", -1, "P"), ("confirmada_reciente", -3, "C"),
+                                                        ("confirmada_vieja", -10, "C"), ("atendida", -10, "A"),
+                                                        ("futura", 1, "P")), start=8):
+            citas[nombre] = Cita.objects.create(id_especialista=especialista, id_paciente=paciente, motivo="",
+                                                fecha=hoy + timedelta(days=dias), hora=time(hora, 0), estatus=estatus)
+
+        salida = StringIO()
+        call_command("depurar_citas", dry_run=True, stdout=salida)
+        self.assertIn("1 pendientes y 1 confirmadas", salida.getvalue())
+        self.assertFalse(Cita.objects.filter(estatus="B").exists())
+
+        call_command("depurar_citas", lote=1, stdout=StringIO())
+        estatus = dict(Cita.objects.values_list("id", "estatus"))
+        self.assertEqual([estatus[citas[nombre].id] for nombre in ("pendiente", "confirmada_reciente",
+                                                                    "confirmada_vieja", "atendida", "futura")],
+                         ["B", "C", "N", "A", "P"])
+        self.assertFalse(OcupacionDia.objects.filter(fecha__lt=hoy).exists())
+        # La confirmada que no se atendio sigue contando como inasistencia y no como cancelacion
+        curvas = curvas_de_demanda(hoy - timedelta(days=10), hoy - timedelta(days=10), [especialista.id])
+        self.assertEqual(curvas["tasa_cancelacion"].sum(), 0)
+        self.assertEqual(curvas["tasa_inasistencia"].max(), 1)
+        self.assertTrue(OcupacionDia.objects.filter(fecha__gt=hoy).exists())
+
+class BenchmarkCitasTests(TestCase):
+    def test_muestra_planes_y_no_deja_datos(self):
+        salida = StringIO()
+        call_command('benchmark_citas', citas=200, especialistas=4, pacientes=20, repeticiones=1, stdout=salida)
+        self.assertIn('Agendar.post (citas del paciente)', salida.getvalue())
+        self.assertIn('cita_especialista_fecha', salida.getvalue())
+        self.assertFalse(Cita.objects.exists())
+        self.assertFalse(User.objects.filter(username__startswith='benchmark_').exists())
+
+
+class ActorTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        self.paciente = self.crear_paciente()
+
+    def test_ids_en_sesion(self):
+        request = SimpleNamespace(user=self.especialista.id_usuario.id_usuario, session={})
+        with self.assertNumQueries(2):
+            actor = resolver_actor(request)
+            self.assertEqual(actor.especialidad.nombre, "Nutricion")
+        self.assertEqual((actor.tipo, actor.especialista.id), ("E", self.especialista.id))
+        with self.assertNumQueries(1):
+            actor = resolver_actor(request)
+            self.assertEqual(actor.especialidad.nombre, "Nutricion")
+            self.assertEqual(actor.usuario.id_usuario.username, "especialista")
+
+        # Los ids de otro usuario en la sesion no se usan
+        request.user = self.paciente.id_usuario.id_usuario
+        actor = resolver_actor(request)
+        self.assertEqual((actor.tipo, actor.paciente.id, actor.especialista), ("P", self.paciente.id, None))
+        self.assertEqual(request.session["actor"]["paciente"], self.paciente.id)
+
+    def test_admin_y_vistas(self):
+        admin = User.objects.create_user("admin", "admin@correo.com", "password", is_staff=True)
+        request = SimpleNamespace(user=admin, session={})
+        self.assertEqual(resolver_actor(request).tipo, "admin")
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolver_actor(request).usuario)
+
+        # A un usuario sin Usuario se le vuelve a buscar hasta que lo tenga
+        user = User.objects.create_user("nuevo", "nuevo@correo.com", "password")
+        request = SimpleNamespace(user=user, session={})
+        self.assertIsNone(resolver_actor(request).usuario)
+        self.assertNotIn("actor", request.session)
+        usuario = Usuario.objects.create(id_usuario=user, fecha_nacimiento=date(1990, 5, 1), foto="", tipo="P")
+        paciente = Paciente.objects.create(id_usuario=usuario, peso=70, talla=1.70, estado_civil="S", estilo_vida="A",
+                                           estatus="1")
+        self.assertEqual(resolver_actor(request).paciente.id, paciente.id)
+
+        client = Client()
+        client.post(reverse("login"), {"username": "paciente", "contra": "password"})
+        self.assertEqual(client.session["actor"]["paciente"], self.paciente.id)
+        response = client.get(reverse("perfil_clinico"))
+        self.assertEqual(response.context["paciente"].id, self.paciente.id)
+
+
+class HistorialConsultasTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        self.paciente = self.crear_paciente()
+        Solicitudes.objects.create(id_especialista=self.especialista, id_paciente=self.paciente, estatus="A")
+        hoy = timezone.localdate()
+        for dias in (30, 20, 10):
+            cita = Cita.objects.create(id_especialista=self.especialista, id_paciente=self.paciente,
+                                       fecha=hoy - timedelta(days=dias), hora=time(9, 0), motivo="Control",
+                                       estatus="A")
+            Diagnostico.objects.create(id_cita=cita, descripcion="Diagnostico %d" % dias)
+            Tratamiento.objects.bulk_create([Tratamiento(id_cita=cita, tipo=0, descripcion="Metformina"),
+                                             Tratamiento(id_cita=cita, tipo=1, descripcion="Caminar")])
+            Exploracion_fisica.objects.create(id_cita=cita, peso=70, talla=1.7, glucosa=90, TA_sistolica="120",
+                                              TA_diastolica="80", frecuencia_cardiaca=70,
+                                              frecuencia_respiratoria=16, temperatura=36.5, descripcion="")
+
+    def test_consultas_fijas(self):
+        with self.assertNumQueries(5):
+            consultas = [consulta_a_json(cita) for cita in consultas_del_paciente(self.paciente.id)]
+        self.assertEqual(len(consultas), 3)
+        self.assertEqual(consultas[0]["tratamiento_farmacologico"], ["Metformina"])
+        self.assertEqual(consultas[0]["exploraciones"][0]["glucosa"], 90)
+        self.assertEqual(pagina_keyset(consultas_del_paciente(self.paciente.id), ORDEN_HISTORIAL, None, 3)[0][0]
+                         .diagnosticos.all()[0].descripcion, "Diagnostico 10")
+
+    def test_acceso_y_paginas(self):
+        url = reverse("historial_consultas", args=[self.paciente.id])
+        client = Client()
+        client.login(username="paciente", password="password")
+        primera = pagina_keyset(consultas_del_paciente(self.paciente.id), ORDEN_HISTORIAL, None, 2)
+        response = client.get(url, {"despues": primera[1]})
+        self.assertEqual([c["diagnosticos"][0]["descripcion"] for c in response.json()["consultas"]],
+                         ["Diagnostico 30"])
+
+        otro = self.crear_especialista("otro", especialidad=self.especialista.id_especialidad)
+        client.login(username="otro", password="password")
+        self.assertEqual(client.get(url).status_code, 403)
+        Solicitudes.objects.create(id_especialista=otro, id_paciente=self.paciente, estatus="A")
+        self.assertEqual(client.get(url).json()["consultas"], [])
+
+
+class ConsultaMedicaTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        self.paciente = self.crear_paciente()
+        self.cita = Cita.objects.create(id_especialista=self.especialista, id_paciente=self.paciente,
+                                        fecha=timezone.localdate(), hora=time(9, 0), motivo="Control", estatus="C")
+        self.client = Client()
+        self.client.login(username="especialista", password="password")
+        self.url = reverse("ConsultaMedica", args=[self.cita.id])
+        self.datos = {"glucosa": "90", "tasis": "120", "tadis": "80", "frec": "70", "frer": "16", "temp": "36.5",
+                      "desc": "", "imc": "24.2", "creatinina": "1.1", "filtracion_glomerular": "80",
+                      "diagnostico": "Sano", "tratamiento_far": "Ninguno", "tratamiento_nfar": "Caminar",
+                      "desaVerduras": "1", "reco": "Agua"}
+
+    def test_registro_completo_una_vez(self):
+        self.client.post(self.url, self.datos)
+        self.cita.refresh_from_db()
+        self.assertEqual(self.cita.estatus, "A")
+        self.assertEqual(expediente_de(self.paciente.id).creatinina, 1.1)
+        consulta = consulta_a_json(consultas_del_paciente(self.paciente.id)[0])
+        self.assertEqual((consulta["tratamiento_farmacologico"], consulta["tratamiento_no_farmacologico"]),
+                         (["Ninguno"], ["Caminar"]))
+        self.assertEqual(consulta["menus"][0]["menu"]["recomendacion"], "Agua")
+
+        # Enviar otra vez el formulario no duplica la consulta
+        self.client.post(self.url, self.datos)
+        self.assertEqual(Tratamiento.objects.filter(id_cita=self.cita).count(), 2)
+
+    def test_error_no_deja_consulta_a_medias(self):
+        self.datos["frec"] = "no es numero"
+        with self.assertRaises(ValueError):
+            self.client.post(self.url, self.datos)
+        self.assertFalse(Exploracion_fisica.objects.filter(id_cita=self.cita).exists())
+        self.assertEqual(Cita.objects.get(id=self.cita.id).estatus, "C")
+
+
+class RegistrarAntecedentesTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.paciente = self.crear_paciente()
+        self.client = Client()
+        self.client.login(username="paciente", password="password")
+        self.url = reverse("registrar_antecedentes")
+
+    def post(self, datos):
+        return self.client.post(self.url, json.dumps(datos), content_type="application/json")
+
+    def test_captura_en_lote(self):
+        self.assertEqual(len(expediente_de(self.paciente.id).lista_alergias), 0)
+        response = self.post({"alergias": [{"nombre": "Polen"}, {"nombre": "Latex"}],
+                              "vacunas": [{"nombre": "Influenza", "dosis": "2", "año": 2024}],
+                              "toxicomanias": [{"nombre": "Tabaco", "cantidad": "5", "frecuencia": "diaria",
+                                                "tiempo": "1.5"}]})
+        self.assertEqual(response.json(), {"Success": True})
+        paciente = expediente_de(self.paciente.id)
+        self.assertEqual([alergia.nombre for alergia in paciente.lista_alergias], ["Polen", "Latex"])
+        self.assertEqual((paciente.lista_vacunas[0].dosis, paciente.lista_toxicomanias[0].tiempo), (2, 1.5))
+
+    def test_nada_se_guarda_si_hay_errores(self):
+        response = self.post({"alergias": [{"nombre": "Polen"}], "ant_quirurjicos": [{"tipo": "Apendice"}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("tiempo", response.json()["Errores"]["ant_quirurjicos"]["0"])
+        self.assertFalse(Alergias.objects.exists())
+
+        especialista = self.crear_especialista()
+        self.client.login(username="especialista", password="password")
+        datos = {"id_paciente": self.paciente.id, "ant_patologicos": [{"patologia": "Diabetes"}]}
+        self.assertEqual(self.post(datos).status_code, 403)
+        Solicitudes.objects.create(id_especialista=especialista, id_paciente=self.paciente, estatus="A")
+        self.assertEqual(self.post(datos).json(), {"Success": True})
+
+
+class BuscarPacientesTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.especialista = self.crear_especialista()
+        hoy = timezone.localdate()
+        self.pacientes = {}
+        for username, anios, estatus in (("ana", 20, "A"), ("beto", 35, "A"), ("carla", 50, "P")):
+            paciente = self.crear_paciente(username, fecha_nacimiento=hoy.replace(year=hoy.year - anios))
+            Solicitudes.objects.create(id_especialista=self.especialista, id_paciente=paciente, estatus=estatus)
+            self.pacientes[username] = paciente
+        Ant_Patologicos.objects.create(id_paciente=self.pacientes["beto"], patologia="Diabetes tipo 2")
+        self.client = Client()
+        self.client.login(username="especialista", password="password")
+        self.url = reverse("buscar_pacientes")
+
+    def buscar(self, **filtros):
+        return [p["username"] for p in self.client.get(self.url, filtros).json()["pacientes"]]
+
+    def test_filtros(self):
+        self.assertEqual(self.buscar(), ["ana", "beto", "carla"])
+        self.assertEqual(self.buscar(q="BET"), ["beto"])
+        self.assertEqual(self.buscar(edad_min=20, edad_max=35), ["ana", "beto"])
+        self.assertEqual(self.buscar(edad_max=19), [])
+        self.assertEqual(self.buscar(estatus="P"), ["carla"])
+        self.assertEqual(self.buscar(patologia="diabetes"), ["beto"])
+        self.assertEqual(self.client.get(self.url, {"edad_min": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"edad_max": 3000}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"edad_min": -1}).status_code, 400)
+        self.assertEqual(self.buscar(edad_min=0, edad_max=150), ["ana", "beto", "carla"])
+
+    def test_edad_en_sql_y_paginas(self):
+        self.client.get(self.url)
+        with mock.patch.object(Buscar_pacientes, "PACIENTES_POR_PAGINA", 2):
+            with self.assertNumQueries(4):  # sesion, usuario, especialista (ids ya en la sesion) y la pagina
+                primera = self.client.get(self.url).json()
+            segunda = self.client.get(self.url, {"despues": primera["siguiente_pagina"]}).json()
+        self.assertEqual([p["edad"] for p in primera["pacientes"]], [20, 35])
+        self.assertEqual(([p["username"] for p in segunda["pacientes"]], segunda["siguiente_pagina"]), (["carla"], None))
+
+    def test_listado_con_consultas_fijas(self):
+        url = reverse("listarpacientes")
+        self.client.get(url)
+        with self.assertNumQueries(5):  # sesion, usuario, especialista, pendientes y confirmados
+            response = self.client.get(url)
+        self.assertEqual([(s.id_paciente.id_usuario.id_usuario.username, s.edad) for s in response.context["confirmados"]],
+                         [("ana", 20), ("beto", 35)])
+        self.assertEqual([s.id_paciente_id for s in response.context["pendientes"]], [self.pacientes["carla"].id])
+        for numero in range(5):
+            paciente = self.crear_paciente("extra%d" % numero)
+            Solicitudes.objects.create(id_especialista=self.especialista, id_paciente=paciente, estatus="A")
+        with self.assertNumQueries(5):
+            self.client.get(url)
+        response = self.client.get(url, {"q": "beto", "lista": "confirmados"})
+        self.assertEqual(len(response.context["confirmados"]), 1)
+        self.assertContains(response, "Edad: 35")
+
+    def test_rango_de_nacimiento(self):
+        hoy = date(2024, 2, 29)
+        for nacimiento in (date(2023, 2, 28), date(2023, 3, 1), date(2020, 2, 29), date(2000, 3, 1)):
+            for edad in range(0, 26):
+                desde, hasta = rango_de_nacimiento(edad, edad, hoy)
+                self.assertEqual(calcular_edad(nacimiento, hoy) == edad, desde <= nacimiento <= hasta)
+
+
+class PacientesAdminTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        User.objects.create_user("admin", "admin@correo.com", "password", is_staff=True)
+        hoy = timezone.localdate()
+        self.pacientes = [self.crear_paciente("p%d" % numero, fecha_nacimiento=hoy.replace(year=hoy.year - 30 - numero))
+                          for numero in range(3)]
+        Paciente.objects.filter(id=self.pacientes[2].id).update(estatus="0")
+        self.client = Client()
+        self.client.login(username="admin", password="password")
+        self.url = reverse("listarpacientes_admin")
+
+    def test_paginas_por_id(self):
+        self.client.get(self.url)
+        with mock.patch.object(Pacientes_Admin, "PACIENTES_POR_PAGINA", 1):
+            with self.assertNumQueries(4):  # sesion, usuario y una consulta por lista
+                response = self.client.get(self.url)
+            self.assertEqual([(p.id, p.edad) for p in response.context["activos"]], [(self.pacientes[0].id, 30)])
+            response = self.client.get(self.url, {"despues_activos": response.context["siguiente_activos"]})
+        self.assertEqual([p.id for p in response.context["activos"]], [self.pacientes[1].id])
+        self.assertEqual([p.id for p in response.context["baja"]], [self.pacientes[2].id])
+
+    def test_exportar_csv(self):
+        response = self.client.get(self.url, {"formato": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        lineas = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lineas[0], ",".join(COLUMNAS_PACIENTES))
+        self.assertEqual(len(lineas), 4)
+        self.assertTrue(lineas[1].startswith("%d,,,p0,p0@correo.com," % self.pacientes[0].id))
+        self.assertTrue(lineas[1].endswith(",30,M,70.0,1.7,24.22,1"))
+        response = self.client.get(self.url, {"formato": "csv", "estatus": "0"})
+        self.assertEqual(len(b"".join(response.streaming_content).decode().splitlines()), 2)
+
+
+class DirectorioEspecialistasTests(DatosCitasMixin, TestCase):
+    def setUp(self):
+        self.nutricion = Especialidades.objects.create(nombre="Nutricion", descripcion="Nutricion")
+        self.cardiologia = Especialidades.objects.create(nombre="Cardiologia", descripcion="Cardiologia")
+        self.paciente = self.crear_paciente()
+        self.especialistas = {username: self.crear_especialista(username, especialidad=especialidad)
+                              for username, especialidad in (("aceptado", self.nutricion), ("pendiente", self.nutricion),
+                                                             ("libre", self.nutricion), ("cardio", self.cardiologia),
+                                                             ("baja", self.nutricion))}
+        Especialista.objects.filter(id=self.especialistas["baja"].id).update(estatus="0")
+        Solicitudes.objects.create(id_especialista=self.especialistas["aceptado"], id_paciente=self.paciente, estatus="A")
+        Solicitudes.objects.create(id_especialista=self.especialistas["pendiente"], id_paciente=self.paciente, estatus="P")
+        self.client = Client()
+        self.client.login(username="paciente", password="password")
+        self.url = reverse("listarespecialistas")
+
+    def nombres(self, especialistas):
+        return [especialista.id_usuario.id_usuario.username for especialista in especialistas]
+
+    def test_solicitados_en_la_misma_consulta(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(6):  # sesion, usuario, paciente, especialidades, disponibles y confirmados
+            response = self.client.get(self.url)
+        self.assertEqual(self.nombres(response.context["disponibles"]), ["libre", "cardio"])
+        self.assertEqual(self.nombres(response.context["confirmados"]), ["aceptado"])
+        response = self.client.get(self.url, {"especialidad": self.cardiologia.id})
+        self.assertEqual(self.nombres(response.context["disponibles"]), ["cardio"])
+        self.assertEqual(list(response.context["confirmados"]), [])
+
+    def test_paginas(self):
+        with mock.patch.object(Especialistas, "ESPECIALISTAS_POR_PAGINA", 1):
+            primera = self.client.get(self.url)
+            segunda = self.client.get(self.url, {"despues_disponibles": primera.context["siguiente_disponibles"],
+                                                 "lista": "disponibles"})
+        self.assertEqual(self.nombres(primera.context["disponibles"]), ["libre"])
+        self.assertEqual(self.nombres(segunda.context["disponibles"]), ["cardio"])
+        self.assertIsNone(segunda.context["siguiente_disponibles"])
@@ -5,6 +5,7 @@ from moduloPrincipal import *
 from moduloPrincipal.views.viewGeneral import *
 from moduloPrincipal.views.viewAdmin import *
 from moduloPrincipal.views.viewAlergia import *
+from moduloPrincipal.views.viewAntecedentes import *
 from moduloPrincipal.views.viewAnt_Quirurjico import *
 from moduloPrincipal.views.viewAnt_Transfusional import *
 from moduloPrincipal.views.viewEspecialista import *
@@ -71,8 +72,14 @@ urlpatterns = [
     path('listarcitas/paciente/<int:id>', ListarCitas_Paciente.as_view(), name='listarcitaspaciente'),
     path('configuracion/paciente/<str:message1>', Configuracion_paciente.as_view(), name='configuracion_paciente'),
     path('cambiar/username/paciente', CambiarUsernamePaciente.as_view(), name='cambiar_username_paciente'),
+    path('agendarcita/serie', Agendar_serie.as_view(), name='agendarserie'),
     path('agendarcita/<int:id>', Agendar.as_view(), name='agendarcita'),
     path('agendarcita/', Agendar.as_view(), name='agendarcita'),
+    path('agendarcita/<int:id>/disponibilidad', Disponibilidad.as_view(), name='disponibilidad'),
+    path('especialidades/<int:id>/disponibilidad', Primeros_disponibles.as_view(), name='primeros_disponibles'),
+    path('listaespera', Lista_espera.as_view(), name='lista_espera'),
+    path('listaespera/<int:id>', Lista_espera.as_view(), name='lista_espera'),
+    path('listaespera/<int:id>/aceptar', Aceptar_oferta.as_view(), name='aceptar_oferta'),
     path('listarespecialistas/<int:id>', Especialistas.as_view(), name='listarespecialistas'),
     path('listarespecialistas/', Especialistas.as_view(), name='listarespecialistas'),
     path('informacion/especialista/<int:id_especialista>/<int:id_usuario>/<int:id_user>',
@@ -86,6 +93,7 @@ urlpatterns = [
     path('registrar_ant_transfusional', Registrar_Ant_Transfusional.as_view(), name='registrar_ant_transfusional'),
     path('registrar_alergia', Registrar_Alergia.as_view(), name='registrar_alergia'),
     path('registrar_vacuna', Registrar_Vacuna.as_view(), name='registrar_vacuna'),
+    path('registrar_antecedentes', Registrar_Antecedentes.as_view(), name='registrar_antecedentes'),
     path('guardar_ficha', Guardar_Ficha.as_view(), name="guardar_ficha"),
 
     # Urls de Especialista
@@ -95,13 +103,18 @@ urlpatterns = [
     path('cambiar/username/especialista', CambiarUsernameEspecialista.as_view(), name='cambiar_username_especialista'),
     path('listarcitas/especialista/', ListarCitas_Especialista.as_view(), name='listarcitasespecialista'),
     path('listarcitas/especialista/<int:id>', ListarCitas_Especialista.as_view(), name='listarcitasespecialista'),
+    path('especialista/calendario/<str:token>.ics', Calendario_especialista.as_view(), name='calendario_especialista'),
+    path('listarpacientes/buscar', Buscar_pacientes.as_view(), name='buscar_pacientes'),
     path('listarpacientes/<int:id>', Pacientes.as_view(), name='listarpacientes'),
     path('listarpacientes/', Pacientes.as_view(), name='listarpacientes'),
     path('consulta_medica/<int:id>', ConsultaMedica.as_view(), name='ConsultaMedica'),
     path('visualizar_consulta/<int:id>', VisualizarConsulta.as_view(), name='VisualizarConsulta'),
+    path('historial/paciente/<int:id_paciente>', Historial_consultas.as_view(), name='historial_consultas'),
     path('informacion/paciente/full/<int:id>', Informacion_Paciente_full.as_view(), name='info_paciente_full'),
     path('informacion/paciente/<int:id_paciente>', Informacion_paciente.as_view(), name='info_paciente'),
     path('especialista/horario', Horario.as_view(), name='horario_especialista'),
+    path('especialista/horario/excepciones', Excepciones_horario.as_view(), name='excepciones_horario'),
+    path('especialista/horario/excepciones/<int:id>', Excepciones_horario.as_view(), name='excepciones_horario'),
     path('grafica/<int:id>/<int:tipo>', grafica, name='grafica'),
     path('graficas/', Graficas.as_view(), name='graficas'),
     path('grafica2/<int:id>/<int:tipo>', grafica_EXP, name='grafica_exp'),
@@ -129,6 +142,7 @@ urlpatterns = [
     path('informacion/especialista/admin/<int:id_especialista>/<int:id_usuario>/<int:id_user>',
          Informacion_especialista_admin.as_view(), name='info_especialista_admin'),
     path('listarespecialidades/admin', Listar_especialidades_admin.as_view(), name='especialidades_admin'),
+    path('demandacitas/admin', Demanda_citas_admin.as_view(), name='demanda_citas_admin'),
      re_path(
         r"^jefa/(?P<path>.*\.(js|css|png|jpg|jpeg|gif|svg|ico|map))$",
         static_serve,
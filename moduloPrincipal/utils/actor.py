@@ -0,0 +1,143 @@
+"""
+Usuario de la peticion con su perfil de paciente o de especialista.
+
+Casi todas las vistas empiezan buscando el ``Usuario`` de ``request.user`` y
+despues su ``Paciente`` o ``Especialista`` (y la especialidad de este).
+``UserTypeMiddleware`` deja en ``request.actor`` un objeto perezoso que hace
+esa busqueda la primera vez que una vista lo usa y la reutiliza el resto de
+la peticion.
+
+La primera vez que se resuelve en una sesion se guardan en ella los ids
+(``usuario``, ``paciente``/``especialista``), y desde entonces el perfil se
+obtiene con una sola consulta con ``select_related``. En la sesion solo se
+guardan ids, que no cambian; los datos (estatus, horario, especialidad) se
+leen de la base de datos en cada peticion. Que un usuario no tenga ``Usuario``
+solo se guarda para los administradores, que nunca lo tienen; para cualquier
+otro se vuelve a buscar en la siguiente peticion (por ejemplo, si el registro
+se completo despues de iniciar sesion).
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from moduloPrincipal.models import Especialidades, Especialista, Paciente, Usuario
+
+LLAVE_SESION = "actor"
+
+
+class Actor:
+    """
+    ``user`` de Django con su ``usuario``, ``paciente`` o ``especialista``.
+    Para administradores y visitantes sin sesion ``usuario`` es ``None``.
+    """
+
+    def __init__(self, user, usuario: Optional[Usuario] = None, paciente: Optional[Paciente] = None,
+                 especialista: Optional[Especialista] = None):
+        self.user = user
+        self.usuario = usuario
+        self.paciente = paciente
+        self.especialista = especialista
+
+    @property
+    def tipo(self) -> Optional[str]:
+        """``'admin'``, ``'E'``, ``'P'`` o ``None`` si no ha iniciado sesion."""
+        if not self.user.is_authenticated:
+            return None
+        if self.user.is_staff:
+            return "admin"
+        return self.usuario.tipo if self.usuario else None
+
+    @property
+    def especialidad(self) -> Optional[Especialidades]:
+        return self.especialista.id_especialidad if self.especialista else None
+
+    @property
+    def es_paciente(self) -> bool:
+        return self.paciente is not None
+
+    @property
+    def es_especialista(self) -> bool:
+        return self.especialista is not None
+
+
+def _perfil(user, usuario: Usuario, ids: dict) -> Actor:
+    # Se reutiliza el User que ya cargo AuthenticationMiddleware
+    usuario.id_usuario = user
+    if usuario.tipo == "E":
+        especialista = (Especialista.objects.select_related("id_especialidad")
+                        .filter(**({"id": ids["especialista"]} if "especialista" in ids else {"id_usuario_id": usuario.id}))
+                        .first())
+        if especialista:
+            especialista.id_usuario = usuario
+            ids["especialista"] = especialista.id
+        return Actor(user, usuario, especialista=especialista)
+    paciente = (Paciente.objects
+                .filter(**({"id": ids["paciente"]} if "paciente" in ids else {"id_usuario_id": usuario.id}))
+                .first())
+    if paciente:
+        paciente.id_usuario = usuario
+        ids["paciente"] = paciente.id
+    return Actor(user, usuario, paciente=paciente)
+
+
+def _desde_sesion(user, ids: dict) -> Optional[Actor]:
+    """Actor con los ids guardados en la sesion (una consulta), o ``None`` si ya no existen."""
+    if "especialista" in ids:
+        especialista = (Especialista.objects.select_related("id_usuario", "id_especialidad")
+                        .filter(id=ids["especialista"], id_usuario_id=ids["usuario"]).first())
+        if especialista:
+            especialista.id_usuario.id_usuario = user
+            return Actor(user, especialista.id_usuario, especialista=especialista)
+    elif "paciente" in ids:
+        paciente = (Paciente.objects.select_related("id_usuario")
+                    .filter(id=ids["paciente"], id_usuario_id=ids["usuario"]).first())
+        if paciente:
+            paciente.id_usuario.id_usuario = user
+            return Actor(user, paciente.id_usuario, paciente=paciente)
+    return None
+
+
+def resolver_actor(request) -> Actor:
+    user = request.user
+    if not user.is_authenticated:
+        return Actor(user)
+
+    ids = request.session.get(LLAVE_SESION)
+    if ids and ids.get("user") == user.id:
+        if ids.get("usuario") is None:
+            if user.is_staff:
+                return Actor(user)
+        else:
+            actor = _desde_sesion(user, ids)
+            if actor:
+                return actor
+
+    usuario = Usuario.objects.filter(id_usuario_id=user.id).first()
+    if usuario is None:
+        if user.is_staff:
+            request.session[LLAVE_SESION] = {"user": user.id, "usuario": None}
+        else:
+            request.session.pop(LLAVE_SESION, None)
+        return Actor(user)
+    ids = {"user": user.id, "usuario": usuario.id}
+    actor = _perfil(user, usuario, ids)
+    request.session[LLAVE_SESION] = ids
+    return actor
+
+
+def guardar_actor(request, usuario: Optional[Usuario], paciente: Optional[Paciente] = None,
+                  especialista: Optional[Especialista] = None):
+    """Guarda en la sesion los ids que ya se tienen al iniciar sesion para no volver a buscarlos."""
+    ids = {"user": request.user.id, "usuario": usuario.id if usuario else None}
+    if paciente:
+        ids["paciente"] = paciente.id
+    if especialista:
+        ids["especialista"] = especialista.id
+    request.session[LLAVE_SESION] = ids
+
+
+__all__ = [
+    "Actor",
+    "resolver_actor",
+    "guardar_actor",
+]
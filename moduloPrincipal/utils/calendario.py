@@ -0,0 +1,122 @@
+"""
+Calendario (iCalendar, RFC 5545) con las citas confirmadas de un especialista.
+
+Las aplicaciones de calendario no inician sesion, asi que el calendario se
+comparte con una url que lleva el id del especialista firmado con
+``django.core.signing``. Esas aplicaciones vuelven a pedir el calendario cada
+cierto tiempo; la version (``ETag``/``Last-Modified``) se calcula con el
+ultimo cambio de las citas del especialista, de modo que mientras no cambie
+nada se responde 304 sin volver a generar el archivo.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from datetime import timezone as zona
+from typing import Iterable, Iterator, Optional, Tuple
+
+from django.core import signing
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from moduloPrincipal.models import Cita
+from moduloPrincipal.utils.horario import INTERVALO_CITA
+
+SAL_CALENDARIO = "moduloPrincipal.calendario_especialista"
+# Dias hacia atras que se incluyen en el calendario
+DIAS_HISTORIAL = 30
+# Octetos maximos por linea antes de partirla
+LARGO_LINEA = 75
+
+
+def token_calendario(id_especialista: int) -> str:
+    return signing.Signer(salt=SAL_CALENDARIO).sign(str(id_especialista))
+
+
+def especialista_de_token(token: str) -> Optional[int]:
+    """Id del especialista del token, o ``None`` si la firma no es valida."""
+    try:
+        return int(signing.Signer(salt=SAL_CALENDARIO).unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def version_calendario(id_especialista: int) -> Tuple[Optional[datetime], int]:
+    """
+    ``(ultimo cambio, numero de citas)`` del especialista. El numero de citas
+    cambia aunque se borre una cita, que no deja fecha de modificacion.
+    """
+    resumen = Cita.objects.filter(id_especialista_id=id_especialista).aggregate(
+        ultima=Max("actualizada"), total=Count("id"))
+    return resumen["ultima"], resumen["total"]
+
+
+def citas_del_calendario(id_especialista: int):
+    desde = timezone.localdate() - timedelta(days=DIAS_HISTORIAL)
+    return (Cita.objects.filter(id_especialista_id=id_especialista, estatus="C", fecha__gte=desde)
+            .select_related("id_paciente__id_usuario__id_usuario")
+            .only("id", "fecha", "hora", "motivo", "actualizada",
+                  "id_paciente__id_usuario__id_usuario__first_name",
+                  "id_paciente__id_usuario__id_usuario__last_name")
+            .order_by("fecha", "hora", "id"))
+
+
+def escapar(texto: str) -> str:
+    return (texto.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n").replace("\r", "\\n"))
+
+
+def linea(contenido: str) -> str:
+    """Linea terminada en CRLF, partida en lineas de maximo 75 octetos sin cortar caracteres UTF-8."""
+    partes = []
+    actual, largo = [], 0
+    for caracter in contenido:
+        octetos = len(caracter.encode("utf-8"))
+        # Las lineas de continuacion empiezan con un espacio
+        limite = LARGO_LINEA if not partes else LARGO_LINEA - 1
+        if largo + octetos > limite:
+            partes.append("".join(actual))
+            actual, largo = [], 0
+        actual.append(caracter)
+        largo += octetos
+    partes.append("".join(actual))
+    return "\r\n ".join(partes) + "\r\n"
+
+
+def fecha_utc(momento: datetime) -> str:
+    return momento.astimezone(zona.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def evento(cita: Cita, dominio: str) -> Iterator[str]:
+    inicio = timezone.make_aware(datetime.combine(cita.fecha, cita.hora))
+    usuario = cita.id_paciente.id_usuario.id_usuario
+    yield linea("BEGIN:VEVENT")
+    yield linea(f"UID:cita-{cita.id}@{dominio}")
+    yield linea("DTSTAMP:" + fecha_utc(cita.actualizada))
+    yield linea("DTSTART:" + fecha_utc(inicio))
+    yield linea("DTEND:" + fecha_utc(inicio + timedelta(minutes=INTERVALO_CITA)))
+    yield linea("SUMMARY:" + escapar(("Cita con " + usuario.first_name + " " + usuario.last_name).strip()))
+    if cita.motivo:
+        yield linea("DESCRIPTION:" + escapar(cita.motivo))
+    yield linea("STATUS:CONFIRMED")
+    yield linea("END:VEVENT")
+
+
+def generar_calendario(citas: Iterable[Cita], dominio: str) -> Iterator[str]:
+    """Lineas del calendario, una cita a la vez para poder enviarlo por partes."""
+    yield linea("BEGIN:VCALENDAR")
+    yield linea("VERSION:2.0")
+    yield linea("PRODID:-//moduloPrincipal//Citas//ES")
+    yield linea("CALSCALE:GREGORIAN")
+    yield linea("X-WR-CALNAME:Citas confirmadas")
+    for cita in citas:
+        yield "".join(evento(cita, dominio))
+    yield linea("END:VCALENDAR")
+
+
+__all__ = [
+    "token_calendario",
+    "especialista_de_token",
+    "version_calendario",
+    "citas_del_calendario",
+    "generar_calendario",
+]
@@ -0,0 +1,131 @@
+"""
+Demanda historica de citas por especialista, dia de la semana y horario.
+
+La base de datos agrupa las citas del rango por (especialista, dia de la
+semana, hora, minuto, estatus), asi que de la tabla de citas solo se leen
+unas cuantas filas con conteos. Con ellas se llena un arreglo de NumPy de
+forma ``(especialistas, 7, BLOQUES_POR_DIA, estatus)`` y todas las tasas se
+calculan sobre ese arreglo, sin recorrer citas en Python.
+
+Para cada bloque de ``INTERVALO_CITA`` minutos se obtiene:
+
+- ``citas_por_semana``: citas no canceladas (atendidas, confirmadas,
+  pendientes o no asistidas) entre el numero de veces que ese dia de la
+  semana aparece en el rango.
+- ``tasa_cancelacion``: citas dadas de baja entre todas las citas.
+- ``tasa_inasistencia``: citas que no se marcaron como atendidas entre las no
+  canceladas. Incluye las confirmadas que ``depurar_citas`` ya cerro como no
+  asistidas (``N``); las pendientes que nunca se aceptaron las da de baja y
+  cuentan como canceladas.
+"""
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from django.db.models import Count
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay, ExtractMinute
+
+from moduloPrincipal.models import Cita
+from moduloPrincipal.utils.horario import DIAS_SEMANA, INTERVALO_CITA, minutos_a_texto
+from moduloPrincipal.utils.ocupacion import BLOQUES_POR_DIA
+
+# Semanas de historial que se usan si no se indica otro rango
+SEMANAS_POR_DEFECTO = 12
+# Posicion de cada estatus en el ultimo eje del arreglo de conteos
+ESTATUS = ("P", "C", "A", "B", "N")
+INDICE_ESTATUS = {estatus: indice for indice, estatus in enumerate(ESTATUS)}
+NO_CANCELADAS = [INDICE_ESTATUS["P"], INDICE_ESTATUS["C"], INDICE_ESTATUS["A"], INDICE_ESTATUS["N"]]
+SIN_ATENDER = [INDICE_ESTATUS["P"], INDICE_ESTATUS["C"], INDICE_ESTATUS["N"]]
+
+
+def rango_por_defecto() -> tuple:
+    """Las ultimas ``SEMANAS_POR_DEFECTO`` semanas completas hasta ayer."""
+    hasta = date.today() - timedelta(days=1)
+    return hasta - timedelta(days=SEMANAS_POR_DEFECTO * 7 - 1), hasta
+
+
+def dias_de_semana_en_rango(desde: date, hasta: date) -> np.ndarray:
+    """Cuantas veces aparece cada dia de la semana (0 = lunes) en el rango, ambos inclusive."""
+    dias = (hasta - desde).days + 1
+    return np.bincount((np.arange(dias) + desde.weekday()) % 7, minlength=7)
+
+
+def conteos_de_citas(desde: date, hasta: date, especialistas: Optional[Iterable[int]] = None):
+    """
+    ``(ids de especialistas, conteos)`` donde ``conteos[e, dia, bloque, estatus]``
+    es el numero de citas del especialista ``ids[e]`` en ese dia de la semana,
+    bloque del dia y estatus (en el orden de ``ESTATUS``).
+    """
+    citas = Cita.objects.filter(fecha__range=(desde, hasta), estatus__in=ESTATUS)
+    if especialistas is not None:
+        citas = citas.filter(id_especialista_id__in=list(especialistas))
+    grupos = list(
+        citas.annotate(dia=ExtractIsoWeekDay("fecha"), hora_cita=ExtractHour("hora"), minuto=ExtractMinute("hora"))
+        .values_list("id_especialista_id", "dia", "hora_cita", "minuto", "estatus")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+    if not grupos:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 7, BLOQUES_POR_DIA, len(ESTATUS)), dtype=np.int64)
+
+    columnas = np.array([(id_especialista, dia, hora, minuto, INDICE_ESTATUS[estatus], total)
+                         for id_especialista, dia, hora, minuto, estatus, total in grupos], dtype=np.int64)
+    ids, fila_de_especialista = np.unique(columnas[:, 0], return_inverse=True)
+    bloques = (columnas[:, 2] * 60 + columnas[:, 3]) // INTERVALO_CITA
+    conteos = np.zeros((len(ids), 7, BLOQUES_POR_DIA, len(ESTATUS)), dtype=np.int64)
+    # add.at acumula aunque dos grupos caigan en el mismo bloque (por ejemplo 8:00 y 8:15)
+    np.add.at(conteos, (fila_de_especialista, columnas[:, 1] - 1, bloques, columnas[:, 4]), columnas[:, 5])
+    return ids, conteos
+
+
+def dividir(numerador: np.ndarray, denominador: np.ndarray) -> np.ndarray:
+    """Division elemento a elemento que deja 0 donde el denominador es 0."""
+    numerador = np.asarray(numerador, dtype=np.float64)
+    denominador = np.broadcast_to(np.asarray(denominador, dtype=np.float64), numerador.shape)
+    return np.divide(numerador, denominador, out=np.zeros_like(numerador), where=denominador > 0)
+
+
+def curvas_de_demanda(desde: date, hasta: date, especialistas: Optional[Iterable[int]] = None) -> Dict[str, np.ndarray]:
+    """Arreglos de forma ``(especialistas, 7, BLOQUES_POR_DIA)`` con las curvas de demanda del rango."""
+    ids, conteos = conteos_de_citas(desde, hasta, especialistas)
+    no_canceladas = conteos[..., NO_CANCELADAS].sum(axis=-1)
+    total = conteos.sum(axis=-1)
+    semanas = dias_de_semana_en_rango(desde, hasta)[np.newaxis, :, np.newaxis]
+    return {
+        "especialistas": ids,
+        "citas": no_canceladas,
+        "citas_por_semana": dividir(no_canceladas, semanas),
+        "tasa_cancelacion": dividir(conteos[..., INDICE_ESTATUS["B"]], total),
+        "tasa_inasistencia": dividir(conteos[..., SIN_ATENDER].sum(axis=-1), no_canceladas),
+    }
+
+
+def resumen_de_demanda(curvas: Dict[str, np.ndarray]) -> list:
+    """Curvas por especialista y dia, solo con los bloques que tuvieron citas, listas para JSON."""
+    resumen = []
+    for fila, id_especialista in enumerate(curvas["especialistas"].tolist()):
+        dias = {}
+        for dia, nombre in enumerate(DIAS_SEMANA):
+            bloques = np.flatnonzero(curvas["citas"][fila, dia])
+            if not len(bloques):
+                continue
+            dias[nombre] = [{"hora": minutos_a_texto(int(bloque) * INTERVALO_CITA),
+                             "citas": int(curvas["citas"][fila, dia, bloque]),
+                             "citas_por_semana": round(float(curvas["citas_por_semana"][fila, dia, bloque]), 3),
+                             "tasa_cancelacion": round(float(curvas["tasa_cancelacion"][fila, dia, bloque]), 3),
+                             "tasa_inasistencia": round(float(curvas["tasa_inasistencia"][fila, dia, bloque]), 3)}
+                            for bloque in bloques]
+        resumen.append({"id_especialista": id_especialista, "dias": dias})
+    return resumen
+
+
+__all__ = [
+    "SEMANAS_POR_DEFECTO",
+    "rango_por_defecto",
+    "dias_de_semana_en_rango",
+    "conteos_de_citas",
+    "curvas_de_demanda",
+    "resumen_de_demanda",
+]
@@ -0,0 +1,127 @@
+"""
+Calculo de los horarios libres de un especialista.
+
+Combina el horario compilado del especialista (ver ``utils.horario``) con el
+mapa de ocupacion de cada dia del rango solicitado (ver ``utils.ocupacion``),
+obtenido en una sola consulta, y con sus excepciones de horario (ver
+``utils.excepciones``), que se suman al mapa como bloques ocupados. Tambien
+busca los primeros horarios libres entre varios especialistas (por ejemplo,
+todos los de una especialidad).
+"""
+from __future__ import annotations
+
+import heapq
+from datetime import date, timedelta
+from itertools import islice
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from moduloPrincipal.models import OcupacionDia
+from moduloPrincipal.utils.excepciones import Bloqueos, bloqueos_de, bloqueos_de_especialistas
+from moduloPrincipal.utils.horario import (
+    intervalos_de_fecha,
+    minutos_a_texto,
+    obtener_horario,
+    slots_de_intervalos,
+)
+from moduloPrincipal.utils.ocupacion import bit_de_minutos, esta_libre, mapas_de_rango
+
+# Maximo de dias que se pueden consultar en una sola peticion
+MAX_DIAS_CONSULTA = 62
+# Dias cuyos mapas se leen juntos al buscar los primeros horarios libres
+DIAS_POR_BLOQUE = 7
+
+# (fecha, minutos desde la medianoche, id del especialista)
+Slot = Tuple[date, int, int]
+
+
+def rango_fechas(desde: date, hasta: date):
+    dia = desde
+    while dia <= hasta:
+        yield dia
+        dia += timedelta(days=1)
+
+
+def horarios_libres(especialista, desde: date, hasta: date) -> Dict[str, List[str]]:
+    """
+    Horas libres (``HH:MM``) de cada dia entre ``desde`` y ``hasta`` inclusive,
+    indexadas por fecha en formato ``YYYY-MM-DD``. Los dias sin horario de
+    atencion no aparecen en el resultado.
+    """
+    compilado = obtener_horario(especialista)
+    mapas = mapas_de_rango(especialista.id, desde, hasta)
+    bloqueos = bloqueos_de(especialista.id)
+    libres: Dict[str, List[str]] = {}
+    for fecha in rango_fechas(desde, hasta):
+        slots = slots_de_intervalos(intervalos_de_fecha(compilado, fecha))
+        if not slots:
+            continue
+        mapa = mapas.get(fecha, 0) | bloqueos.mascara(fecha)
+        libres[fecha.isoformat()] = [minutos_a_texto(m) for m in slots if esta_libre(mapa, m)]
+    return libres
+
+
+def semana_de_horario(compilado):
+    """
+    Slots ``(minutos, bit)`` de cada dia de la semana del horario compilado
+    (ver ``obtener_horario``) y la mascara con todos los bits del dia, para
+    saltar de un solo golpe los dias ya llenos.
+    """
+    slots_por_dia = tuple(
+        tuple((minutos, bit_de_minutos(minutos)) for minutos in slots_de_intervalos(dia))
+        for dia in compilado or [[]] * 7
+    )
+    mascaras = tuple(sum(bit for _, bit in slots) for slots in slots_por_dia)
+    return slots_por_dia, mascaras
+
+
+def slots_libres(id_especialista: int, semana, mapas: Dict[tuple, int], bloqueos: Bloqueos,
+                 desde: date, hasta: date) -> Iterator[Slot]:
+    """
+    Genera en orden los horarios libres de un especialista. ``semana`` es el
+    resultado de ``semana_de_horario`` y ``mapas`` se indexa por
+    (especialista, fecha).
+    """
+    slots_por_dia, mascaras = semana
+    for fecha in rango_fechas(desde, hasta):
+        dia = fecha.weekday()
+        mapa = mapas.get((id_especialista, fecha), 0)
+        if bloqueos:
+            mapa |= bloqueos.mascara(fecha)
+        if mapa & mascaras[dia] == mascaras[dia]:
+            continue
+        for minutos, bit in slots_por_dia[dia]:
+            if not mapa & bit:
+                yield fecha, minutos, id_especialista
+
+
+def primeros_libres(especialistas: Sequence, desde: date, hasta: date, limite: int) -> List[Slot]:
+    """
+    Los ``limite`` horarios libres mas proximos entre varios especialistas.
+
+    Cada especialista aporta un generador ya ordenado y ``heapq.merge`` los
+    intercala sin calcular todos los horarios del rango. El rango se recorre
+    por bloques de ``DIAS_POR_BLOQUE`` dias, con una consulta de mapas por
+    bloque, y se detiene en cuanto se junta el limite, de modo que casi
+    siempre basta con leer los mapas de la primera semana.
+    """
+    semanas = [(especialista.id, semana_de_horario(obtener_horario(especialista))) for especialista in especialistas]
+    semanas = [(id_especialista, semana) for id_especialista, semana in semanas if any(semana[1])]
+    ids = [id_especialista for id_especialista, _ in semanas]
+    bloqueos = bloqueos_de_especialistas(ids)
+    encontrados: List[Slot] = []
+    inicio = desde
+    while inicio <= hasta and ids and len(encontrados) < limite:
+        fin = min(inicio + timedelta(days=DIAS_POR_BLOQUE - 1), hasta)
+        mapas = {
+            (id_especialista, fecha): mapa
+            for id_especialista, fecha, mapa in OcupacionDia.objects.filter(
+                id_especialista_id__in=ids, fecha__range=(inicio, fin)).values_list("id_especialista_id", "fecha", "mapa")
+        }
+        generadores = [slots_libres(id_especialista, semana, mapas, bloqueos[id_especialista], inicio, fin)
+                       for id_especialista, semana in semanas]
+        encontrados.extend(islice(heapq.merge(*generadores), limite - len(encontrados)))
+        inicio = fin + timedelta(days=1)
+    return encontrados
+
+
+__all__ = ["MAX_DIAS_CONSULTA", "rango_fechas", "horarios_libres", "semana_de_horario", "slots_libres", "primeros_libres"]
@@ -0,0 +1,103 @@
+"""
+Excepciones al horario semanal (vacaciones, dias festivos, bloqueos de
+algunas horas).
+
+Cada ``ExcepcionHorario`` se convierte en intervalos de minutos absolutos
+(``fecha.toordinal() * 1440 + minutos``): uno solo si bloquea dias completos
+o uno por dia si solo bloquea algunas horas de cada dia del rango. Como solo
+interesa saber si un horario esta bloqueado y no cual excepcion lo bloquea,
+los intervalos se unen en intervalos disjuntos y ordenados, y cada consulta
+es una busqueda binaria (``bisect``): O(log n) sin recorrer todas las
+excepciones en cada peticion.
+
+Los intervalos no se guardan en cache: se arman en cada peticion con una
+sola consulta sobre el indice (especialista, fecha_fin) de las excepciones
+vigentes, asi una excepcion nueva se respeta de inmediato en todos los
+procesos del servidor.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from moduloPrincipal.models import ExcepcionHorario
+from moduloPrincipal.utils.horario import INTERVALO_CITA, time_a_minutos
+
+MINUTOS_DIA = 24 * 60
+
+
+def intervalos_de_excepcion(fecha_inicio: date, fecha_fin: date, hora_inicio=None, hora_fin=None) -> List[Tuple[int, int]]:
+    """Intervalos ``[inicio, fin)`` en minutos absolutos que bloquea una excepcion."""
+    if hora_inicio is None or hora_fin is None:
+        return [(fecha_inicio.toordinal() * MINUTOS_DIA, (fecha_fin.toordinal() + 1) * MINUTOS_DIA)]
+    desde, hasta = time_a_minutos(hora_inicio), time_a_minutos(hora_fin)
+    return [(dia * MINUTOS_DIA + desde, dia * MINUTOS_DIA + hasta)
+            for dia in range(fecha_inicio.toordinal(), fecha_fin.toordinal() + 1)]
+
+
+class Bloqueos:
+    """Intervalos bloqueados de un especialista, disjuntos y ordenados para buscarlos con ``bisect``."""
+
+    def __init__(self, inicios: List[int] = None, fines: List[int] = None):
+        self.inicios = inicios or []
+        self.fines = fines or []
+
+    @classmethod
+    def unir(cls, intervalos: Iterable[Sequence[int]]) -> "Bloqueos":
+        """Une los intervalos que se enciman o tocan."""
+        inicios: List[int] = []
+        fines: List[int] = []
+        for inicio, fin in sorted(intervalos):
+            if fines and inicio <= fines[-1]:
+                fines[-1] = max(fines[-1], fin)
+            else:
+                inicios.append(inicio)
+                fines.append(fin)
+        return cls(inicios, fines)
+
+    def __bool__(self):
+        return bool(self.inicios)
+
+    def bloqueado(self, fecha: date, minutos: int, duracion: int = INTERVALO_CITA) -> bool:
+        """Indica si la cita de ``duracion`` minutos que empieza en ``minutos`` choca con una excepcion."""
+        inicio = fecha.toordinal() * MINUTOS_DIA + minutos
+        # Ultimo intervalo que empieza antes de que termine la cita
+        indice = bisect_left(self.inicios, inicio + duracion) - 1
+        return indice >= 0 and self.fines[indice] > inicio
+
+    def mascara(self, fecha: date) -> int:
+        """Bits (como en ``OcupacionDia.mapa``) de los bloques del dia que estan bloqueados."""
+        inicio_dia = fecha.toordinal() * MINUTOS_DIA
+        fin_dia = inicio_dia + MINUTOS_DIA
+        mascara = 0
+        indice = bisect_right(self.fines, inicio_dia)
+        while indice < len(self.inicios) and self.inicios[indice] < fin_dia:
+            primero = (max(self.inicios[indice], inicio_dia) - inicio_dia) // INTERVALO_CITA
+            ultimo = (min(self.fines[indice], fin_dia) - inicio_dia - 1) // INTERVALO_CITA
+            mascara |= ((1 << (ultimo - primero + 1)) - 1) << primero
+            indice += 1
+        return mascara
+
+
+def bloqueos_de_especialistas(ids: Sequence[int]) -> Dict[int, Bloqueos]:
+    """``Bloqueos`` de las excepciones vigentes de cada especialista, con una sola consulta."""
+    intervalos: Dict[int, list] = {id_especialista: [] for id_especialista in ids}
+    excepciones = ExcepcionHorario.objects.filter(
+        id_especialista_id__in=ids, fecha_fin__gte=date.today() - timedelta(days=1)
+    ).values_list("id_especialista_id", "fecha_inicio", "fecha_fin", "hora_inicio", "hora_fin")
+    for id_especialista, fecha_inicio, fecha_fin, hora_inicio, hora_fin in excepciones:
+        intervalos[id_especialista].extend(intervalos_de_excepcion(fecha_inicio, fecha_fin, hora_inicio, hora_fin))
+    return {id_especialista: Bloqueos.unir(lista) for id_especialista, lista in intervalos.items()}
+
+
+def bloqueos_de(id_especialista: int) -> Bloqueos:
+    return bloqueos_de_especialistas([id_especialista])[id_especialista]
+
+
+__all__ = [
+    "intervalos_de_excepcion",
+    "Bloqueos",
+    "bloqueos_de_especialistas",
+    "bloqueos_de",
+]
@@ -0,0 +1,219 @@
+"""
+Expediente clinico de un paciente.
+
+Las ventanas de perfil clinico, informacion del paciente y consulta medica
+muestran lo mismo: el paciente con su ``Usuario`` y ``User``, sus indices
+(edad, IMC y filtracion glomerular) y sus seis tablas de antecedentes.
+``cargar_expediente`` lo obtiene siempre con el mismo numero de consultas:
+una para el paciente con ``select_related`` y una por cada tabla de
+antecedentes con ``prefetch_related``, sin importar cuantos registros tenga.
+
+``expediente_de`` guarda ese resultado en el cache de Django, asi que abrir
+varias veces el expediente durante una consulta no lo vuelve a armar: cada
+paciente tiene una sola entrada y leerla es un solo ``cache.get``. Las
+senales de ``Paciente``, ``Usuario``, ``User`` y de las tablas de
+antecedentes (ver ``moduloPrincipal.signals``) borran la entrada al guardar
+y otra vez al confirmar la transaccion, por si otra peticion alcanzo a
+guardar los datos anteriores. Las cargas que no pasan por las senales
+(``update()``, ``bulk_create``) deben llamar a ``invalidar_expediente``, como
+lo hace ``registrar_antecedentes``, que captura varios antecedentes de una vez.
+
+Solo se guardan los campos que muestran las ventanas (del ``User`` no se
+guarda la contrasena ni los permisos) y solo si el cache es compartido por
+todos los procesos (Redis, con ``REDIS_URL``): con ``LocMemCache`` cada
+proceso tendria su propia copia y no se enteraria de los cambios hechos en
+los demas, asi que el expediente se carga siempre de la base de datos.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+from django.contrib.auth.models import User
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Prefetch
+
+from moduloPrincipal.models import (Alergias, Ant_Patologicos, Ant_quirurjicos, Ant_transfusionales, Paciente,
+                                    Toxicomania, Usuario, Vacunacion)
+from moduloPrincipal.utils.metricas import calcular_edad, calcular_fgm, calcular_imc
+
+# (nombre en el perfil clinico, relacion inversa, modelo, nombre en las ventanas de consulta); cada lista
+# precargada queda en ``paciente.lista_<nombre>`` porque algunos nombres chocan con las relaciones inversas
+ANTECEDENTES = (
+    ("toxicomanias", "toxicomania_set", Toxicomania, "AP_toxi"),
+    ("ant_patologicos", "ant_patologicos_set", Ant_Patologicos, "AP"),
+    ("ant_quirurjicos", "ant_quirurjicos_set", Ant_quirurjicos, "AP_qui"),
+    ("ant_transfusionales", "ant_transfusionales_set", Ant_transfusionales, "AP_tran"),
+    ("alergias", "alergias_set", Alergias, "AP_al"),
+    ("vacunas", "vacunacion_set", Vacunacion, "AP_vac"),
+)
+# Las entradas se invalidan con las senales, el tiempo de vida solo limpia pacientes que ya no se consultan
+DURACION_CACHE = 60 * 60
+# Campos del ``Usuario`` y del ``User`` del paciente que se guardan en el cache; los demas (como la contrasena)
+# quedan diferidos y se leen de la base de datos si alguien los pide
+CAMPOS_USUARIO = ("id", "id_usuario", "fecha_nacimiento", "foto", "tipo")
+CAMPOS_USER = ("id", "username", "first_name", "last_name", "email")
+# Antecedentes que se aceptan en una sola captura
+MAX_ANTECEDENTES = 200
+
+
+def cargar_expediente(**filtros) -> Paciente:
+    """
+    Paciente que cumple ``filtros`` (por ejemplo ``id=...`` o
+    ``id_usuario__id_usuario=request.user``) con su ``Usuario`` y ``User`` y
+    sus antecedentes en listas (``paciente.lista_toxicomanias``,
+    ``paciente.lista_alergias``, etc.). Lanza ``Paciente.DoesNotExist`` igual
+    que ``get``.
+    """
+    return (Paciente.objects.select_related("id_usuario__id_usuario")
+            .prefetch_related(*(Prefetch(relacion, queryset=modelo.objects.order_by("id"), to_attr="lista_" + nombre)
+                                for nombre, relacion, modelo, _ in ANTECEDENTES))
+            .get(**filtros))
+
+
+def cache_compartido() -> bool:
+    """Indica si el cache de Django lo comparten todos los procesos (no es ``LocMemCache``)."""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+
+
+def llave_expediente(id_paciente: int) -> str:
+    return f"expediente:{id_paciente}"
+
+
+def _campos(modelo, nombres=None) -> List:
+    """Campos de ``modelo`` que se guardan en el cache: ``nombres`` o todos sus campos."""
+    if nombres is None:
+        return list(modelo._meta.concrete_fields)
+    return [modelo._meta.get_field(nombre) for nombre in nombres]
+
+
+def _valores(instancia, campos) -> Tuple:
+    # Valores simples (la ruta de la foto, el id de las llaves foraneas) para no guardar objetos en el cache
+    return tuple(campo.get_prep_value(campo.value_from_object(instancia)) for campo in campos)
+
+
+def _instancia(modelo, campos, valores):
+    return modelo.from_db("default", [campo.attname for campo in campos], valores)
+
+
+def _a_cache(paciente: Paciente) -> Dict:
+    """Valores de ``cargar_expediente`` que se guardan en el cache."""
+    return {"paciente": _valores(paciente, _campos(Paciente)),
+            "usuario": _valores(paciente.id_usuario, _campos(Usuario, CAMPOS_USUARIO)),
+            "user": _valores(paciente.id_usuario.id_usuario, _campos(User, CAMPOS_USER)),
+            "antecedentes": {nombre: [_valores(antecedente, _campos(modelo))
+                                      for antecedente in getattr(paciente, "lista_" + nombre)]
+                             for nombre, _, modelo, _ in ANTECEDENTES}}
+
+
+def _de_cache(datos: Dict) -> Paciente:
+    """Arma de nuevo el ``Paciente`` de ``cargar_expediente`` con los valores de ``_a_cache``."""
+    paciente = _instancia(Paciente, _campos(Paciente), datos["paciente"])
+    usuario = _instancia(Usuario, _campos(Usuario, CAMPOS_USUARIO), datos["usuario"])
+    usuario.id_usuario = _instancia(User, _campos(User, CAMPOS_USER), datos["user"])
+    paciente.id_usuario = usuario
+    for nombre, _, modelo, _ in ANTECEDENTES:
+        setattr(paciente, "lista_" + nombre, [_instancia(modelo, _campos(modelo), valores)
+                                              for valores in datos["antecedentes"][nombre]])
+    return paciente
+
+
+def expediente_de(id_paciente: int) -> Paciente:
+    """``cargar_expediente`` del paciente, leido del cache si no ha cambiado desde la ultima vez."""
+    if not cache_compartido():
+        return cargar_expediente(id=id_paciente)
+    llave = llave_expediente(id_paciente)
+    datos = cache.get(llave)
+    if datos is None:
+        paciente = cargar_expediente(id=id_paciente)
+        cache.set(llave, _a_cache(paciente), DURACION_CACHE)
+        return paciente
+    return _de_cache(datos)
+
+
+def invalidar_expediente(id_paciente: int):
+    if cache_compartido():
+        cache.delete(llave_expediente(id_paciente))
+
+
+def contexto_expediente(paciente: Paciente, nombres_consulta: bool = False, redondear_fgm: bool = True) -> Dict:
+    """
+    Datos del expediente para las plantillas. Con ``nombres_consulta`` los
+    antecedentes usan los nombres de las ventanas de consulta (``AP_toxi``,
+    ``AP_al``, ...) en lugar de los del perfil clinico.
+    """
+    edad = calcular_edad(paciente.id_usuario.fecha_nacimiento)
+    fgm = calcular_fgm(edad, paciente.peso, paciente.creatinina, paciente.genero)
+    contexto = {"paciente": paciente,
+                "edad": edad,
+                "imc": calcular_imc(paciente.peso, paciente.talla),
+                "fgm": round(fgm) if redondear_fgm else fgm}
+    for nombre, _, _, nombre_consulta in ANTECEDENTES:
+        contexto[nombre_consulta if nombres_consulta else nombre] = getattr(paciente, "lista_" + nombre)
+    return contexto
+
+
+def antecedentes_de_datos(id_paciente: int, datos: Dict) -> Tuple[List, Dict]:
+    """
+    ``(antecedentes, errores)`` a partir de ``datos``, con una lista de
+    diccionarios por cada tipo de antecedente (``{"alergias": [{"nombre":
+    ...}], "vacunas": [...]}``). ``antecedentes`` es una lista de ``(modelo,
+    instancias sin guardar)`` y ``errores`` tiene, por tipo y posicion, los
+    errores de validacion de cada registro; si esta vacio se pueden guardar.
+    """
+    antecedentes, errores = [], {}
+    for nombre, _, modelo, _ in ANTECEDENTES:
+        filas = datos.get(nombre) or []
+        if not isinstance(filas, list):
+            errores[nombre] = "Se esperaba una lista"
+            continue
+        campos = [campo.name for campo in modelo._meta.concrete_fields if campo.name not in ("id", "id_paciente")]
+        instancias = []
+        for indice, fila in enumerate(filas):
+            if not isinstance(fila, dict):
+                errores.setdefault(nombre, {})[indice] = "Se esperaba un objeto"
+                continue
+            instancia = modelo(id_paciente_id=id_paciente, **{campo: fila.get(campo) for campo in campos})
+            try:
+                # Valida y convierte los valores (texto a numero, largo maximo) sin consultar la base de datos
+                instancia.full_clean(exclude=["id_paciente"])
+            except ValidationError as error:
+                errores.setdefault(nombre, {})[indice] = error.message_dict
+            instancias.append(instancia)
+        antecedentes.append((modelo, instancias))
+    if sum(len(instancias) for _, instancias in antecedentes) > MAX_ANTECEDENTES:
+        errores["__all__"] = "Se pueden capturar maximo %d antecedentes a la vez" % MAX_ANTECEDENTES
+    return antecedentes, errores
+
+
+def registrar_antecedentes(id_paciente: int, datos: Dict) -> Dict:
+    """
+    Valida los antecedentes de ``datos`` (ver ``antecedentes_de_datos``) y,
+    si todos son validos, los guarda con un ``bulk_create`` por tabla en una
+    sola transaccion. Regresa los errores, vacio si se guardaron.
+    """
+    antecedentes, errores = antecedentes_de_datos(id_paciente, datos)
+    if errores:
+        return errores
+    with transaction.atomic():
+        for modelo, instancias in antecedentes:
+            if instancias:
+                modelo.objects.bulk_create(instancias)
+        # bulk_create no envia las senales que invalidan el expediente
+        invalidar_expediente(id_paciente)
+        transaction.on_commit(lambda: invalidar_expediente(id_paciente))
+    return {}
+
+
+__all__ = [
+    "ANTECEDENTES",
+    "cargar_expediente",
+    "cache_compartido",
+    "expediente_de",
+    "invalidar_expediente",
+    "contexto_expediente",
+    "antecedentes_de_datos",
+    "registrar_antecedentes",
+]
@@ -0,0 +1,55 @@
+"""
+Exportacion de listados a CSV por partes.
+
+Los listados del administrador pueden tener cientos de miles de filas, asi
+que el archivo no se arma en memoria: ``lineas_csv`` genera una linea a la
+vez para enviarla con ``StreamingHttpResponse`` y las filas se leen de la
+base de datos con ``iterator(chunk_size=...)``, sin crear instancias ni
+guardar en cache el resultado del queryset.
+"""
+from __future__ import annotations
+
+import csv
+from datetime import date
+from typing import Iterable, Iterator, Optional, Sequence
+
+from moduloPrincipal.utils.metricas import calcular_imc, edad_en_bd
+
+# Filas que se leen de la base de datos en cada viaje
+FILAS_POR_LECTURA = 2000
+
+COLUMNAS_PACIENTES = ("id", "nombre", "apellido", "usuario", "correo", "fecha_nacimiento", "edad", "genero", "peso",
+                      "talla", "imc", "estatus")
+
+
+class _Eco:
+    """Objeto tipo archivo para ``csv.writer`` que regresa lo escrito en lugar de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def lineas_csv(encabezado: Sequence[str], filas: Iterable[Sequence]) -> Iterator[str]:
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(encabezado)
+    for fila in filas:
+        yield escritor.writerow(fila)
+
+
+def filas_de_pacientes(pacientes, hoy: Optional[date] = None) -> Iterator[tuple]:
+    """Filas de ``COLUMNAS_PACIENTES`` de cada paciente del queryset, ordenadas por id."""
+    consulta = (pacientes.annotate(edad=edad_en_bd(hoy=hoy)).order_by("id")
+                .values_list("id", "id_usuario__id_usuario__first_name", "id_usuario__id_usuario__last_name",
+                             "id_usuario__id_usuario__username", "id_usuario__id_usuario__email",
+                             "id_usuario__fecha_nacimiento", "edad", "genero", "peso", "talla", "estatus"))
+    for (id_paciente, nombre, apellido, usuario, correo, nacimiento, edad, genero, peso, talla,
+         estatus) in consulta.iterator(chunk_size=FILAS_POR_LECTURA):
+        yield (id_paciente, nombre, apellido, usuario, correo, nacimiento.isoformat(), edad, genero, peso, talla,
+               calcular_imc(peso, talla), estatus)
+
+
+__all__ = [
+    "COLUMNAS_PACIENTES",
+    "lineas_csv",
+    "filas_de_pacientes",
+]
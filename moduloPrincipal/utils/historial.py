@@ -0,0 +1,74 @@
+"""
+Historial de consultas de un paciente.
+
+Cada consulta atendida tiene su diagnostico, tratamientos (farmacologico y no
+farmacologico), exploracion fisica y menu (``Menu_Bien`` de moduloNutricion)
+en tablas aparte. ``consultas_del_paciente`` las obtiene con las relaciones
+inversas de ``Cita`` (``diagnosticos``, ``tratamientos``, ``exploraciones`` y
+``menus``) en ``prefetch_related``, asi que una pagina del historial son
+cinco consultas a la base de datos sin importar cuantas citas tenga: las
+citas con su especialista y una por cada relacion.
+"""
+from __future__ import annotations
+
+import json
+from typing import Dict, Optional
+
+from django.db.models import Prefetch
+from django.forms.models import model_to_dict
+
+from moduloPrincipal.models import Cita, Diagnostico, Exploracion_fisica, Tratamiento
+
+# Orden del historial, de la consulta mas reciente a la mas antigua
+ORDEN_HISTORIAL = ("-fecha", "-hora", "-id")
+
+
+def consultas_del_paciente(id_paciente: int, id_especialista: Optional[int] = None):
+    """Citas atendidas del paciente (solo las de ``id_especialista`` si se indica) con todo lo que se registro en ellas."""
+    citas = Cita.objects.filter(id_paciente_id=id_paciente, estatus="A")
+    if id_especialista is not None:
+        citas = citas.filter(id_especialista_id=id_especialista)
+    return (citas.select_related("id_especialista__id_usuario__id_usuario", "id_especialista__id_especialidad")
+            .prefetch_related(Prefetch("diagnosticos", queryset=Diagnostico.objects.order_by("id")),
+                              Prefetch("tratamientos", queryset=Tratamiento.objects.order_by("tipo", "id")),
+                              Prefetch("exploraciones", queryset=Exploracion_fisica.objects.order_by("id")),
+                              "menus"))
+
+
+def _menu(menu_bien):
+    try:
+        return json.loads(menu_bien.menu)
+    except ValueError:
+        return None
+
+
+def consulta_a_json(cita: Cita) -> Dict:
+    """Datos de una cita de ``consultas_del_paciente`` listos para JSON, sin hacer consultas."""
+    especialista = cita.id_especialista
+    user = especialista.id_usuario.id_usuario
+    tratamientos = cita.tratamientos.all()
+    return {
+        "id": cita.id,
+        "fecha": cita.fecha.isoformat(),
+        "hora": cita.hora.strftime("%H:%M"),
+        "motivo": cita.motivo,
+        "especialista": {"id": especialista.id,
+                         "nombre": (user.first_name + " " + user.last_name).strip(),
+                         "especialidad": especialista.id_especialidad.nombre},
+        "diagnosticos": [{"id": diagnostico.id,
+                          "descripcion": diagnostico.descripcion,
+                          "documento": diagnostico.ruta_doc.url if diagnostico.ruta_doc else None}
+                         for diagnostico in cita.diagnosticos.all()],
+        # tipo 0 = farmacologico, 1 = no farmacologico
+        "tratamiento_farmacologico": [tratamiento.descripcion for tratamiento in tratamientos if not tratamiento.tipo],
+        "tratamiento_no_farmacologico": [tratamiento.descripcion for tratamiento in tratamientos if tratamiento.tipo],
+        "exploraciones": [model_to_dict(exploracion, exclude=["id_cita"]) for exploracion in cita.exploraciones.all()],
+        "menus": [{"fecha": menu.fecha.isoformat(), "menu": _menu(menu)} for menu in cita.menus.all()],
+    }
+
+
+__all__ = [
+    "ORDEN_HISTORIAL",
+    "consultas_del_paciente",
+    "consulta_a_json",
+]
@@ -0,0 +1,178 @@
+"""
+Utilidades para el horario semanal de los especialistas.
+
+El campo ``Especialista.horario`` se captura como texto libre, un dia por
+segmento separado por ``;`` (de lunes a domingo) y hasta dos turnos por dia
+separados por ``, ``::
+
+    8:00-13:00, 14:00-17:00;8:00-13:00;...;
+
+Para no volver a separar ese texto en cada peticion, al guardar el
+especialista se compila a una lista de 7 dias (indice 0 = lunes, igual que
+``date.weekday()``) donde cada dia es una lista de intervalos
+``[inicio, fin]`` expresados en minutos desde la medianoche.
+"""
+from __future__ import annotations
+
+from datetime import date, time
+from typing import Dict, List, Sequence
+
+DIAS_SEMANA = ["Lunes", "Martes", "Miercoles", "Jueves", "Viernes", "Sabado", "Domingo"]
+
+# Duracion de cada cita en minutos
+INTERVALO_CITA = 30
+
+Intervalo = List[int]
+HorarioCompilado = List[List[Intervalo]]
+
+
+class HorarioInvalido(ValueError):
+    """Horario con un turno mal escrito; ``descripcion`` se muestra al especialista."""
+
+    def __init__(self, descripcion: str):
+        super().__init__(descripcion)
+        self.descripcion = descripcion
+
+
+def _texto_a_minutos(texto: str) -> int:
+    horas, minutos = texto.strip().split(":")
+    horas, minutos = int(horas), int(minutos)
+    if not (0 <= horas <= 24 and 0 <= minutos < 60):
+        raise ValueError(texto)
+    return horas * 60 + minutos
+
+
+def compilar_horario(texto: str | None, estricto: bool = True) -> HorarioCompilado:
+    """
+    Convierte el texto del horario en la representacion compilada.
+
+    Un turno mal formado, con hora final menor o igual a la inicial o que se
+    encima con otro del mismo dia lanza ``HorarioInvalido``: ignorarlo dejaria
+    el dia sin horario y al guardarlo se darian de baja sus citas. Con
+    ``estricto=False`` esos turnos se ignoran, para los horarios que ya estan
+    guardados y no se deben romper al compilarlos.
+    """
+    dias = (texto or "").split(";")
+    compilado: HorarioCompilado = []
+    for indice in range(7):
+        segmento = dias[indice] if indice < len(dias) else ""
+        intervalos: List[Intervalo] = []
+        for turno in segmento.split(","):
+            if not turno.strip():
+                continue
+            error = "El turno " + turno.strip() + " del " + DIAS_SEMANA[indice] + " no es valido"
+            inicio, _, fin = turno.partition("-")
+            try:
+                inicio_min = _texto_a_minutos(inicio)
+                fin_min = _texto_a_minutos(fin)
+            except ValueError:
+                if estricto:
+                    raise HorarioInvalido(error)
+                continue
+            if inicio_min < fin_min <= 24 * 60:
+                intervalos.append([inicio_min, fin_min])
+            elif estricto:
+                raise HorarioInvalido(error + ", la hora final debe ser mayor que la inicial")
+        intervalos.sort()
+        if estricto and any(siguiente[0] < anterior[1] for anterior, siguiente in zip(intervalos, intervalos[1:])):
+            raise HorarioInvalido("Los turnos del " + DIAS_SEMANA[indice] + " se enciman")
+        compilado.append(intervalos)
+    return compilado
+
+
+def obtener_horario(especialista) -> HorarioCompilado:
+    """
+    Devuelve el horario compilado del especialista. Si el registro aun no se
+    ha compilado (por ejemplo, creado con ``bulk_create``) se compila al vuelo.
+    """
+    return especialista.horario_compilado or compilar_horario(especialista.horario, estricto=False)
+
+
+def tiene_horario(compilado: HorarioCompilado) -> bool:
+    return any(compilado)
+
+
+def intervalos_de_fecha(compilado: HorarioCompilado, fecha: date) -> List[Intervalo]:
+    """Intervalos de atencion del dia de la semana que corresponde a ``fecha``."""
+    return compilado[fecha.weekday()] if compilado else []
+
+
+def slots_de_intervalos(intervalos: Sequence[Intervalo], intervalo: int = INTERVALO_CITA) -> List[int]:
+    """Minutos de inicio de cada cita posible dentro de los intervalos dados."""
+    slots: List[int] = []
+    for inicio, fin in intervalos:
+        slots.extend(range(inicio, fin, intervalo))
+    return slots
+
+
+def minutos_a_texto(minutos: int, dos_digitos: bool = True) -> str:
+    """Formatea minutos desde la medianoche como ``HH:MM`` (o ``H:MM``)."""
+    horas, minutos = divmod(minutos, 60)
+    if dos_digitos:
+        return f"{horas:02d}:{minutos:02d}"
+    return f"{horas}:{minutos:02d}"
+
+
+def minutos_a_time(minutos: int) -> time:
+    return time(minutos // 60, minutos % 60)
+
+
+def time_a_minutos(valor: time) -> int:
+    return valor.hour * 60 + valor.minute
+
+
+def horas_por_dia(compilado: HorarioCompilado, intervalo: int = INTERVALO_CITA) -> List[List[str]]:
+    """Horas de cita (``HH:MM``) de cada dia de la semana."""
+    return [[minutos_a_texto(m) for m in slots_de_intervalos(dia, intervalo)] for dia in compilado]
+
+
+def horario_por_dia(compilado: HorarioCompilado, nombres: Sequence[str] = DIAS_SEMANA) -> Dict[str, str]:
+    """
+    Texto legible del horario de cada dia, con el mismo formato en el que se
+    captura (``8:00-13:00, 14:00-17:00``), indexado por nombre del dia.
+    """
+    return {
+        nombre: ", ".join(
+            minutos_a_texto(inicio, False) + "-" + minutos_a_texto(fin, False) for inicio, fin in dia
+        )
+        for nombre, dia in zip(nombres, compilado)
+    }
+
+
+def turnos_por_dia(compilado: HorarioCompilado, nombres: Sequence[str] = DIAS_SEMANA) -> Dict[str, Dict[str, str]]:
+    """
+    Horas y minutos de los dos turnos de cada dia, con las claves que usa el
+    formulario de edicion de horario (``hora1_turno1``, ``min1_turno1``...).
+    """
+    resultado = {}
+    for nombre, dia in zip(nombres, compilado):
+        campos = {}
+        for numero in (1, 2):
+            turno = dia[numero - 1] if len(dia) >= numero else None
+            for posicion, minutos in ((1, turno[0] if turno else None), (2, turno[1] if turno else None)):
+                if minutos is None:
+                    campos[f"hora{posicion}_turno{numero}"] = ""
+                    campos[f"min{posicion}_turno{numero}"] = ""
+                else:
+                    campos[f"hora{posicion}_turno{numero}"] = str(minutos // 60)
+                    campos[f"min{posicion}_turno{numero}"] = f"{minutos % 60:02d}"
+        resultado[nombre] = campos
+    return resultado
+
+
+__all__ = [
+    "DIAS_SEMANA",
+    "INTERVALO_CITA",
+    "HorarioInvalido",
+    "compilar_horario",
+    "obtener_horario",
+    "tiene_horario",
+    "intervalos_de_fecha",
+    "slots_de_intervalos",
+    "minutos_a_texto",
+    "minutos_a_time",
+    "time_a_minutos",
+    "horas_por_dia",
+    "horario_por_dia",
+    "turnos_por_dia",
+]
@@ -0,0 +1,190 @@
+"""
+Lista de espera de citas por especialista.
+
+Cuando una cita futura libera su horario (se da de baja, se cambia de fecha u
+hora o se borra) las senales de ``Cita`` registran un ``HorarioLiberado`` en
+la misma transaccion, sin hacer mas trabajo durante la peticion. El comando
+``procesar_lista_espera`` toma esos eventos en orden y le ofrece el horario al
+primer paciente en espera de ese especialista al que le sirva esa fecha: su
+registro pasa a estatus ``O`` con la fecha, hora y vencimiento de la oferta, y
+el paciente la ve al consultar su lista de espera. La cita no se agenda sino
+hasta que el paciente acepta la oferta (``aceptar_oferta``, con el mismo motor
+de reservacion que ``Agendar``). Si la rechaza o no la acepta antes de que
+venza, el horario se vuelve a registrar como liberado para el siguiente.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from moduloPrincipal.models import Cita, Especialista, HorarioLiberado, ListaEspera
+from moduloPrincipal.utils.reservas import (
+    MENSAJE_EXCEPCION,
+    MENSAJE_FUERA_HORARIO,
+    MENSAJE_NO_DISPONIBLE,
+    ReservaError,
+    buscar_choque,
+    reservar_cita,
+    validar_horario,
+)
+
+# Pacientes en espera que se intentan por cada horario liberado
+MAX_INTENTOS = 20
+# Errores que indican que el horario ya no se puede ofrecer a nadie
+ERRORES_DEL_HORARIO = {MENSAJE_NO_DISPONIBLE, MENSAJE_FUERA_HORARIO, MENSAJE_EXCEPCION}
+# Horas que tiene el paciente para aceptar una oferta (nunca despues del inicio del dia de la cita)
+HORAS_OFERTA = 12
+
+MENSAJE_SIN_OFERTA = "No tienes una oferta pendiente en ese registro de lista de espera"
+MENSAJE_OFERTA_VENCIDA = "La oferta de ese horario ya vencio"
+
+
+def avisar_horario_liberado(id_especialista: int, fecha: date, hora: time):
+    """Registra el evento si el horario liberado todavia se puede agendar (a partir de manana)."""
+    if fecha > timezone.localdate():
+        HorarioLiberado.objects.create(id_especialista_id=id_especialista, fecha=fecha, hora=hora)
+
+
+def vencimiento_oferta(fecha: date):
+    """Hasta cuando se puede aceptar la oferta de un horario de ``fecha``."""
+    inicio_dia = timezone.make_aware(datetime.combine(fecha, time.min))
+    return min(timezone.now() + timedelta(hours=HORAS_OFERTA), inicio_dia)
+
+
+def ofrecer_horario(id_especialista: int, fecha: date, hora: time) -> Optional[ListaEspera]:
+    """
+    Le ofrece el horario al primer paciente en espera al que le sirva la
+    fecha y que lo podria tomar (por ejemplo, que no tenga ya otra cita a esa
+    hora); si no, se intenta con el siguiente. No agenda la cita.
+    """
+    if fecha <= timezone.localdate():
+        return None
+    # El mismo horario pudo liberarse dos veces y ya estar ofrecido
+    if ListaEspera.objects.filter(id_especialista_id=id_especialista, estatus="O",
+                                  oferta_fecha=fecha, oferta_hora=hora).exists():
+        return None
+    try:
+        validar_horario(Especialista.objects.only("id", "horario", "horario_compilado").get(id=id_especialista),
+                        fecha, hora)
+    except (Especialista.DoesNotExist, ReservaError):
+        return None
+    en_espera = (
+        ListaEspera.objects.filter(id_especialista_id=id_especialista, estatus="E",
+                                   fecha_desde__lte=fecha, fecha_hasta__gte=fecha)
+        .order_by("creada", "id")[:MAX_INTENTOS]
+    )
+    for espera in en_espera:
+        mensaje = buscar_choque(id_especialista, espera.id_paciente_id, fecha, hora)
+        if mensaje in ERRORES_DEL_HORARIO:
+            return None
+        if mensaje:
+            continue
+        espera.estatus = "O"
+        espera.oferta_fecha = fecha
+        espera.oferta_hora = hora
+        espera.oferta_vence = vencimiento_oferta(fecha)
+        espera.save(update_fields=["estatus", "oferta_fecha", "oferta_hora", "oferta_vence"])
+        return espera
+    return None
+
+
+def aceptar_oferta(id_espera: int, id_paciente: int) -> Cita:
+    """
+    Agenda (como cita pendiente) el horario ofrecido en el registro de lista
+    de espera del paciente. Si ya no se puede agendar, el registro vuelve a
+    quedar en espera y se lanza ``ReservaError``; cuando el problema es del
+    paciente y no del horario, el horario se libera para el siguiente.
+    """
+    with transaction.atomic():
+        espera = (ListaEspera.objects.select_for_update()
+                  .filter(id=id_espera, id_paciente_id=id_paciente, estatus="O").first())
+        if espera is None:
+            raise ReservaError(MENSAJE_SIN_OFERTA)
+        if espera.oferta_vence <= timezone.now():
+            raise ReservaError(MENSAJE_OFERTA_VENCIDA)
+        try:
+            cita = reservar_cita(espera.id_especialista_id, id_paciente, espera.oferta_fecha, espera.oferta_hora,
+                                 espera.motivo)
+        except ReservaError as error:
+            if error.descripcion not in ERRORES_DEL_HORARIO:
+                avisar_horario_liberado(espera.id_especialista_id, espera.oferta_fecha, espera.oferta_hora)
+            espera.estatus = "E"
+            espera.oferta_fecha = espera.oferta_hora = espera.oferta_vence = None
+            espera.save(update_fields=["estatus", "oferta_fecha", "oferta_hora", "oferta_vence"])
+            fallo = error
+        else:
+            espera.estatus = "A"
+            espera.id_cita = cita
+            espera.save(update_fields=["estatus", "id_cita"])
+            return cita
+    raise fallo
+
+
+def cancelar_espera(id_espera: int, id_paciente: int) -> bool:
+    """
+    Cancela el registro de lista de espera del paciente. Si tenia una oferta
+    pendiente, el horario ofrecido se libera para el siguiente en espera.
+    """
+    with transaction.atomic():
+        espera = (ListaEspera.objects.select_for_update()
+                  .filter(id=id_espera, id_paciente_id=id_paciente, estatus__in=["E", "O"]).first())
+        if espera is None:
+            return False
+        if espera.estatus == "O":
+            avisar_horario_liberado(espera.id_especialista_id, espera.oferta_fecha, espera.oferta_hora)
+        espera.estatus = "C"
+        espera.save(update_fields=["estatus"])
+        return True
+
+
+def vencer_ofertas() -> int:
+    """
+    Las ofertas que no se aceptaron a tiempo vencen junto con su registro de
+    lista de espera y el horario se libera para el siguiente paciente.
+    """
+    vencidas = 0
+    for espera in ListaEspera.objects.filter(estatus="O", oferta_vence__lte=timezone.now()):
+        with transaction.atomic():
+            if ListaEspera.objects.filter(id=espera.id, estatus="O").update(estatus="V"):
+                avisar_horario_liberado(espera.id_especialista_id, espera.oferta_fecha, espera.oferta_hora)
+                vencidas += 1
+    return vencidas
+
+
+def procesar_pendientes(lote: int = 100) -> Tuple[int, int]:
+    """
+    Procesa hasta ``lote`` eventos en el orden en que se registraron, cada uno
+    en su propia transaccion. Varios procesos pueden correr a la vez: cada
+    evento se bloquea y los ya bloqueados se saltan (en bases de datos que lo
+    permiten). Antes se vencen las ofertas que no se aceptaron a tiempo.
+    Regresa ``(eventos procesados, horarios ofrecidos)``.
+    """
+    ListaEspera.objects.filter(estatus="E", fecha_hasta__lt=timezone.localdate()).update(estatus="V")
+    vencer_ofertas()
+
+    saltar_bloqueados = connection.features.has_select_for_update_skip_locked
+    procesados = ofrecidos = 0
+    for id_evento in HorarioLiberado.objects.order_by("id").values_list("id", flat=True)[:lote]:
+        with transaction.atomic():
+            eventos = HorarioLiberado.objects.filter(id=id_evento)
+            evento = (eventos.select_for_update(skip_locked=True) if saltar_bloqueados else eventos).first()
+            if evento is None:
+                continue
+            if ofrecer_horario(evento.id_especialista_id, evento.fecha, evento.hora):
+                ofrecidos += 1
+            evento.delete()
+            procesados += 1
+    return procesados, ofrecidos
+
+
+__all__ = [
+    "avisar_horario_liberado",
+    "ofrecer_horario",
+    "aceptar_oferta",
+    "cancelar_espera",
+    "vencer_ofertas",
+    "procesar_pendientes",
+]
@@ -0,0 +1,134 @@
+"""
+Indices clinicos que se calculan a partir de los datos del paciente: edad,
+indice de masa corporal (IMC) y filtracion glomerular (Cockcroft-Gault).
+
+Cada indice tiene una funcion para un paciente (expediente, consulta) y una
+version con NumPy que recibe arreglos y calcula el indice de miles de
+pacientes a la vez (graficas, exportaciones), con las mismas reglas: el IMC
+se redondea a 2 decimales y los indices que no se pueden calcular porque
+falta un dato (peso, talla o creatinina en 0) valen 0. ``edad_en_bd`` es la
+misma edad como expresion de la base de datos, para anotarla en una
+consulta; para filtrar por edad ``rango_de_nacimiento`` la convierte en un
+rango de fechas de nacimiento, que si puede usar un indice.
+"""
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import ExtractYear
+
+# Factor de la formula de Cockcroft-Gault para mujeres
+FACTOR_MUJER = 0.85
+
+
+def calcular_edad(fecha_nacimiento: date, hoy: Optional[date] = None) -> int:
+    hoy = hoy or date.today()
+    return hoy.year - fecha_nacimiento.year - ((hoy.month, hoy.day) < (fecha_nacimiento.month, fecha_nacimiento.day))
+
+
+def calcular_imc(peso: float, talla: float) -> float:
+    return round(peso / (talla ** 2), 2) if peso and talla else 0
+
+
+def calcular_fgm(edad: int, peso: float, creatinina: float, genero: str) -> float:
+    """Filtracion glomerular en ml/min; 0 si no se ha registrado la creatinina."""
+    if not creatinina:
+        return 0
+    fgm = ((140 - edad) * peso) / (72 * creatinina)
+    return fgm if genero == "M" else fgm * FACTOR_MUJER
+
+
+def edades(fechas_nacimiento, hoy: Optional[date] = None) -> np.ndarray:
+    """Edad de cada fecha de nacimiento (arreglo ``datetime64[D]`` o lista de ``date``)."""
+    hoy = hoy or date.today()
+    fechas = np.asarray(fechas_nacimiento, dtype="datetime64[D]")
+    anios = fechas.astype("datetime64[Y]").astype(np.int64) + 1970
+    meses = fechas.astype("datetime64[M]")
+    # Mes y dia como MMDD para comparar si ya paso el cumpleanos de este anio
+    mes_dia = ((meses.astype(np.int64) % 12) + 1) * 100 + (fechas - meses.astype("datetime64[D]")).astype(np.int64) + 1
+    return hoy.year - anios - (hoy.month * 100 + hoy.day < mes_dia)
+
+
+def imcs(pesos, tallas) -> np.ndarray:
+    pesos = np.asarray(pesos, dtype=np.float64)
+    tallas = np.asarray(tallas, dtype=np.float64)
+    validos = (pesos != 0) & (tallas != 0)
+    imc = np.divide(pesos, tallas ** 2, out=np.zeros_like(pesos), where=validos)
+    return np.round(imc, 2)
+
+
+def fgms(edades_pacientes, pesos, creatininas, generos) -> np.ndarray:
+    pesos = np.asarray(pesos, dtype=np.float64)
+    creatininas = np.asarray(creatininas, dtype=np.float64)
+    fgm = np.divide((140 - np.asarray(edades_pacientes, dtype=np.float64)) * pesos, 72 * creatininas,
+                    out=np.zeros_like(pesos), where=creatininas != 0)
+    return np.where(np.asarray(generos) == "M", fgm, fgm * FACTOR_MUJER)
+
+
+def metricas_de_pacientes(pacientes, hoy: Optional[date] = None) -> Dict[str, np.ndarray]:
+    """
+    ``id``, ``edad``, ``imc`` y ``fgm`` de cada paciente del queryset, leyendo
+    solo esas columnas (sin crear instancias) y calculando con arreglos.
+    """
+    filas = list(pacientes.values_list("id", "id_usuario__fecha_nacimiento", "peso", "talla", "creatinina", "genero"))
+    if not filas:
+        vacio = np.zeros(0)
+        return {"id": vacio.astype(np.int64), "edad": vacio.astype(np.int64), "imc": vacio, "fgm": vacio}
+    ids, nacimientos, pesos, tallas, creatininas, generos = zip(*filas)
+    edad = edades(nacimientos, hoy)
+    return {"id": np.array(ids, dtype=np.int64),
+            "edad": edad,
+            "imc": imcs(pesos, tallas),
+            "fgm": fgms(edad, pesos, creatininas, generos)}
+
+
+def edad_en_bd(campo: str = "id_usuario__fecha_nacimiento", hoy: Optional[date] = None):
+    """Expresion con la edad a partir del campo de fecha de nacimiento ``campo``."""
+    hoy = hoy or date.today()
+    sin_cumpleanos = Q(**{campo + "__month__gt": hoy.month}) | Q(**{campo + "__month": hoy.month,
+                                                                     campo + "__day__gt": hoy.day})
+    return (Value(hoy.year) - ExtractYear(campo)
+            - Case(When(sin_cumpleanos, then=Value(1)), default=Value(0), output_field=IntegerField()))
+
+
+# Edad maxima que se acepta en los filtros por edad; con mas anios la fecha de nacimiento quedaria antes del anio 1
+EDAD_MAXIMA = 150
+
+
+def cumple_anios(hoy: date, anios: int) -> date:
+    """Ultima fecha de nacimiento con la que ``hoy`` ya se tienen ``anios`` cumplidos."""
+    try:
+        return hoy.replace(year=hoy.year - anios)
+    except ValueError:
+        # 29 de febrero en un anio que no es bisiesto: quien nacio el 28 ya cumplio
+        return hoy.replace(year=hoy.year - anios, day=28)
+
+
+def rango_de_nacimiento(edad_min: Optional[int] = None, edad_max: Optional[int] = None,
+                        hoy: Optional[date] = None) -> Tuple[Optional[date], Optional[date]]:
+    """
+    ``(desde, hasta)`` tales que ``calcular_edad`` esta entre ``edad_min`` y
+    ``edad_max`` (ambas inclusive) si y solo si la fecha de nacimiento esta
+    entre ``desde`` y ``hasta`` (ambas inclusive); ``None`` si no hay limite.
+    """
+    hoy = hoy or date.today()
+    hasta = cumple_anios(hoy, edad_min) if edad_min is not None else None
+    desde = cumple_anios(hoy, edad_max + 1) + timedelta(days=1) if edad_max is not None else None
+    return desde, hasta
+
+
+__all__ = [
+    "calcular_edad",
+    "calcular_imc",
+    "calcular_fgm",
+    "edades",
+    "imcs",
+    "fgms",
+    "metricas_de_pacientes",
+    "edad_en_bd",
+    "EDAD_MAXIMA",
+    "rango_de_nacimiento",
+]
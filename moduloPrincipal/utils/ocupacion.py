@@ -0,0 +1,157 @@
+"""
+Mapa de ocupacion de cada especialista por dia.
+
+Por cada (especialista, fecha) con citas activas se guarda un ``OcupacionDia``
+cuyo campo ``mapa`` tiene un bit por cada bloque de ``INTERVALO_CITA`` minutos
+del dia. Las senales de ``Cita`` (ver ``moduloPrincipal.signals``) lo
+actualizan al crear, cambiar de estatus o borrar una cita, asi que saber si
+una hora esta ocupada o calcular los horarios libres de un rango de fechas se
+resuelve con operaciones de bits sobre una fila por dia, sin recorrer
+``Cita``.
+
+Las actualizaciones se hacen con ``F()`` en la base de datos (o con las filas
+bloqueadas por ``select_for_update`` cuando se marcan varios dias a la vez),
+de modo que dos reservaciones simultaneas en el mismo dia no se pisan el
+mapa.
+"""
+from __future__ import annotations
+
+from datetime import date, time
+from typing import Dict, Iterable, List
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from moduloPrincipal.models import Cita, OcupacionDia
+from moduloPrincipal.utils.horario import INTERVALO_CITA, time_a_minutos
+
+BLOQUES_POR_DIA = 24 * 60 // INTERVALO_CITA
+MAPA_COMPLETO = (1 << BLOQUES_POR_DIA) - 1
+
+
+def bit_de_minutos(minutos: int) -> int:
+    return 1 << (minutos // INTERVALO_CITA)
+
+
+def bit_de_hora(hora: time) -> int:
+    return bit_de_minutos(time_a_minutos(hora))
+
+
+def esta_libre(mapa: int, minutos: int) -> bool:
+    return not mapa & bit_de_minutos(minutos)
+
+
+def marcar(id_especialista: int, fecha: date, hora: time):
+    """Marca como ocupado el bloque de ``hora``."""
+    bit = bit_de_hora(hora)
+    actualizadas = OcupacionDia.objects.filter(id_especialista_id=id_especialista, fecha=fecha).update(
+        mapa=F("mapa").bitor(bit))
+    if actualizadas:
+        return
+    try:
+        with transaction.atomic():
+            OcupacionDia.objects.create(id_especialista_id=id_especialista, fecha=fecha, mapa=bit)
+    except IntegrityError:
+        # Otra cita del mismo dia creo la fila primero
+        OcupacionDia.objects.filter(id_especialista_id=id_especialista, fecha=fecha).update(
+            mapa=F("mapa").bitor(bit))
+
+
+def liberar(id_especialista: int, fecha: date, hora: time):
+    """Marca como libre el bloque de ``hora``."""
+    OcupacionDia.objects.filter(id_especialista_id=id_especialista, fecha=fecha).update(
+        mapa=F("mapa").bitand(MAPA_COMPLETO ^ bit_de_hora(hora)))
+
+
+def mapa_de_dia(id_especialista: int, fecha: date) -> int:
+    return (OcupacionDia.objects.filter(id_especialista_id=id_especialista, fecha=fecha)
+            .values_list("mapa", flat=True).first() or 0)
+
+
+def mapas_de_rango(id_especialista: int, desde: date, hasta: date) -> Dict[date, int]:
+    """Mapa de cada dia del rango que tiene citas activas, con una sola consulta."""
+    return dict(
+        OcupacionDia.objects.filter(id_especialista_id=id_especialista, fecha__range=(desde, hasta))
+        .values_list("fecha", "mapa")
+    )
+
+
+def mapas_de_fechas(id_especialista: int, fechas: Iterable[date]):
+    """
+    ``(fecha, mapa)`` de las fechas indicadas, bloqueando las filas hasta que
+    termine la transaccion para poder modificarlas con ``marcar_varios``.
+    """
+    return (OcupacionDia.objects.select_for_update()
+            .filter(id_especialista_id=id_especialista, fecha__in=list(fechas))
+            .values_list("fecha", "mapa"))
+
+
+def marcar_varios(id_especialista: int, bits_por_fecha: Dict[date, int]):
+    """
+    Marca varios bloques de un especialista en distintos dias con un
+    ``bulk_update`` y un ``bulk_create``, en lugar de una consulta por cita.
+    Debe llamarse dentro de una transaccion.
+    """
+    if not bits_por_fecha:
+        return
+    existentes = list(OcupacionDia.objects.select_for_update()
+                      .filter(id_especialista_id=id_especialista, fecha__in=list(bits_por_fecha)))
+    for fila in existentes:
+        fila.mapa |= bits_por_fecha[fila.fecha]
+    OcupacionDia.objects.bulk_update(existentes, ["mapa"])
+    con_fila = {fila.fecha for fila in existentes}
+    OcupacionDia.objects.bulk_create([
+        OcupacionDia(id_especialista_id=id_especialista, fecha=fecha, mapa=bits)
+        for fecha, bits in bits_por_fecha.items() if fecha not in con_fila
+    ])
+
+
+def calcular_mapas(citas: Iterable) -> Dict[tuple, int]:
+    """Mapas por (especialista, fecha) a partir de tuplas (especialista, fecha, hora)."""
+    mapas: Dict[tuple, int] = {}
+    for id_especialista, fecha, hora in citas:
+        llave = (id_especialista, fecha)
+        mapas[llave] = mapas.get(llave, 0) | bit_de_hora(hora)
+    return mapas
+
+
+def reconstruir(id_especialista: int | None = None, desde: date | None = None) -> int:
+    """
+    Vuelve a generar los mapas a partir de ``Cita``. Sirve despues de cargas
+    que no pasan por las senales (``bulk_create``, ``update()``). Regresa el
+    numero de mapas generados.
+    """
+    ocupaciones = OcupacionDia.objects.all()
+    citas = Cita.objects.exclude(estatus="B")
+    if id_especialista is not None:
+        ocupaciones = ocupaciones.filter(id_especialista_id=id_especialista)
+        citas = citas.filter(id_especialista_id=id_especialista)
+    if desde is not None:
+        ocupaciones = ocupaciones.filter(fecha__gte=desde)
+        citas = citas.filter(fecha__gte=desde)
+
+    mapas = calcular_mapas(citas.values_list("id_especialista_id", "fecha", "hora").iterator())
+    nuevas: List[OcupacionDia] = [
+        OcupacionDia(id_especialista_id=especialista, fecha=fecha, mapa=mapa)
+        for (especialista, fecha), mapa in mapas.items()
+    ]
+    with transaction.atomic():
+        ocupaciones.delete()
+        OcupacionDia.objects.bulk_create(nuevas, batch_size=1000)
+    return len(nuevas)
+
+
+__all__ = [
+    "BLOQUES_POR_DIA",
+    "bit_de_minutos",
+    "bit_de_hora",
+    "esta_libre",
+    "marcar",
+    "liberar",
+    "mapa_de_dia",
+    "mapas_de_rango",
+    "mapas_de_fechas",
+    "marcar_varios",
+    "calcular_mapas",
+    "reconstruir",
+]
@@ -0,0 +1,66 @@
+"""
+Pacientes de un especialista (los que le enviaron una solicitud).
+
+``pacientes_del_especialista`` regresa las solicitudes del especialista con
+el paciente, su ``Usuario`` y su ``User`` en la misma consulta y la edad
+calculada por la base de datos (``edad``), de modo que recorrer el listado
+no hace consultas por fila.
+
+``buscar_pacientes`` filtra ese listado. Los filtros usan los indices de
+``Solicitudes`` (especialista y estatus) y de ``Ant_Patologicos`` (paciente y
+patologia); la edad se filtra como un rango de fechas de nacimiento en
+lugar de calcularla para cada paciente. La busqueda por texto (``icontains``
+sobre el nombre, apellido y usuario) y el orden por apellido y nombre no
+tienen indice: se aplican solo a los pacientes del especialista, que ya
+llegan filtrados por el indice de ``Solicitudes``.
+"""
+from __future__ import annotations
+
+from datetime import date
+from typing import Optional
+
+from django.db.models import Exists, OuterRef, Q
+
+from moduloPrincipal.models import Ant_Patologicos, Solicitudes
+from moduloPrincipal.utils.metricas import edad_en_bd, rango_de_nacimiento
+
+# Orden del listado de pacientes: apellido, nombre y la solicitud para desempatar
+ORDEN_PACIENTES = ("id_paciente__id_usuario__id_usuario__last_name",
+                   "id_paciente__id_usuario__id_usuario__first_name", "id")
+
+
+def pacientes_del_especialista(id_especialista: int, hoy: Optional[date] = None):
+    return (Solicitudes.objects.filter(id_especialista_id=id_especialista)
+            .select_related("id_paciente__id_usuario__id_usuario")
+            .annotate(edad=edad_en_bd("id_paciente__id_usuario__fecha_nacimiento", hoy)))
+
+
+def buscar_pacientes(solicitudes, texto: str = "", edad_min: Optional[int] = None, edad_max: Optional[int] = None,
+                     estatus: Optional[str] = None, patologia: str = "", hoy: Optional[date] = None):
+    """
+    Filtra ``solicitudes`` (de ``pacientes_del_especialista``). Cada palabra
+    de ``texto`` debe aparecer en el nombre, apellido o nombre de usuario;
+    ``patologia`` busca en los antecedentes patologicos del paciente.
+    """
+    for palabra in texto.split():
+        solicitudes = solicitudes.filter(Q(id_paciente__id_usuario__id_usuario__first_name__icontains=palabra)
+                                         | Q(id_paciente__id_usuario__id_usuario__last_name__icontains=palabra)
+                                         | Q(id_paciente__id_usuario__id_usuario__username__icontains=palabra))
+    desde, hasta = rango_de_nacimiento(edad_min, edad_max, hoy)
+    if desde:
+        solicitudes = solicitudes.filter(id_paciente__id_usuario__fecha_nacimiento__gte=desde)
+    if hasta:
+        solicitudes = solicitudes.filter(id_paciente__id_usuario__fecha_nacimiento__lte=hasta)
+    if estatus:
+        solicitudes = solicitudes.filter(estatus=estatus)
+    if patologia:
+        solicitudes = solicitudes.filter(Exists(Ant_Patologicos.objects.filter(id_paciente=OuterRef("id_paciente"),
+                                                                               patologia__icontains=patologia)))
+    return solicitudes
+
+
+__all__ = [
+    "ORDEN_PACIENTES",
+    "pacientes_del_especialista",
+    "buscar_pacientes",
+]
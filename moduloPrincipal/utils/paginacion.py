@@ -0,0 +1,88 @@
+"""
+Paginacion por llave (keyset) para listados largos.
+
+En lugar de ``OFFSET``, que obliga a la base de datos a recorrer todas las
+filas de las paginas anteriores, cada pagina pide las filas que van despues
+de la ultima fila de la pagina anterior segun el orden del listado. Con un
+indice sobre esos campos el costo de cada pagina no depende de cuantas filas
+hay antes.
+
+El cursor que se envia al navegador es la lista de valores de esos campos de
+la ultima fila, en JSON y codificada en base64 para usarse en la URL. Igual
+que en ``order_by``, un campo que empieza con ``-`` se ordena de forma
+descendente.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from typing import List, Optional, Sequence, Tuple
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def _campo(modelo, ruta: str):
+    """Campo del modelo para una ruta como ``fecha`` o ``id_usuario__id_usuario__last_name``."""
+    partes = ruta.lstrip("-").split("__")
+    for parte in partes[:-1]:
+        modelo = modelo._meta.get_field(parte).related_model
+    return modelo._meta.get_field(partes[-1])
+
+
+def _valor(fila, ruta: str):
+    for parte in ruta.lstrip("-").split("__"):
+        fila = getattr(fila, parte)
+    return fila
+
+
+def codificar_cursor(valores: Sequence) -> str:
+    texto = json.dumps([valor if isinstance(valor, (int, str)) or valor is None else valor.isoformat()
+                        for valor in valores])
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(modelo, campos: Sequence[str], cursor: str) -> Optional[list]:
+    """Valores del cursor convertidos al tipo de cada campo, o ``None`` si el cursor no es valido."""
+    try:
+        texto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        crudos = json.loads(texto)
+        if not isinstance(crudos, list) or len(crudos) != len(campos):
+            return None
+        return [_campo(modelo, campo).to_python(crudo) for campo, crudo in zip(campos, crudos)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def filtro_despues_de(campos: Sequence[str], valores: Sequence) -> Q:
+    """Filas que van despues de ``valores`` en el orden de ``campos``."""
+    filtro = Q()
+    for indice, campo in enumerate(campos):
+        condicion = (Q(**{campo[1:] + "__lt": valores[indice]}) if campo.startswith("-")
+                     else Q(**{campo + "__gt": valores[indice]}))
+        for anterior, valor in zip(campos[:indice], valores[:indice]):
+            condicion &= Q(**{anterior.lstrip("-"): valor})
+        filtro |= condicion
+    return filtro
+
+
+def pagina_keyset(queryset, campos: Sequence[str], cursor: str | None, tamano: int) -> Tuple[List, Optional[str]]:
+    """
+    Regresa las filas de la pagina y el cursor de la siguiente (``None`` si
+    ya no hay mas). ``campos`` debe terminar en un campo unico (por ejemplo
+    ``id``) para que el orden sea total. Un cursor invalido se trata como la
+    primera pagina.
+    """
+    queryset = queryset.order_by(*campos)
+    if cursor:
+        valores = decodificar_cursor(queryset.model, campos, cursor)
+        if valores is not None:
+            queryset = queryset.filter(filtro_despues_de(campos, valores))
+    filas = list(queryset[:tamano + 1])
+    if len(filas) <= tamano:
+        return filas, None
+    filas = filas[:tamano]
+    return filas, codificar_cursor([_valor(filas[-1], campo) for campo in campos])
+
+
+__all__ = ["codificar_cursor", "decodificar_cursor", "filtro_despues_de", "pagina_keyset"]
@@ -0,0 +1,279 @@
+"""
+Motor de reservacion de citas.
+
+Que el especialista ya tenga ocupada la hora se revisa con el mapa de
+ocupacion del dia (ver ``utils.ocupacion``); los choques del paciente (otra
+cita a la misma hora o con el mismo especialista ese dia) con una consulta
+sobre sus citas del dia. Ambas se hacen dentro de una transaccion y la
+restriccion unica parcial de ``Cita`` sobre (especialista, fecha, hora) para
+citas activas garantiza que dos reservaciones concurrentes no terminen
+ocupando el mismo horario aunque ambas pasen la validacion al mismo tiempo.
+
+Las series de citas (por ejemplo, cada dos semanas) se validan completas de
+una sola pasada y se insertan con un solo ``bulk_create``.
+
+Tambien se encarga de dar de baja, en bloque, las citas futuras que quedan
+fuera del horario cuando un especialista lo cambia.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from moduloPrincipal.models import Cita, Especialista
+from moduloPrincipal.utils import ocupacion
+from moduloPrincipal.utils.excepciones import bloqueos_de
+from moduloPrincipal.utils.horario import (
+    intervalos_de_fecha,
+    minutos_a_time,
+    obtener_horario,
+    slots_de_intervalos,
+    time_a_minutos,
+)
+from moduloPrincipal.utils.ocupacion import bit_de_hora, esta_libre, mapa_de_dia
+
+MENSAJE_NO_DISPONIBLE = "Ese dia y hora no estan disponibles para cita"
+MENSAJE_MISMA_HORA = "No puedes agendar 2 o mas citas para el mismo dia a la misma hora"
+MENSAJE_MISMO_ESPECIALISTA = "No puedes agendar 2 o mas citas para el mismo dia con el mismo especialista"
+MENSAJE_FUERA_HORARIO = "Esa hora esta fuera del horario de atencion del especialista"
+MENSAJE_EXCEPCION = "El especialista no atiende ese dia a esa hora"
+
+# Maximo de citas de una serie (un ano de citas semanales)
+MAX_REPETICIONES = 52
+
+
+class ReservaError(Exception):
+    """Error de validacion al reservar una cita; ``descripcion`` se muestra al usuario."""
+
+    def __init__(self, descripcion: str):
+        super().__init__(descripcion)
+        self.descripcion = descripcion
+
+
+def leer_fecha(valor) -> date:
+    if isinstance(valor, date):
+        return valor
+    try:
+        return date.fromisoformat(str(valor))
+    except ValueError:
+        raise ReservaError("La fecha debe tener el formato AAAA-MM-DD")
+
+
+def leer_hora(valor) -> time:
+    if isinstance(valor, time):
+        return valor
+    try:
+        return datetime.strptime(str(valor)[:5], "%H:%M").time()
+    except ValueError:
+        raise ReservaError("La hora debe tener el formato HH:MM")
+
+
+def error_de_horario(compilado, bloqueos, fecha: date, minutos: int):
+    """Mensaje si la hora no es el inicio de una cita del horario o cae en una excepcion, si no ``None``."""
+    if minutos not in slots_de_intervalos(intervalos_de_fecha(compilado, fecha)):
+        return MENSAJE_FUERA_HORARIO
+    if bloqueos.bloqueado(fecha, minutos):
+        return MENSAJE_EXCEPCION
+    return None
+
+
+def validar_horario(especialista, fecha: date, hora: time):
+    """
+    Verifica que la hora sea el inicio de una cita dentro del horario del
+    especialista y que no caiga en una de sus excepciones (vacaciones...).
+    """
+    mensaje = error_de_horario(obtener_horario(especialista), bloqueos_de(especialista.id), fecha, time_a_minutos(hora))
+    if mensaje:
+        raise ReservaError(mensaje)
+
+
+def citas_del_paciente(id_paciente: int, fecha: date):
+    """Especialista y hora de las citas activas del paciente ese dia."""
+    return (
+        Cita.objects.filter(id_paciente_id=id_paciente, fecha=fecha)
+        .exclude(estatus="B")
+        .values_list("id_especialista_id", "hora")
+    )
+
+
+def choque_de_dia(mapa: int, citas_paciente, id_especialista: int, hora: time):
+    """
+    Mensaje del primer choque de un dia, dado el mapa de ocupacion del
+    especialista y las citas activas (especialista, hora) del paciente.
+    """
+    if not esta_libre(mapa, time_a_minutos(hora)):
+        return MENSAJE_NO_DISPONIBLE
+    mensaje = None
+    for especialista_cita, hora_cita in citas_paciente:
+        if hora_cita == hora:
+            return MENSAJE_MISMA_HORA
+        if especialista_cita == id_especialista:
+            mensaje = MENSAJE_MISMO_ESPECIALISTA
+    return mensaje
+
+
+def buscar_choque(id_especialista: int, id_paciente: int, fecha: date, hora: time):
+    """Devuelve el mensaje del primer choque encontrado o ``None``."""
+    return choque_de_dia(mapa_de_dia(id_especialista, fecha), citas_del_paciente(id_paciente, fecha),
+                         id_especialista, hora)
+
+
+def reservar_cita(id_especialista, id_paciente, fecha, hora, motivo: str = "", estatus: str = "P") -> Cita:
+    """
+    Crea la cita si el horario esta libre. Lanza ``ReservaError`` con la
+    descripcion que se le muestra al paciente cuando no se puede reservar.
+    """
+    id_especialista = int(id_especialista)
+    id_paciente = int(id_paciente)
+    fecha = leer_fecha(fecha)
+    hora = leer_hora(hora)
+
+    try:
+        especialista = Especialista.objects.only("id", "horario", "horario_compilado").get(id=id_especialista)
+    except Especialista.DoesNotExist:
+        raise ReservaError("Especialista no encontrado")
+    validar_horario(especialista, fecha, hora)
+
+    try:
+        with transaction.atomic():
+            mensaje = buscar_choque(id_especialista, id_paciente, fecha, hora)
+            if mensaje:
+                raise ReservaError(mensaje)
+            return Cita.objects.create(fecha=fecha, hora=hora, estatus=estatus, motivo=motivo,
+                                       id_especialista_id=id_especialista, id_paciente_id=id_paciente)
+    except IntegrityError:
+        # Otra reservacion concurrente tomo el mismo horario
+        raise ReservaError(MENSAJE_NO_DISPONIBLE)
+
+
+def reservar_serie(id_especialista, id_paciente, fecha, hora, cada_dias, repeticiones, motivo: str = "",
+                   estatus: str = "P", parcial: bool = False):
+    """
+    Agenda una serie de citas a la misma hora cada ``cada_dias`` dias.
+
+    Todas las fechas se validan de una sola pasada contra el horario, las
+    excepciones, los mapas de ocupacion (una consulta) y las citas del
+    paciente (otra consulta); despues se insertan con un solo ``bulk_create``
+    dentro de una transaccion. Regresa ``(citas creadas, conflictos)`` donde
+    cada conflicto es ``{"fecha", "descripcion"}``. Si hay conflictos y
+    ``parcial`` es falso no se crea ninguna cita.
+    """
+    id_especialista = int(id_especialista)
+    id_paciente = int(id_paciente)
+    fecha = leer_fecha(fecha)
+    hora = leer_hora(hora)
+    try:
+        cada_dias = int(cada_dias)
+        repeticiones = int(repeticiones)
+    except (TypeError, ValueError):
+        raise ReservaError("La frecuencia y el numero de citas deben ser numeros")
+    if cada_dias < 1 or not 1 <= repeticiones <= MAX_REPETICIONES:
+        raise ReservaError("Se pueden agendar de 1 a " + str(MAX_REPETICIONES) + " citas, con al menos un dia entre ellas")
+    # Igual que en la ventana de agendar cita, la serie empieza a partir de manana
+    if fecha < timezone.localdate() + timedelta(days=1):
+        raise ReservaError("La primera cita de la serie debe ser a partir de manana")
+
+    try:
+        especialista = Especialista.objects.only("id", "horario", "horario_compilado").get(id=id_especialista)
+    except Especialista.DoesNotExist:
+        raise ReservaError("Especialista no encontrado")
+    compilado = obtener_horario(especialista)
+    bloqueos = bloqueos_de(id_especialista)
+    minutos = time_a_minutos(hora)
+    fechas = [fecha + timedelta(days=cada_dias * numero) for numero in range(repeticiones)]
+
+    try:
+        with transaction.atomic():
+            mapas = dict(ocupacion.mapas_de_fechas(id_especialista, fechas))
+            citas_paciente = {}
+            for fecha_cita, especialista_cita, hora_cita in (
+                    Cita.objects.filter(id_paciente_id=id_paciente, fecha__in=fechas).exclude(estatus="B")
+                    .values_list("fecha", "id_especialista_id", "hora")):
+                citas_paciente.setdefault(fecha_cita, []).append((especialista_cita, hora_cita))
+
+            nuevas, conflictos = [], []
+            for fecha_cita in fechas:
+                mensaje = (error_de_horario(compilado, bloqueos, fecha_cita, minutos)
+                           or choque_de_dia(mapas.get(fecha_cita, 0), citas_paciente.get(fecha_cita, ()),
+                                            id_especialista, hora))
+                if mensaje:
+                    conflictos.append({"fecha": fecha_cita.isoformat(), "descripcion": mensaje})
+                else:
+                    nuevas.append(Cita(fecha=fecha_cita, hora=hora, estatus=estatus, motivo=motivo,
+                                       id_especialista_id=id_especialista, id_paciente_id=id_paciente))
+            if conflictos and not parcial:
+                return [], conflictos
+
+            creadas = Cita.objects.bulk_create(nuevas)
+            # bulk_create no dispara las senales, los mapas se actualizan aqui mismo
+            ocupacion.marcar_varios(id_especialista, {cita.fecha: bit_de_hora(hora) for cita in creadas})
+            return creadas, conflictos
+    except IntegrityError:
+        # Otra reservacion concurrente tomo alguno de los horarios
+        raise ReservaError(MENSAJE_NO_DISPONIBLE)
+
+
+def filtro_fuera_de_horario(compilado) -> Q:
+    """
+    Condicion de las citas cuya hora no es el inicio de un slot del horario
+    en su dia de la semana. ``fecha__week_day`` cuenta de domingo (1) a
+    sabado (7); el horario compilado de lunes (0) a domingo (6).
+    """
+    fuera = Q()
+    for dia, intervalos in enumerate(compilado or [[]] * 7):
+        condicion = Q(fecha__week_day=(dia + 1) % 7 + 1)
+        slots = slots_de_intervalos(intervalos)
+        if slots:
+            condicion &= ~Q(hora__in=[minutos_a_time(minutos) for minutos in slots])
+        fuera |= condicion
+    return fuera
+
+
+def citas_fuera_de_horario(id_especialista: int, compilado, desde: date | None = None):
+    """
+    Citas pendientes o confirmadas del especialista a partir de ``desde``
+    (por defecto manana) que no caben en el horario ``compilado``. Sirve para
+    avisar cuantas citas se darian de baja antes de guardar un horario nuevo.
+    """
+    if desde is None:
+        desde = timezone.localdate() + timedelta(days=1)
+    return (Cita.objects.filter(id_especialista_id=id_especialista, fecha__gte=desde, estatus__in=["P", "C"])
+            .filter(filtro_fuera_de_horario(compilado)))
+
+
+def dar_de_baja_fuera_de_horario(especialista, desde: date | None = None) -> int:
+    """
+    Da de baja (estatus ``B``) las citas pendientes o confirmadas a partir de
+    ``desde`` (por defecto manana) que ya no caben en el horario actual del
+    especialista, con un solo ``update()``. Como ``update()`` no dispara las
+    senales, despues se regeneran los mapas de ocupacion de esos dias.
+    Regresa el numero de citas dadas de baja. Debe llamarse dentro de la misma
+    transaccion en la que se guarda el horario.
+    """
+    if desde is None:
+        desde = timezone.localdate() + timedelta(days=1)
+    bajas = (citas_fuera_de_horario(especialista.id, obtener_horario(especialista), desde)
+             .update(estatus="B", actualizada=timezone.now()))
+    if bajas:
+        ocupacion.reconstruir(especialista.id, desde)
+    return bajas
+
+
+__all__ = [
+    "ReservaError",
+    "leer_fecha",
+    "leer_hora",
+    "error_de_horario",
+    "validar_horario",
+    "citas_del_paciente",
+    "choque_de_dia",
+    "buscar_choque",
+    "reservar_cita",
+    "reservar_serie",
+    "filtro_fuera_de_horario",
+    "citas_fuera_de_horario",
+    "dar_de_baja_fuera_de_horario",
+]
@@ -8,8 +8,14 @@ from django.views import View
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
 from django.http.response import JsonResponse
 from moduloPrincipal.models.__init__ import *
+from moduloPrincipal.utils.horario import obtener_horario, horario_por_dia
+from moduloPrincipal.utils.demanda import curvas_de_demanda, rango_por_defecto, resumen_de_demanda
+from moduloPrincipal.utils.exportar import COLUMNAS_PACIENTES, filas_de_pacientes, lineas_csv
+from moduloPrincipal.utils.metricas import edad_en_bd
+from moduloPrincipal.utils.paginacion import pagina_keyset
 
 # Clase para enviar al administrador a su ventana de inicio
 class InicioAdmin(View):
@@ -24,21 +30,33 @@ class InicioAdmin(View):
 # Clase para listar todos los pacientes para el administrador
 class Pacientes_Admin(View):
 
+    # Pacientes por pagina de cada lista (activos y dados de baja)
+    PACIENTES_POR_PAGINA = 50
+
     @method_decorator(staff_member_required(login_url='login'),
                       name='dispatch')  # Decorador para que solo las cuentas de superusuario puedan accedera esta api
     def get(self, request, id=0):
-        # Se obtienen todos los pacientes
-        pacientes = Paciente.objects.all()
-        # Se les agrega la edad
-        pacientes_con_edad = []
-        for paciente in pacientes:
-            fecha_act = date.today()
-            fecha_na = paciente.id_usuario.fecha_nacimiento
-            edad = fecha_act.year - fecha_na.year - ((fecha_act.month, fecha_act.day) < (fecha_na.month, fecha_na.day))
-            pacientes_con_edad.append({'paciente': paciente, 'edad': edad})
-        data = {'pacientes': pacientes_con_edad, 'user_type': 'admin'}
-
-        return render(request, 'ventanas_admin/listar_pacientes.html', {'pacientes': pacientes_con_edad})
+        # Con formato=csv se exportan todos los pacientes (o solo los de un estatus) por partes
+        if request.GET.get('formato') == 'csv':
+            pacientes = Paciente.objects.all()
+            if request.GET.get('estatus'):
+                pacientes = pacientes.filter(estatus=request.GET['estatus'])
+            response = StreamingHttpResponse(lineas_csv(COLUMNAS_PACIENTES, filas_de_pacientes(pacientes)),
+                                             content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = 'attachment; filename="pacientes.csv"'
+            return response
+
+        # Se obtienen los pacientes de la pagina con su usuario y la edad calculada en la base de datos
+        pacientes = Paciente.objects.select_related('id_usuario__id_usuario').annotate(edad=edad_en_bd())
+        activos, siguiente_activos = pagina_keyset(pacientes.filter(estatus='1'), ('id',),
+                                                   request.GET.get('despues_activos'), self.PACIENTES_POR_PAGINA)
+        baja, siguiente_baja = pagina_keyset(pacientes.filter(estatus='0'), ('id',),
+                                             request.GET.get('despues_baja'), self.PACIENTES_POR_PAGINA)
+
+        return render(request, 'ventanas_admin/listar_pacientes.html',
+                      {'activos': activos, 'baja': baja, 'siguiente_activos': siguiente_activos,
+                       'siguiente_baja': siguiente_baja,
+                       'lista': 'baja' if request.GET.get('lista') == 'baja' else 'activos'})
 
     # Metodo put para actualizar el estatus de un paciente
     @method_decorator(staff_member_required(login_url='login'),
@@ -75,6 +93,30 @@ class Especialistas_Admin(View):
         except Solicitudes.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Especialista no encontrado'})
 
+# Clase para que el administrador consulte la demanda historica de citas de cada especialista por dia y horario
+class Demanda_citas_admin(View):
+    # Dias maximos de historial por consulta
+    MAX_DIAS = 731
+
+    @method_decorator(staff_member_required(login_url='login'),
+                      name='dispatch')  # Decorador para que solo las cuentas de superusuario puedan acceder a esta api
+    def get(self, request):
+        desde, hasta = rango_por_defecto()
+        try:
+            if request.GET.get('desde'):
+                desde = date.fromisoformat(request.GET['desde'])
+            if request.GET.get('hasta'):
+                hasta = date.fromisoformat(request.GET['hasta'])
+            especialista = int(request.GET['especialista']) if request.GET.get('especialista') else None
+        except ValueError:
+            return JsonResponse({'Error': True, 'Descripcion': 'Parametros no validos'}, status=400)
+        if hasta < desde or (hasta - desde).days >= self.MAX_DIAS:
+            return JsonResponse({'Error': True, 'Descripcion': 'El rango de fechas no es valido'}, status=400)
+
+        curvas = curvas_de_demanda(desde, hasta, [especialista] if especialista is not None else None)
+        return JsonResponse({'desde': desde.isoformat(), 'hasta': hasta.isoformat(),
+                             'especialistas': resumen_de_demanda(curvas)})
+
 # Clase para visualizar la informacion de especialista por parte del administrador
 class Informacion_especialista_admin(View):
 
@@ -84,11 +126,8 @@ class Informacion_especialista_admin(View):
         aux_user = User.objects.get(id=id_user)
         aux_usuario = Usuario.objects.get(id=id_usuario)
         aux_especialista = Especialista.objects.get(id=id_especialista)
-        # Se divide el horario por dias
-        arreglo_horario = (aux_especialista.horario).split(";")
-        json_horario = {"Lunes": arreglo_horario[0], "Martes": arreglo_horario[1], "Miercoles": arreglo_horario[2],
-                        "Jueves": arreglo_horario[3], "Viernes": arreglo_horario[4], "Sabado": arreglo_horario[5],
-                        "Domingo": arreglo_horario[6]}
+        # Se obtiene el horario de cada dia a partir del horario compilado
+        json_horario = horario_por_dia(obtener_horario(aux_especialista))
         datos = {'usuario': aux_usuario, 'nombre': aux_user.first_name + " " + aux_user.last_name,
                  'correo': aux_user.email, 'info_ad': aux_especialista.info_ad, 'cedula': aux_especialista.cedula,
                  'especialidad': aux_especialista.id_especialidad.nombre, 'horario': json_horario}
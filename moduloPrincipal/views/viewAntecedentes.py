@@ -0,0 +1,48 @@
+from django.views import View
+from django.contrib.auth.decorators import login_required
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.http.response import JsonResponse
+import json
+from moduloPrincipal.models.__init__ import *
+from moduloPrincipal.utils.expediente import registrar_antecedentes
+
+# Clase para registrar de una sola vez varios antecedentes del perfil clinico (toxicomanias, patologicos,
+# quirurjicos, transfusionales, alergias y vacunas) en un JSON
+class Registrar_Antecedentes(View):
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+    @method_decorator(login_required(login_url='login'), name='dispatch')
+    def post(self, request):
+        try:
+            jd = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'Error': True, 'Descripcion': 'El cuerpo debe ser un JSON'}, status=400)
+        if not isinstance(jd, dict):
+            return JsonResponse({'Error': True, 'Descripcion': 'El cuerpo debe ser un JSON'}, status=400)
+
+        # El paciente registra sus propios antecedentes, el especialista los de un paciente que le acepto una solicitud
+        actor = request.actor
+        if actor.paciente:
+            id_paciente = actor.paciente.id
+        elif actor.especialista:
+            try:
+                id_paciente = int(jd.get('id_paciente'))
+            except (TypeError, ValueError):
+                return JsonResponse({'Error': True, 'Descripcion': 'Falta el paciente'}, status=400)
+            if not Solicitudes.objects.filter(id_paciente_id=id_paciente, id_especialista_id=actor.especialista.id,
+                                              estatus='A').exists():
+                return JsonResponse({'Error': True, 'Descripcion': 'No tienes acceso al perfil de este paciente'},
+                                    status=403)
+        else:
+            return JsonResponse({'Error': True, 'Descripcion': 'No tienes acceso al perfil de este paciente'},
+                                status=403)
+
+        errores = registrar_antecedentes(id_paciente, jd)
+        if errores:
+            return JsonResponse({'Error': True, 'Descripcion': 'Hay antecedentes con datos no validos',
+                                 'Errores': errores}, status=400)
+        return JsonResponse({'Success': True})
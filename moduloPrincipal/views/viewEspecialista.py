@@ -1,7 +1,8 @@
 from django.shortcuts import get_object_or_404, render, redirect
 from django.views import View
+from django.db import transaction
 from django.core.paginator import Paginator
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from datetime import date, timezone, timedelta, datetime
@@ -11,9 +12,20 @@ import json
 from moduloNutricion.urls import nutriologo
 from django.forms.models import model_to_dict
 
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from moduloNutricion.models.modelMenuBien import Menu_Bien
 from moduloPrincipal.models.__init__ import *
+from moduloPrincipal.utils.horario import obtener_horario, horario_por_dia
+from moduloPrincipal.utils.paginacion import pagina_keyset
+from moduloPrincipal.utils.expediente import contexto_expediente, expediente_de
+from moduloPrincipal.utils.historial import ORDEN_HISTORIAL, consulta_a_json, consultas_del_paciente
+from moduloPrincipal.utils.pacientes import ORDEN_PACIENTES, buscar_pacientes, pacientes_del_especialista
+from moduloPrincipal.utils.metricas import EDAD_MAXIMA
+from moduloPrincipal.utils.calendario import (citas_del_calendario, especialista_de_token, generar_calendario,
+                                              token_calendario, version_calendario)
 from moduloPrincipal.decorators import guest_or_login_required
 
 # Clase para enviar al especialista a su ventana de inicio
@@ -29,9 +41,7 @@ class InicioEspecialista(View):
             return render(request, 'inicio.html',{"user_type": 'P'})
         
         if (request.user.is_staff == 0):
-            aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-
-            if (aux_usuario.tipo == 'P'):
+            if (request.actor.tipo == 'P'):
                 return render(request, 'inicio.html',{"user_type": 'P'})
 
             return render(request, 'inicio.html',{"user_type": 'E'})
@@ -42,28 +52,35 @@ class InicioEspecialista(View):
 # Clase para listar los pacientes de un especialista
 class Pacientes(View):
 
+    # Pacientes por pagina de cada lista (solicitudes pendientes y confirmados)
+    PACIENTES_POR_PAGINA = 50
+
     @method_decorator(login_required, name='dispatch')
     def get(self, request, id=0):
         # Validacion del tipo de usuario
         if (request.user.is_staff == 0):
-            aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-            if (aux_usuario.tipo == 'P'):
+            if (request.actor.tipo == 'P'):
                 return render(request, 'inicio.html',{"user_type": 'P'})
 
-            aux_especialista = Especialista.objects.get(id_usuario_id=aux_usuario.id)
-            # Se obtienen las solicitudes del especialista
-            solicitudes = Solicitudes.objects.filter(id_especialista=aux_especialista.id)
-
-            # Se calcula la edad de los pacientes para poder mostrarla
-            pacientes_con_edad = []
-            for solicitud in solicitudes:
-                fecha_act = date.today()
-                fecha_na = solicitud.id_paciente.id_usuario.fecha_nacimiento
-                edad = fecha_act.year - fecha_na.year - (
-                            (fecha_act.month, fecha_act.day) < (fecha_na.month, fecha_na.day))
-                pacientes_con_edad.append({'solicitud': solicitud, 'edad': edad})
-
-            return render(request, 'ventanas_especialista/listar_pacientes.html', {'pacientes': pacientes_con_edad})
+            aux_especialista = request.actor.especialista
+            # Se obtienen las solicitudes del especialista con el paciente y su edad calculada en la base de datos,
+            # solo de pacientes activos y filtradas por nombre si se uso la busqueda
+            texto = request.GET.get('q', '').strip()
+            solicitudes = buscar_pacientes(pacientes_del_especialista(aux_especialista.id), texto=texto).filter(
+                id_paciente__estatus='1')
+
+            pendientes, siguiente_pendientes = pagina_keyset(solicitudes.filter(estatus='P'), ORDEN_PACIENTES,
+                                                             request.GET.get('despues_pendientes'),
+                                                             self.PACIENTES_POR_PAGINA)
+            confirmados, siguiente_confirmados = pagina_keyset(solicitudes.filter(estatus='A'), ORDEN_PACIENTES,
+                                                               request.GET.get('despues_confirmados'),
+                                                               self.PACIENTES_POR_PAGINA)
+
+            return render(request, 'ventanas_especialista/listar_pacientes.html',
+                          {'pendientes': pendientes, 'confirmados': confirmados,
+                           'siguiente_pendientes': siguiente_pendientes,
+                           'siguiente_confirmados': siguiente_confirmados, 'q': texto,
+                           'lista': 'confirmados' if request.GET.get('lista') == 'confirmados' else 'pendientes'})
 
         else:
             return render(request, 'inicio.html',{"user_type": 'admin'})
@@ -78,6 +95,46 @@ class Pacientes(View):
             return JsonResponse({'success': True})
         except Solicitudes.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Solicitud no encontrada'})
+# Clase para que el especialista busque entre sus pacientes (nombre o usuario, edad, estatus de la solicitud y patologia)
+class Buscar_pacientes(View):
+
+    # Pacientes por pagina de la busqueda
+    PACIENTES_POR_PAGINA = 25
+
+    @method_decorator(login_required(login_url='login'), name='dispatch')
+    def get(self, request):
+        aux_especialista = request.actor.especialista
+        if aux_especialista is None:
+            return JsonResponse({'Error': True, 'Descripcion': 'Solo los especialistas pueden buscar pacientes'},
+                                status=403)
+        try:
+            edad_min = int(request.GET['edad_min']) if request.GET.get('edad_min') else None
+            edad_max = int(request.GET['edad_max']) if request.GET.get('edad_max') else None
+        except ValueError:
+            return JsonResponse({'Error': True, 'Descripcion': 'La edad debe ser un numero'}, status=400)
+        if any(edad is not None and not 0 <= edad <= EDAD_MAXIMA for edad in (edad_min, edad_max)):
+            return JsonResponse({'Error': True, 'Descripcion': 'La edad debe estar entre 0 y ' + str(EDAD_MAXIMA)},
+                                status=400)
+
+        hoy = date.today()
+        solicitudes = buscar_pacientes(pacientes_del_especialista(aux_especialista.id, hoy),
+                                       texto=request.GET.get('q', ''), edad_min=edad_min, edad_max=edad_max,
+                                       estatus=request.GET.get('estatus'), patologia=request.GET.get('patologia', ''),
+                                       hoy=hoy)
+        solicitudes, siguiente_pagina = pagina_keyset(solicitudes, ORDEN_PACIENTES, request.GET.get('despues'),
+                                                      self.PACIENTES_POR_PAGINA)
+        pacientes = []
+        for solicitud in solicitudes:
+            user = solicitud.id_paciente.id_usuario.id_usuario
+            pacientes.append({'id_paciente': solicitud.id_paciente_id,
+                              'id_solicitud': solicitud.id,
+                              'nombre': (user.first_name + ' ' + user.last_name).strip(),
+                              'username': user.username,
+                              'edad': solicitud.edad,
+                              'estatus': solicitud.estatus,
+                              'estatus_paciente': solicitud.id_paciente.estatus})
+        return JsonResponse({'pacientes': pacientes, 'siguiente_pagina': siguiente_pagina})
+
 # Clase para visualizar la ventana con los especialista que esta afuera de la pagina, antes de iniciar sesion
 
 class Especialistas_Inicio(View):
@@ -145,16 +202,11 @@ class Configuracion_especialista(View):
 
         # Validacion de tipos de usuario
         if (request.user.is_staff == 0):
-            aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-            if (aux_usuario.tipo == 'E'):
-                aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-                aux_especialista = Especialista.objects.get(id_usuario_id=aux_usuario.id)
-                # Se obtiene el horario y se divide en base al caracter ; para obtenener los datos de cada dia individualmente
-                arreglo_horario = (aux_especialista.horario).split(";")
-                json_horario = {"Lunes": arreglo_horario[0], "Martes": arreglo_horario[1],
-                                "Miercoles": arreglo_horario[2], "Jueves": arreglo_horario[3],
-                                "Viernes": arreglo_horario[4], "Sabado": arreglo_horario[5],
-                                "Domingo": arreglo_horario[6]}
+            if (request.actor.tipo == 'E'):
+                aux_usuario = request.actor.usuario
+                aux_especialista = request.actor.especialista
+                # Se obtiene el horario de cada dia a partir del horario compilado
+                json_horario = horario_por_dia(obtener_horario(aux_especialista))
                 # Se muestra un mensaje u otro dependiendo de si los cambios se realizaron correctamente
                 if message1 == "error" and message2 == "exito":
                     datos = {'usuario': aux_usuario, 'nombre': request.user.username, 'correo': request.user.email,
@@ -185,10 +237,8 @@ class CambiarUsernameEspecialista(View):
     @method_decorator(login_required, name='dispatch')
     def post(self, request):
 
-        # Se obtiene el usuario de la tabla usuarios
-        aux_user = Usuario.objects.get(id_usuario_id=request.user.id)
         # Se obtiene el especialista y se actualiza la info_ad sin requerir validaciones
-        aux_especialista = Especialista.objects.get(id_usuario_id=aux_user.id)
+        aux_especialista = request.actor.especialista
         aux_especialista.info_ad = request.POST.get('info_ad')
         aux_especialista.save()
 
@@ -209,9 +259,10 @@ class CambiarUsernameEspecialista(View):
 class ConsultaMedica(View):
     @method_decorator(login_required(login_url='login'), name='dispatch')
     def get(self, request, id):
-        aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-        aux_especialista = Especialista.objects.get(id_usuario_id=aux_usuario.id)
-        especialidad = Especialidades.objects.get(id=aux_especialista.id_especialidad.id)
+        aux_especialista = request.actor.especialista
+        if aux_especialista is None:
+            return redirect('inicio_especialista')
+        especialidad = aux_especialista.id_especialidad
         campos_excluir = ['_state','id', 'nombre', 'descripcion']
         especialidadJson = {key: value for key, value in vars(especialidad).items() if key not in campos_excluir and value == 'si'}
         #print(especialidadJson)
@@ -221,10 +272,8 @@ class ConsultaMedica(View):
         if cita.estatus != 'C':
             return redirect('listarcitasespecialista')
         # Se valida que el la cita pertenezca al especialista
-        aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-        aux_especialista = Especialista.objects.get(id_usuario_id=aux_usuario.id)
         #JEFE REVISE ESTE IF, NOSOTROS NO LE ENCONTRAMOS SENTIDO Y EN NUESTRAS PRUEBAS NI SIQUIERA ENTRA A ESTE BLOQUE DE CODIGO
-        if aux_especialista.id != cita.id_especialista.id:
+        if aux_especialista.id != cita.id_especialista_id:
             # se valida que el especialista no sea enfermero, en ese caso si puede acceder, de lo contrario no
             if not (
                     aux_especialista.id_especialidad.exploracion_fisica == "si" and aux_especialista.id_especialidad.diagnostico_tratamiento == "no"):
@@ -233,34 +282,11 @@ class ConsultaMedica(View):
                 pre_llenado = 'si'
         # Se obtienen los datos del usuario para mostrarlos en la interfaz
         #print("Es el mismo")
-        paciente_obj = get_object_or_404(Paciente, id=cita.id_paciente.id)
-        paciente_dict = model_to_dict(paciente_obj)
-        paciente_json = json.dumps(paciente_dict)
-        paciente = Paciente.objects.get(id=cita.id_paciente.id)
-        fecha_act = date.today()
-        fecha_na = paciente.id_usuario.fecha_nacimiento
-        edad = fecha_act.year - fecha_na.year - ((fecha_act.month, fecha_act.day) < (fecha_na.month, fecha_na.day))
-        peso = paciente.peso
-        talla = paciente.talla
-        if talla != 0:
-            imc = peso / (talla ** 2)
-            imc = round(imc, 2)
-        else:
-            imc = 0
-        creatinina = paciente.creatinina
-        if creatinina != 0:
-            if paciente.genero == "M":
-                fgm = (((140 - edad) * peso) / (72 * creatinina))
-            else:
-                fgm = (((140 - edad) * peso) / (72 * creatinina)) * 0.85
-        else:
-            fgm = 0
-        AP_toxi = Toxicomania.objects.filter(id_paciente=paciente.id)
-        AP_qui = Ant_quirurjicos.objects.filter(id_paciente=paciente.id)
-        AP_tran = Ant_transfusionales.objects.filter(id_paciente=paciente.id)
-        AP_al = Alergias.objects.filter(id_paciente=paciente.id)
-        AP_vac = Vacunacion.objects.filter(id_paciente=paciente.id)
-        AP = Ant_Patologicos.objects.filter(id_paciente=paciente.id)
+        try:
+            paciente = expediente_de(cita.id_paciente_id)
+        except Paciente.DoesNotExist:
+            raise Http404('Paciente no encontrado')
+        paciente_json = json.dumps(model_to_dict(paciente))
 
         #JEFE TAMPOCO AQUI TIENE SENTIDO ESTO, NUNCA SE ENTRA AL IF, SIEMPRE ES AL ELSE, CREO QUE POR FUNCIONES QUE ELLOS PENSABAN IMPLEMENTAR
         #EN EL FUTURO
@@ -276,196 +302,187 @@ class ConsultaMedica(View):
         #JEFE, ESTE ES EL CODIGO REALMENTE FUNCIONAL DE LA VISTA
         else:
             #print("no hay prelleno")
-            return render(request, 'layouts/consulta.html',
-                          {'paciente_json':paciente_json, 'paciente': paciente, 'edad': edad, 'imc': imc, 'fgm': fgm, 'AP_toxi': AP_toxi,
-                           'AP_qui': AP_qui, 'AP_tran': AP_tran, 'AP_vac': AP_vac, 'AP': AP, 'AP_al': AP_al,
-                           'ID_cita': id, "cita": cita, "pre_llenado": pre_llenado, 'especialidadJson': especialidadJson})
+            contexto = contexto_expediente(paciente, nombres_consulta=True, redondear_fgm=False)
+            contexto.update({'paciente_json': paciente_json, 'ID_cita': id, "cita": cita, "pre_llenado": pre_llenado,
+                             'especialidadJson': especialidadJson})
+            return render(request, 'layouts/consulta.html', contexto)
 
     # Funcion POST para realizar el registro de la consulta
     @method_decorator(login_required, name='dispatch')
     def post(self, request, id):
-        cita = Cita.objects.get(id=id)
-
-        # Se valida que si se haya registrado exploracion fisica
-        if 'glucosa' in request.POST:
-            # TABLA DE EXPLORACION FISICA
-            paciente = Paciente.objects.get(id=cita.id_paciente.id)
-            peso = paciente.peso
-            talla = paciente.talla
-            imc = request.POST.get('imc')
-            creatinina = request.POST.get('creatinina')
-            filtracion_glomerular = request.POST.get('filtracion_glomerular')
-            glucosa = request.POST.get('glucosa')
-            TA_sistolica = request.POST.get('tasis')
-            TA_diastolica = request.POST.get('tadis')
-            frecuencia_cardiaca = request.POST.get('frec')
-            frecuencia_respiratoria = request.POST.get('frer')
-            temperatura = request.POST.get('temp')
-            descripcion_EXP = request.POST.get('desc')
-            # GUARDAR TABLA
-            exp_f = Exploracion_fisica.objects.create(id_cita=cita, peso=peso, talla=talla, glucosa=glucosa,
-                                                      TA_sistolica=TA_sistolica, TA_diastolica=TA_diastolica,
-                                                      frecuencia_cardiaca=frecuencia_cardiaca,
-                                                      frecuencia_respiratoria=frecuencia_respiratoria,
-                                                      temperatura=temperatura, descripcion=descripcion_EXP, imc=imc,
-                                                      creatinina=creatinina,
-                                                      filtracion_glomerular=filtracion_glomerular)
-            exp_f.save()
-            # SE ACTUALIZA EL VALOR DE CRATININA DEL PACIENTE
-            paciente.creatinina = creatinina
-            paciente.save()
-
-        if 'diagnostico' in request.POST:
-            # TABLA DIAGNOSTICO
-            descripcion_DIA = request.POST.get('diagnostico')
-
-            # TABLA TRATAMIENTO FARMACOLOGICO
-            tipo_TRA1 = False
-            descripcion_TRA1 = request.POST.get('tratamiento_far')
-
-            # TABLA TRATAMIENTO NO FARMACOLOGICIO
-            tipo_TRA2 = True
-            descripcion_TRA2 = request.POST.get('tratamiento_nfar')
-
-            diag = Diagnostico.objects.create(id_cita=cita, descripcion=descripcion_DIA, ruta_doc='')
-            diag.save()
-            tra1 = Tratamiento.objects.create(id_cita=cita, tipo=tipo_TRA1, descripcion=descripcion_TRA1)
-            tra1.save()
-            tra2 = Tratamiento.objects.create(id_cita=cita, tipo=tipo_TRA2, descripcion=descripcion_TRA2)
-            tra2.save()
-
-        if 'desaVerduras' in request.POST:
-
-            #Inputs Desayuno
-            desaVerduras = request.POST.get('desaVerduras')
-            desaFrutas = request.POST.get('desaFrutas')
-            desaCereales = request.POST.get('desaCereales')
-            desaLeguminosas = request.POST.get('desaLeguminosas')
-            desaOrigen = request.POST.get('desaOrigen')
-            desaLeche = request.POST.get('desaLeche')
-            desaGrasas = request.POST.get('desaGrasas')
-            desaAzucares = request.POST.get('desaAzucares')
-
-            #Inputs Comida
-            comiVerduras = request.POST.get('comiVerduras')
-            comiFrutas = request.POST.get('comiFrutas')
-            comiCereales = request.POST.get('comiCereales')
-            comiLeguminosas = request.POST.get('comiLeguminosas')
-            comiOrigen = request.POST.get('comiOrigen')
-            comiLeche = request.POST.get('comiLeche')
-            comiGrasas = request.POST.get('comiGrasas')
-            comiAzucares = request.POST.get('comiAzucares')
-
-            #Inputs Cena
-            cenaVerduras = request.POST.get('cenaVerduras')
-            cenaFrutas = request.POST.get('cenaFrutas')
-            cenaCereales = request.POST.get('cenaCereales')
-            cenaLeguminosas = request.POST.get('cenaLeguminosas')
-            cenaOrigen = request.POST.get('cenaOrigen')
-            cenaLeche = request.POST.get('cenaLeche')
-            cenaGrasas = request.POST.get('cenaGrasas')
-            cenaAzucares = request.POST.get('cenaAzucares')
-
-            #Inputs Colacion
-            colaVerduras = request.POST.get('colaVerduras')
-            colaFrutas = request.POST.get('colaFrutas')
-            colaCereales = request.POST.get('colaCereales')
-            colaLeguminosas = request.POST.get('colaLeguminosas')
-            colaOrigen = request.POST.get('colaOrigen')
-            colaLeche = request.POST.get('colaLeche')
-            colaGrasas = request.POST.get('colaGrasas')
-            colaAzucares = request.POST.get('colaAzucares')
-
-            #Inputs Colacion 2
-            colaVerduras2 = request.POST.get('colaVerduras2')
-            colaFrutas2 = request.POST.get('colaFrutas2')
-            colaCereales2 = request.POST.get('colaCereales2')
-            colaLeguminosas2 = request.POST.get('colaLeguminosas2')
-            colaOrigen2 = request.POST.get('colaOrigen2')
-            colaLeche2 = request.POST.get('colaLeche2')
-            colaGrasas2 = request.POST.get('colaGrasas2')
-            colaAzucares2 = request.POST.get('colaAzucares2')
-
-            #recomendacion
-            recomendacion = request.POST.get('reco')
-
-            menu = {
-
-                'desayuno':{
-                    'verduras': desaVerduras,
-                    'frutas': desaFrutas,
-                    'cereales': desaCereales,
-                    'leguminosas': desaLeguminosas,
-                    'origen': desaOrigen,
-                    'leche': desaLeche,
-                    'grasas': desaGrasas,
-                    'azucares': desaAzucares
-
-                },
-
-                'comida':{
-                    'verduras': comiVerduras,
-                    'frutas': comiFrutas,
-                    'cereales': comiCereales,
-                    'leguminosas': comiLeguminosas,
-                    'origen': comiOrigen,
-                    'leche': comiLeche,
-                    'grasas': comiGrasas,
-                    'azucares': comiAzucares
-
-                },
-
-                'cena':{
-                    'verduras': cenaVerduras,
-                    'frutas': cenaFrutas,
-                    'cereales': cenaCereales,
-                    'leguminosas': cenaLeguminosas,
-                    'origen': cenaOrigen,
-                    'leche': cenaLeche,
-                    'grasas': cenaGrasas,
-                    'azucares': cenaAzucares
-
-                },
-
-                'colacion':{
-                    'verduras': colaVerduras,
-                    'frutas': colaFrutas,
-                    'cereales': colaCereales,
-                    'leguminosas': colaLeguminosas,
-                    'origen': colaOrigen,
-                    'leche': colaLeche,
-                    'grasas': colaGrasas,
-                    'azucares': colaAzucares
-
-                },
-
-                 'colacion2':{
-                    'verduras': colaVerduras2,
-                    'frutas': colaFrutas2,
-                    'cereales': colaCereales2,
-                    'leguminosas': colaLeguminosas2,
-                    'origen': colaOrigen2,
-                    'leche': colaLeche2,
-                    'grasas': colaGrasas2,
-                    'azucares': colaAzucares2
-                },
-                 'recomendacion': recomendacion
-            }
-            paciente = Paciente.objects.get(id=cita.id_paciente.id)
-            aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-            aux_especialista = Especialista.objects.get(id_usuario_id=aux_usuario.id)
-            menuString = json.dumps(menu)
-            #print(menuString)
-            auxMenuBien=Menu_Bien.objects.create(id_cita=cita,especialista=aux_especialista,paciente=paciente,menu=menuString)
-            auxMenuBien.save()
-        # solo se se cambia el estatus de la cita cuando no se esta pre llenando por una enfermera
-        #if request.POST.get('pre_llenado') == "no":
-        cita.estatus = 'A'
-        cita.save()
+        if request.actor.especialista is None:
+            return redirect('inicio_especialista')
+        # Toda la consulta se guarda en una transaccion: o se registra completa o no se registra nada
+        with transaction.atomic():
+            cita = get_object_or_404(Cita.objects.select_for_update().select_related('id_paciente'), id=id)
+            # Una consulta ya registrada (por ejemplo si se envia dos veces el formulario) no se vuelve a guardar
+            if cita.estatus != 'C':
+                return redirect('listarcitasespecialista')
+            paciente = cita.id_paciente
+
+            # Se valida que si se haya registrado exploracion fisica
+            if 'glucosa' in request.POST:
+                # TABLA DE EXPLORACION FISICA
+                creatinina = request.POST.get('creatinina')
+                Exploracion_fisica.objects.create(id_cita=cita, peso=paciente.peso, talla=paciente.talla,
+                                                  glucosa=request.POST.get('glucosa'),
+                                                  TA_sistolica=request.POST.get('tasis'),
+                                                  TA_diastolica=request.POST.get('tadis'),
+                                                  frecuencia_cardiaca=request.POST.get('frec'),
+                                                  frecuencia_respiratoria=request.POST.get('frer'),
+                                                  temperatura=request.POST.get('temp'),
+                                                  descripcion=request.POST.get('desc'),
+                                                  imc=request.POST.get('imc'), creatinina=creatinina,
+                                                  filtracion_glomerular=request.POST.get('filtracion_glomerular'))
+                # SE ACTUALIZA EL VALOR DE CRATININA DEL PACIENTE
+                paciente.creatinina = creatinina
+                paciente.save(update_fields=['creatinina'])
+
+            if 'diagnostico' in request.POST:
+                # TABLA DIAGNOSTICO
+                Diagnostico.objects.create(id_cita=cita, descripcion=request.POST.get('diagnostico'), ruta_doc='')
+                # TABLAS DE TRATAMIENTO FARMACOLOGICO (tipo False) Y NO FARMACOLOGICO (tipo True), en un solo INSERT
+                Tratamiento.objects.bulk_create([
+                    Tratamiento(id_cita=cita, tipo=False, descripcion=request.POST.get('tratamiento_far')),
+                    Tratamiento(id_cita=cita, tipo=True, descripcion=request.POST.get('tratamiento_nfar')),
+                ])
+
+            menu = self.menu_de_consulta(request.POST)
+            if menu is not None:
+                Menu_Bien.objects.create(id_cita=cita, especialista=request.actor.especialista, paciente=paciente,
+                                         menu=json.dumps(menu))
+            # solo se se cambia el estatus de la cita cuando no se esta pre llenando por una enfermera
+            #if request.POST.get('pre_llenado') == "no":
+            cita.estatus = 'A'
+            cita.save(update_fields=['estatus', 'actualizada'])
 
         # REDIRIGE AL LISTADO DE CITAS
         return redirect('listarcitasespecialista')
 
+    # Menu del plan de alimentacion capturado en la consulta, o None si no se capturo
+    @staticmethod
+    def menu_de_consulta(datos):
+        if 'desaVerduras' not in datos:
+            return None
+
+        #Inputs Desayuno
+        desaVerduras = datos.get('desaVerduras')
+        desaFrutas = datos.get('desaFrutas')
+        desaCereales = datos.get('desaCereales')
+        desaLeguminosas = datos.get('desaLeguminosas')
+        desaOrigen = datos.get('desaOrigen')
+        desaLeche = datos.get('desaLeche')
+        desaGrasas = datos.get('desaGrasas')
+        desaAzucares = datos.get('desaAzucares')
+
+        #Inputs Comida
+        comiVerduras = datos.get('comiVerduras')
+        comiFrutas = datos.get('comiFrutas')
+        comiCereales = datos.get('comiCereales')
+        comiLeguminosas = datos.get('comiLeguminosas')
+        comiOrigen = datos.get('comiOrigen')
+        comiLeche = datos.get('comiLeche')
+        comiGrasas = datos.get('comiGrasas')
+        comiAzucares = datos.get('comiAzucares')
+
+        #Inputs Cena
+        cenaVerduras = datos.get('cenaVerduras')
+        cenaFrutas = datos.get('cenaFrutas')
+        cenaCereales = datos.get('cenaCereales')
+        cenaLeguminosas = datos.get('cenaLeguminosas')
+        cenaOrigen = datos.get('cenaOrigen')
+        cenaLeche = datos.get('cenaLeche')
+        cenaGrasas = datos.get('cenaGrasas')
+        cenaAzucares = datos.get('cenaAzucares')
+
+        #Inputs Colacion
+        colaVerduras = datos.get('colaVerduras')
+        colaFrutas = datos.get('colaFrutas')
+        colaCereales = datos.get('colaCereales')
+        colaLeguminosas = datos.get('colaLeguminosas')
+        colaOrigen = datos.get('colaOrigen')
+        colaLeche = datos.get('colaLeche')
+        colaGrasas = datos.get('colaGrasas')
+        colaAzucares = datos.get('colaAzucares')
+
+        #Inputs Colacion 2
+        colaVerduras2 = datos.get('colaVerduras2')
+        colaFrutas2 = datos.get('colaFrutas2')
+        colaCereales2 = datos.get('colaCereales2')
+        colaLeguminosas2 = datos.get('colaLeguminosas2')
+        colaOrigen2 = datos.get('colaOrigen2')
+        colaLeche2 = datos.get('colaLeche2')
+        colaGrasas2 = datos.get('colaGrasas2')
+        colaAzucares2 = datos.get('colaAzucares2')
+
+        #recomendacion
+        recomendacion = datos.get('reco')
+
+        menu = {
+
+            'desayuno':{
+                'verduras': desaVerduras,
+                'frutas': desaFrutas,
+                'cereales': desaCereales,
+                'leguminosas': desaLeguminosas,
+                'origen': desaOrigen,
+                'leche': desaLeche,
+                'grasas': desaGrasas,
+                'azucares': desaAzucares
+
+            },
+
+            'comida':{
+                'verduras': comiVerduras,
+                'frutas': comiFrutas,
+                'cereales': comiCereales,
+                'leguminosas': comiLeguminosas,
+                'origen': comiOrigen,
+                'leche': comiLeche,
+                'grasas': comiGrasas,
+                'azucares': comiAzucares
+
+            },
+
+            'cena':{
+                'verduras': cenaVerduras,
+                'frutas': cenaFrutas,
+                'cereales': cenaCereales,
+                'leguminosas': cenaLeguminosas,
+                'origen': cenaOrigen,
+                'leche': cenaLeche,
+                'grasas': cenaGrasas,
+                'azucares': cenaAzucares
+
+            },
+
+            'colacion':{
+                'verduras': colaVerduras,
+                'frutas': colaFrutas,
+                'cereales': colaCereales,
+                'leguminosas': colaLeguminosas,
+                'origen': colaOrigen,
+                'leche': colaLeche,
+                'grasas': colaGrasas,
+                'azucares': colaAzucares
+
+            },
+
+             'colacion2':{
+                'verduras': colaVerduras2,
+                'frutas': colaFrutas2,
+                'cereales': colaCereales2,
+                'leguminosas': colaLeguminosas2,
+                'origen': colaOrigen2,
+                'leche': colaLeche2,
+                'grasas': colaGrasas2,
+                'azucares': colaAzucares2
+            },
+             'recomendacion': recomendacion
+        }
+        return menu
+
+
 # Clase para visualizar una consulta medica sin poder editarla
 class VisualizarConsulta(View):
     @method_decorator(login_required, name='dispatch')
@@ -476,16 +493,12 @@ class VisualizarConsulta(View):
         if cita.estatus != 'A':
             return redirect('listarcitasespecialista')
         # Se valida que el la cita pertenezca al especialista
-        aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-        aux_especialista = Especialista.objects.get(id_usuario_id=aux_usuario.id)
-        if aux_especialista.id != cita.id_especialista.id:
+        if not request.actor.especialista or request.actor.especialista.id != cita.id_especialista_id:
             return redirect('listarcitasespecialista')
 
         # Se obtienen los datos del paciente para mostrarlos en la ventana
-        paciente = Paciente.objects.get(id=cita.id_paciente.id)
-        fecha_act = date.today()
-        fecha_na = paciente.id_usuario.fecha_nacimiento
-        edad = fecha_act.year - fecha_na.year - ((fecha_act.month, fecha_act.day) < (fecha_na.month, fecha_na.day))
+        paciente = expediente_de(cita.id_paciente_id)
+        expediente = contexto_expediente(paciente, nombres_consulta=True)
         
         #Obtenemos las especialidades en SI del especialista de dicha cita
         data={}
@@ -507,17 +520,17 @@ class VisualizarConsulta(View):
         #data={'exploracionfisica': aux_explo, 'diagnostico': aux_diagno}
 
         datosPaciente={'paciente': paciente,
-                       'edad': edad,
+                       'edad': expediente['edad'],
                        'diagnostico': Diagnostico.objects.get(id_cita_id=id),
                        'tratamiento_farmacologico': Tratamiento.objects.get(id_cita_id=id, tipo=0),
                        'tratamiento_no_farmacologico': Tratamiento.objects.get(id_cita_id=id, tipo=1),
                        'cita': cita,
                        'ID_cita': cita.id,
-                       'AP_toxi': Toxicomania.objects.filter(id_paciente=paciente.id),
-                       'AP_qui': Ant_quirurjicos.objects.filter(id_paciente=paciente.id),
-                       'AP_tran': Ant_transfusionales.objects.filter(id_paciente=paciente.id),
-                       'AP_al': Alergias.objects.filter(id_paciente=paciente.id),
-                       'AP': Ant_Patologicos.objects.filter(id_paciente=paciente.id)}
+                       'AP_toxi': expediente['AP_toxi'],
+                       'AP_qui': expediente['AP_qui'],
+                       'AP_tran': expediente['AP_tran'],
+                       'AP_al': expediente['AP_al'],
+                       'AP': expediente['AP']}
 
         # SI el especialista no registra exploracion fisica, ese datos no se busca ni envia
         #if (aux_especialista.id_especialidad.exploracion_fisica == "no"):
@@ -543,6 +556,31 @@ class VisualizarConsulta(View):
                      #                                                                 "diagnostico": diagnostico,
                       #                                                                "tratamiento_farmacologico": tratamiento_farmacologico,
                        #                                                               "tratamiento_no_farmacologico": tratamiento_no_farmacologico}
+# Clase para consultar el historial de consultas de un paciente (el propio paciente o un especialista con solicitud aceptada)
+class Historial_consultas(View):
+
+    # Consultas por pagina del historial
+    CONSULTAS_POR_PAGINA = 20
+
+    @method_decorator(login_required(login_url='login'), name='dispatch')
+    def get(self, request, id_paciente):
+        actor = request.actor
+        if actor.paciente and actor.paciente.id == id_paciente:
+            consultas = consultas_del_paciente(id_paciente)
+        elif actor.especialista and Solicitudes.objects.filter(id_paciente_id=id_paciente,
+                                                               id_especialista_id=actor.especialista.id,
+                                                               estatus='A').exists():
+            # El especialista solo ve las consultas que el atendio
+            consultas = consultas_del_paciente(id_paciente, actor.especialista.id)
+        else:
+            return JsonResponse({'Error': True, 'Descripcion': 'No tienes acceso al historial de este paciente'},
+                                status=403)
+
+        consultas, siguiente_pagina = pagina_keyset(consultas, ORDEN_HISTORIAL, request.GET.get('despues'),
+                                                    self.CONSULTAS_POR_PAGINA)
+        return JsonResponse({'consultas': [consulta_a_json(cita) for cita in consultas],
+                             'siguiente_pagina': siguiente_pagina})
+
 # Clase para visualizar las citas agendadas del especialista
 class ListarCitas_Especialista(View):
 
@@ -550,38 +588,59 @@ class ListarCitas_Especialista(View):
     def dispatch(self, request, *args, **kwargs):
         return super().dispatch(request, *args, **kwargs)
 
+    # Citas por pagina de la agenda
+    CITAS_POR_PAGINA = 50
+
     @method_decorator(login_required(login_url='login'), name='dispatch')
     def get(self, request, id=0):
-        usuario_id = Usuario.objects.get(id_usuario=request.user)
-
+        aux_especialista = request.actor.especialista
+        if aux_especialista is None:
+            raise Http404('Especialista no encontrado')
+        especialidad = aux_especialista.id_especialidad
+
+        # Por defecto se listan todas las citas; con ?vista=dia o ?vista=semana se muestra la agenda de ese dia o
+        # de esa semana (de lunes a domingo)
+        vista = request.GET.get('vista')
+        if vista not in ('dia', 'semana'):
+            vista = ''
         try:
-            especialista = Especialista.objects.filter(id_usuario=usuario_id).first()
-        except Especialista.DoesNotExist:
-            especialista = None
-
-        aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-        aux_especialista = Especialista.objects.get(id_usuario=aux_usuario.id)
-        especialidad = Especialidades.objects.get(id=aux_especialista.id_especialidad.id)
-
-        # Caso de los especialistas que solo registran exploracion fisica
+            fecha = date.fromisoformat(request.GET.get('fecha', ''))
+        except ValueError:
+            fecha = date.today()
+        desde = hasta = salto = None
+        if vista == 'dia':
+            desde = hasta = fecha
+            salto = timedelta(days=1)
+        elif vista == 'semana':
+            desde = fecha - timedelta(days=fecha.weekday())
+            hasta = desde + timedelta(days=6)
+            salto = timedelta(days=7)
+
+        # Caso de los especialistas que solo registran exploracion fisica: citas confirmadas futuras de todos los especialistas
         if especialidad.exploracion_fisica == "si" and especialidad.diagnostico_tratamiento == "no":
-            fecha_actual = date.today()
-            citas = Cita.objects.filter(fecha__gt=fecha_actual, estatus='C')
-            return render(request, "ventanas_especialista/lista_citas_especialista.html", {'citas': citas})
+            citas = Cita.objects.filter(fecha__gt=date.today(), estatus='C')
         else:
-            citas = Cita.objects.filter(id_especialista=especialista.id)
-
-        for cita in citas:
-            cita.fecha = cita.fecha.strftime('%Y-%m-%d')
-        """citas =  [{'paciente':'jose',
-                    'hora': '14:00',
-                    'servicio': 'primera visita',
-                    'motivo': 'dolores de cabeza constante'},
-                    {'especialista':'antonio',
-                    'hora': '15:00',
-                    'servicio': 'primera visita',
-                    'motivo': 'dolores de cabeza constante'},]"""
-        return render(request, "ventanas_especialista/lista_citas_especialista.html", {'citas': citas})
+            citas = Cita.objects.filter(id_especialista=aux_especialista.id)
+        if vista:
+            citas = citas.filter(fecha__range=(desde, hasta))
+        citas = citas.select_related('id_paciente__id_usuario__id_usuario')
+
+        # Las citas por confirmar y las confirmadas o atendidas se paginan por separado, asi las pendientes no
+        # quedan detras de paginas de citas ya atendidas
+        orden = ('fecha', 'hora', 'id')
+        pendientes, siguiente_pendientes = pagina_keyset(citas.filter(estatus='P'), orden,
+                                                         request.GET.get('despues_pendientes'), self.CITAS_POR_PAGINA)
+        confirmadas, siguiente_confirmadas = pagina_keyset(citas.filter(estatus__in=['C', 'A']), orden,
+                                                           request.GET.get('despues_confirmadas'),
+                                                           self.CITAS_POR_PAGINA)
+        return render(request, "ventanas_especialista/lista_citas_especialista.html",
+                      {'pendientes': pendientes, 'confirmadas': confirmadas,
+                       'siguiente_pendientes': siguiente_pendientes, 'siguiente_confirmadas': siguiente_confirmadas,
+                       'lista': 'confirmadas' if request.GET.get('lista') == 'confirmadas' else 'pendientes',
+                       'vista': vista, 'fecha': fecha, 'desde': desde, 'hasta': hasta,
+                       'anterior': desde - salto if vista else None, 'siguiente': desde + salto if vista else None,
+                       'url_calendario': request.build_absolute_uri(
+                           reverse('calendario_especialista', args=[token_calendario(aux_especialista.id)]))})
 
     @method_decorator(login_required, name='dispatch')
     def put(self, request, id):
@@ -595,6 +654,41 @@ class ListarCitas_Especialista(View):
         except Cita.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Cita no encontrada'})
 
+# Version del calendario de citas (ultimo cambio y numero de citas), una sola consulta por peticion
+def version_de_calendario(request, token):
+    if not hasattr(request, '_version_calendario'):
+        id_especialista = especialista_de_token(token)
+        request._version_calendario = version_calendario(id_especialista) if id_especialista else None
+    return request._version_calendario
+
+def etag_calendario(request, token):
+    version = version_de_calendario(request, token)
+    if version is None:
+        return None
+    ultima, total = version
+    # El calendario solo incluye citas desde hace unos dias, asi que tambien cambia con la fecha
+    return '{}-{}-{}'.format(ultima.timestamp() if ultima else 0, total, date.today().isoformat())
+
+def ultima_modificacion_calendario(request, token):
+    version = version_de_calendario(request, token)
+    return version[0] if version else None
+
+# Clase para suscribirse desde una aplicacion de calendario a las citas confirmadas del especialista (sin iniciar sesion, con una url firmada)
+class Calendario_especialista(View):
+
+    @method_decorator(cache_control(private=True, max_age=300))
+    @method_decorator(condition(etag_func=etag_calendario, last_modified_func=ultima_modificacion_calendario))
+    def get(self, request, token):
+        id_especialista = especialista_de_token(token)
+        if id_especialista is None or not Especialista.objects.filter(id=id_especialista).exists():
+            raise Http404('Calendario no encontrado')
+
+        citas = citas_del_calendario(id_especialista).iterator(chunk_size=500)
+        response = StreamingHttpResponse(generar_calendario(citas, request.get_host()),
+                                         content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="citas.ics"'
+        return response
+
 # Clase para que el especialista visualice la informacion de un paciente que le mando solicitud
 class Informacion_paciente(View):
     @method_decorator(login_required, name="dispatch")
@@ -602,11 +696,9 @@ class Informacion_paciente(View):
 
         # Validacion de tipos de usaurio
         if (request.user.is_staff == 0):
-            aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-
-            if (aux_usuario.tipo == 'E'):
+            if (request.actor.tipo == 'E'):
                 # Se valida que el paciente tenga una solicitud enviada ya aceptada del especialista
-                aux_especialista = Especialista.objects.get(id_usuario_id=aux_usuario.id)
+                aux_especialista = request.actor.especialista
                 aux_solicitud = Solicitudes.objects.filter(id_paciente_id=id_paciente).filter(
                     id_especialista_id=aux_especialista.id)
 
@@ -621,46 +713,8 @@ class Informacion_paciente(View):
                     if elemento.estatus == 'A':
                         return redirect('/informacion/paciente/full/' + str(id_paciente))
 
-                paciente = Paciente.objects.get(id=id_paciente)
-                fecha_act = date.today()
-                fecha_na = paciente.id_usuario.fecha_nacimiento
-                edad = fecha_act.year - fecha_na.year - (
-                            (fecha_act.month, fecha_act.day) < (fecha_na.month, fecha_na.day))
-                peso = paciente.peso
-                talla = paciente.talla
-
-                if peso != 0:
-                    imc = peso / (talla ** 2)
-                    imc = round(imc, 2)
-                else:
-                    imc = 0
-
-                creatinina = paciente.creatinina
-                if creatinina != 0:
-                    if paciente.genero == "M":
-                        fgm = round((((140 - edad) * peso) / (72 * creatinina)))
-
-                    else:
-                        fgm = round((((140 - edad) * peso) / (72 * creatinina)) * 0.85)
-                else:
-                    fgm = 0
-
-                toxicomanias = Toxicomania.objects.filter(id_paciente=paciente.id)
-                ant_patologicos = Ant_Patologicos.objects.filter(id_paciente=paciente.id)
-                ant_quirurjicos = Ant_quirurjicos.objects.filter(id_paciente=paciente.id)
-                ant_transfusionales = Ant_transfusionales.objects.filter(id_paciente=paciente.id)
-                alergias = Alergias.objects.filter(id_paciente=paciente.id)
-                vacunas = Vacunacion.objects.filter(id_paciente=paciente.id)
-                return render(request, 'ventanas_especialista/info_paciente.html', {'paciente': paciente,
-                                                                                    'edad': edad,
-                                                                                    'imc': imc,
-                                                                                    'fgm': fgm,
-                                                                                    'toxicomanias': toxicomanias,
-                                                                                    'ant_patologicos': ant_patologicos,
-                                                                                    'ant_quirurjicos': ant_quirurjicos,
-                                                                                    'ant_transfusionales': ant_transfusionales,
-                                                                                    'alergias': alergias,
-                                                                                    'vacunas': vacunas})
+                paciente = expediente_de(id_paciente)
+                return render(request, 'ventanas_especialista/info_paciente.html', contexto_expediente(paciente))
             else:
                 return redirect('inicio_paciente')
         else:
@@ -673,11 +727,9 @@ class Informacion_Paciente_full(View):
 
         # Validacion de tipos de usaurio
         if (request.user.is_staff == 0):
-            aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
+            if (request.actor.tipo == 'E'):
 
-            if (aux_usuario.tipo == 'E'):
-
-                especialista = Especialista.objects.get(id_usuario=aux_usuario.id)
+                especialista = request.actor.especialista
                 # Se valida que el paciente tenga una solicitud enviada ya aceptada del especialista
                 aux_solicitud = Solicitudes.objects.filter(id_paciente_id=id).filter(id_especialista_id=especialista.id)
 
@@ -692,50 +744,12 @@ class Informacion_Paciente_full(View):
                     if elemento.estatus == 'P':
                         return redirect('/informacion/paciente/' + str(id))
 
-                paciente = Paciente.objects.get(id=id)
-                fecha_act = date.today()
-                fecha_na = paciente.id_usuario.fecha_nacimiento
-                edad = fecha_act.year - fecha_na.year - (
-                            (fecha_act.month, fecha_act.day) < (fecha_na.month, fecha_na.day))
-                peso = paciente.peso
-                talla = paciente.talla
-
-                if peso != 0:
-                    imc = peso / (talla ** 2)
-                    imc = round(imc, 2)
-                else:
-                    imc = 0
-
-                creatinina = paciente.creatinina
-                if creatinina != 0:
-                    if paciente.genero == "M":
-                        fgm = round(((140 - edad) * peso) / (72 * creatinina))
-
-                    else:
-                        fgm = round((((140 - edad) * peso) / (72 * creatinina)) * 0.85)
-                else:
-                    fgm = 0
-
-                toxicomanias = Toxicomania.objects.filter(id_paciente=paciente.id)
-                ant_patologicos = Ant_Patologicos.objects.filter(id_paciente=paciente.id)
-                ant_quirurjicos = Ant_quirurjicos.objects.filter(id_paciente=paciente.id)
-                ant_transfusionales = Ant_transfusionales.objects.filter(id_paciente=paciente.id)
-                alergias = Alergias.objects.filter(id_paciente=paciente.id)
-                vacunas = Vacunacion.objects.filter(id_paciente=paciente.id)
-
+                paciente = expediente_de(id)
                 citas = Cita.objects.filter(id_paciente=id).filter(id_especialista=especialista.id).exclude(
                     estatus="B").exclude(estatus="P").order_by('-fecha')
-                return render(request, 'ventanas_especialista/info_paciente_full.html', {'paciente': paciente,
-                                                                                         'edad': edad,
-                                                                                         'imc': imc,
-                                                                                         'fgm': fgm,
-                                                                                         'toxicomanias': toxicomanias,
-                                                                                         'ant_patologicos': ant_patologicos,
-                                                                                         'ant_quirurjicos': ant_quirurjicos,
-                                                                                         'ant_transfusionales': ant_transfusionales,
-                                                                                         'alergias': alergias,
-                                                                                         'vacunas': vacunas,
-                                                                                         'citas': citas})
+                contexto = contexto_expediente(paciente)
+                contexto['citas'] = citas
+                return render(request, 'ventanas_especialista/info_paciente_full.html', contexto)
             else:
                 return redirect('inicio_paciente')
         else:
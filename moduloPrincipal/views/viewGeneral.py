@@ -12,6 +12,8 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login
 from datetime import date, timezone, timedelta, datetime
 from moduloPrincipal.models.__init__ import *
+from moduloPrincipal.utils.horario import obtener_horario, horario_por_dia
+from moduloPrincipal.utils.actor import guardar_actor
 
 # Clase para inciar sesion de los distintos usuairos
 class Login(View):
@@ -30,6 +32,7 @@ class Login(View):
                 # Si es admin, unicamente guarda la sesion y redirige a la ventana de inicio
                 login(request, user)
                 request.session['user_type'] = 'admin'
+                guardar_actor(request, None)
                 return redirect('inicio_admin')
             else:
 
@@ -43,6 +46,7 @@ class Login(View):
                     else:
                         login(request, user)
                         request.session['user_type'] = 'E'
+                        guardar_actor(request, aux_usuario, especialista=aux_especialista)
                         return redirect('inicio_especialista')
                 else:
                     aux_paciente = Paciente.objects.get(id_usuario_id=aux_usuario.id)
@@ -52,6 +56,7 @@ class Login(View):
                     else:
                         login(request, user)
                         request.session['user_type'] = 'P'
+                        guardar_actor(request, aux_usuario, paciente=aux_paciente)
                         return redirect('inicio_paciente')
         else:
             datos = {'message': "Correo o contraseña incorrectos"}
@@ -177,14 +182,8 @@ class Configuracion(View):
             return render(request, 'configuracion.html', {"datos": datos})
         elif (request.user.is_staff == 0 and request.user_type == 'E'):
             aux_especialista = Especialista.objects.get(id_usuario_id=request.user.id)
-            arreglo_horario = (aux_especialista.horario).split(";")
-            json_horario = {"Lunes": arreglo_horario[0],
-                            "Martes": arreglo_horario[1],
-                            "Miercoles": arreglo_horario[2],
-                            "Jueves": arreglo_horario[3],
-                            "Viernes": arreglo_horario[4],
-                            "Sábado": arreglo_horario[5],
-                            "Domingo": arreglo_horario[6]}
+            json_horario = horario_por_dia(obtener_horario(aux_especialista),
+                                           ["Lunes", "Martes", "Miercoles", "Jueves", "Viernes", "Sábado", "Domingo"])
             if message1 == "error" and message2 == "exito":
                 datos = {'usuario': request.user.id, 'nombre': request.user.username, 'correo': request.user.email,
                          'info_ad': aux_especialista.info_ad, 'cedula': aux_especialista.cedula,
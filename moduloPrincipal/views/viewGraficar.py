@@ -1,4 +1,5 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import io
 import base64
 from matplotlib.backends.backend_agg import FigureCanvasAgg
@@ -9,6 +10,11 @@ from django.views import View
 from django.utils.decorators import method_decorator
 
 from moduloPrincipal.models.__init__ import *
+from moduloPrincipal.utils.metricas import metricas_de_pacientes
+
+# Limites de IMC de cada clasificacion (bajo peso, normal, sobrepeso, obesidad)
+LIMITES_IMC = [18.5, 25, 30]
+
 # Clases y funciones para las graficas
 # Funcion para las graficas especificas de cada usuario
 def grafica(request, id, tipo):
@@ -137,6 +143,14 @@ def grafica_EXP(request, id, tipo):
         n = ['Elevada', 'Hipertensión nivel 1', 'Hipertensión nivel 2', 'Crisis de hipertensión', 'Normal']
         t = 'Porcentaje de pacientes con problemas de la presión'
         myexplode = [0, 0, 0, 0.2, 0]
+    elif (tipo == 5):
+        # PARA CLASIFICAR A LOS PACIENTES POR SU IMC (se calcula para todos a la vez, sin recorrerlos)
+        imc = metricas_de_pacientes(Paciente.objects.filter(id__in=pacientes.values('id_paciente')))['imc']
+        con_imc = imc[imc > 0]
+        z = np.bincount(np.digitize(con_imc, LIMITES_IMC), minlength=4).tolist() + [int((imc == 0).sum())]
+        n = ['Bajo peso', 'Normal', 'Sobrepeso', 'Obesidad', 'Sin datos']
+        t = 'Porcentaje de pacientes por IMC'
+        myexplode = [0, 0, 0, 0.2, 0]
 
     # Se filtran los labels y valores para no mostrar 0
     n_filtrados = [categoria for categoria, valor in zip(n, z) if valor != 0]
@@ -2,8 +2,20 @@ from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 from django.views import View
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.http.response import JsonResponse
+from django.db import transaction
+from django.views.decorators.csrf import csrf_exempt
+from datetime import date, datetime
+import json
 from moduloPrincipal.models.__init__ import *
+from moduloPrincipal.utils.horario import (INTERVALO_CITA, HorarioInvalido, compilar_horario, minutos_a_time,
+                                           obtener_horario, time_a_minutos, turnos_por_dia)
+from moduloPrincipal.utils.reservas import citas_fuera_de_horario, dar_de_baja_fuera_de_horario
+
+# Prefijo de los campos de cada dia en el formulario de horario, de lunes a domingo
+DIAS_FORMULARIO = ("lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo")
+
 # Clase para visualizar la ventana de horario y editarlo
 class Horario(View):
     @method_decorator(login_required, name="dispatch")
@@ -13,427 +25,14 @@ class Horario(View):
             aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
             if (aux_usuario.tipo == 'E'):
                 # Se realiza el proceso de obtencion del horario
-                aux_usuario = Usuario.objects.get(id_usuario=request.user.id)
                 aux_especialista = Especialista.objects.get(id_usuario=aux_usuario.id)
 
-                # Se divide el horario en dias
-                arreglo_horario = (aux_especialista.horario).split(";")
-
-                # Se divide el horario hasta obtener los valores que se colocaran en los inputs para que el especialista solo edite y no tenga que escribir todo desde 0
-
-                if arreglo_horario[0] == "":
-                    Lunes = {"hora1_turno1": "", "min1_turno1": "", "hora2_turno1": "", "min2_turno1": "",
-                             "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-                else:
-                    # Se valida si existe ese simbolo para dividir el horario en turnos en el lunes
-                    if ", " in arreglo_horario[0]:
-                        arreglo_dia = (arreglo_horario[0]).split(", ")
-                        turno1 = arreglo_dia[0]
-                        turno2 = arreglo_dia[1]
-
-                        # Se dividen los turnos en horas
-                        arreglo_turno = (turno1).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_turno = (turno2).split("-")
-                        hora1_turno2 = arreglo_turno[0]
-                        hora2_turno2 = arreglo_turno[1]
-
-                        # Se dividen las horas en hora y minutos
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora1_turno2).split(":")
-                        aux_hora1_turno2 = arreglo_horas[0]
-                        aux_min1_turno2 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno2).split(":")
-                        aux_hora2_turno2 = arreglo_horas[0]
-                        aux_min2_turno2 = arreglo_horas[1]
-
-                        Lunes = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                 "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                 "hora1_turno2": aux_hora1_turno2, "min1_turno2": aux_min1_turno2,
-                                 "hora2_turno2": aux_hora2_turno2, "min2_turno2": aux_min2_turno2}
-                    else:
-                        # Se dividen el turno en horas
-                        arreglo_turno = (arreglo_horario[0]).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-                        Lunes = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                 "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                 "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-
-                if arreglo_horario[1] == "":
-                    Martes = {"hora1_turno1": "", "min1_turno1": "", "hora2_turno1": "", "min2_turno1": "",
-                              "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-                else:
-                    # Se valida si existe ese simbolo para dividir el horario en turnos en el martes
-                    if ", " in arreglo_horario[1]:
-                        arreglo_dia = (arreglo_horario[1]).split(", ")
-                        turno1 = arreglo_dia[0]
-                        turno2 = arreglo_dia[1]
-
-                        # Se dividen los turnos en horas
-                        arreglo_turno = (turno1).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_turno = (turno2).split("-")
-                        hora1_turno2 = arreglo_turno[0]
-                        hora2_turno2 = arreglo_turno[1]
-
-                        # Se dividen las horas en hora y minutos
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora1_turno2).split(":")
-                        aux_hora1_turno2 = arreglo_horas[0]
-                        aux_min1_turno2 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno2).split(":")
-                        aux_hora2_turno2 = arreglo_horas[0]
-                        aux_min2_turno2 = arreglo_horas[1]
-
-                        Martes = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                  "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                  "hora1_turno2": aux_hora1_turno2, "min1_turno2": aux_min1_turno2,
-                                  "hora2_turno2": aux_hora2_turno2, "min2_turno2": aux_min2_turno2}
-                    else:
-                        # Se dividen el turno en horas
-                        arreglo_turno = (arreglo_horario[1]).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-                        Martes = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                  "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                  "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-
-                if arreglo_horario[2] == "":
-                    Miercoles = {"hora1_turno1": "", "min1_turno1": "", "hora2_turno1": "", "min2_turno1": "",
-                                 "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-                else:
-                    # Se valida si existe ese simbolo para dividir el horario en turnos en el miercoles
-                    if ", " in arreglo_horario[2]:
-                        arreglo_dia = (arreglo_horario[2]).split(", ")
-                        turno1 = arreglo_dia[0]
-                        turno2 = arreglo_dia[1]
-
-                        # Se dividen los turnos en horas
-                        arreglo_turno = (turno1).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_turno = (turno2).split("-")
-                        hora1_turno2 = arreglo_turno[0]
-                        hora2_turno2 = arreglo_turno[1]
-
-                        # Se dividen las horas en hora y minutos
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora1_turno2).split(":")
-                        aux_hora1_turno2 = arreglo_horas[0]
-                        aux_min1_turno2 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno2).split(":")
-                        aux_hora2_turno2 = arreglo_horas[0]
-                        aux_min2_turno2 = arreglo_horas[1]
-
-                        Miercoles = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                     "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                     "hora1_turno2": aux_hora1_turno2, "min1_turno2": aux_min1_turno2,
-                                     "hora2_turno2": aux_hora2_turno2, "min2_turno2": aux_min2_turno2}
-                    else:
-                        # Se dividen el turno en horas
-                        arreglo_turno = (arreglo_horario[2]).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-                        Miercoles = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                     "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                     "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-
-                if arreglo_horario[3] == "":
-                    Jueves = {"hora1_turno1": "", "min1_turno1": "", "hora2_turno1": "", "min2_turno1": "",
-                              "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-                    # Se valida si existe ese simbolo para dividir el horario en turnos en el jueves
-                else:
-                    if ", " in arreglo_horario[3]:
-                        arreglo_dia = (arreglo_horario[3]).split(", ")
-                        turno1 = arreglo_dia[0]
-                        turno2 = arreglo_dia[1]
-
-                        # Se dividen los turnos en horas
-                        arreglo_turno = (turno1).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_turno = (turno2).split("-")
-                        hora1_turno2 = arreglo_turno[0]
-                        hora2_turno2 = arreglo_turno[1]
-
-                        # Se dividen las horas en hora y minutos
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora1_turno2).split(":")
-                        aux_hora1_turno2 = arreglo_horas[0]
-                        aux_min1_turno2 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno2).split(":")
-                        aux_hora2_turno2 = arreglo_horas[0]
-                        aux_min2_turno2 = arreglo_horas[1]
-
-                        Jueves = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                  "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                  "hora1_turno2": aux_hora1_turno2, "min1_turno2": aux_min1_turno2,
-                                  "hora2_turno2": aux_hora2_turno2, "min2_turno2": aux_min2_turno2}
-                    else:
-                        # Se dividen el turno en horas
-                        arreglo_turno = (arreglo_horario[3]).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-                        #print(hora2_turno1)
-                        Jueves = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                  "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                  "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-
-                if arreglo_horario[4] == "":
-                    Viernes = {"hora1_turno1": "", "min1_turno1": "", "hora2_turno1": "", "min2_turno1": "",
-                               "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-                    # Se valida si existe ese simbolo para dividir el horario en turnos en el viernes
-                else:
-                    if ", " in arreglo_horario[4]:
-                        arreglo_dia = (arreglo_horario[4]).split(", ")
-                        turno1 = arreglo_dia[0]
-                        turno2 = arreglo_dia[1]
-
-                        # Se dividen los turnos en horas
-                        arreglo_turno = (turno1).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_turno = (turno2).split("-")
-                        hora1_turno2 = arreglo_turno[0]
-                        hora2_turno2 = arreglo_turno[1]
-
-                        # Se dividen las horas en hora y minutos
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora1_turno2).split(":")
-                        aux_hora1_turno2 = arreglo_horas[0]
-                        aux_min1_turno2 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno2).split(":")
-                        aux_hora2_turno2 = arreglo_horas[0]
-                        aux_min2_turno2 = arreglo_horas[1]
-
-                        Viernes = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                   "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                   "hora1_turno2": aux_hora1_turno2, "min1_turno2": aux_min1_turno2,
-                                   "hora2_turno2": aux_hora2_turno2, "min2_turno2": aux_min2_turno2}
-                    else:
-                        # Se dividen el turno en horas
-                        arreglo_turno = (arreglo_horario[4]).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-                        Viernes = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                   "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                   "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-
-                if arreglo_horario[5] == "":
-                    Sabado = {"hora1_turno1": "", "min1_turno1": "", "hora2_turno1": "", "min2_turno1": "",
-                              "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-                else:
-                    # Se valida si existe ese simbolo para dividir el horario en turnos en el sabado
-                    if ", " in arreglo_horario[5]:
-                        arreglo_dia = (arreglo_horario[5]).split(", ")
-                        turno1 = arreglo_dia[0]
-                        turno2 = arreglo_dia[1]
-
-                        # Se dividen los turnos en horas
-                        arreglo_turno = (turno1).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_turno = (turno2).split("-")
-                        hora1_turno2 = arreglo_turno[0]
-                        hora2_turno2 = arreglo_turno[1]
-
-                        # Se dividen las horas en hora y minutos
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora1_turno2).split(":")
-                        aux_hora1_turno2 = arreglo_horas[0]
-                        aux_min1_turno2 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno2).split(":")
-                        aux_hora2_turno2 = arreglo_horas[0]
-                        aux_min2_turno2 = arreglo_horas[1]
-
-                        Sabado = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                  "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                  "hora1_turno2": aux_hora1_turno2, "min1_turno2": aux_min1_turno2,
-                                  "hora2_turno2": aux_hora2_turno2, "min2_turno2": aux_min2_turno2}
-                    else:
-                        # Se dividen el turno en horas
-                        arreglo_turno = (arreglo_horario[5]).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-                        Sabado = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                  "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                  "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-
-                if arreglo_horario[6] == "":
-                    Domingo = {"hora1_turno1": "", "min1_turno1": "", "hora2_turno1": "", "min2_turno1": "",
-                               "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-                else:
-                    # Se valida si existe ese simbolo para dividir el horario en turnos en el domingo
-                    if ", " in arreglo_horario[6]:
-                        arreglo_dia = (arreglo_horario[6]).split(", ")
-                        turno1 = arreglo_dia[0]
-                        turno2 = arreglo_dia[1]
-
-                        # Se dividen los turnos en horas
-                        arreglo_turno = (turno1).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_turno = (turno2).split("-")
-                        hora1_turno2 = arreglo_turno[0]
-                        hora2_turno2 = arreglo_turno[1]
-
-                        # Se dividen las horas en hora y minutos
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora1_turno2).split(":")
-                        aux_hora1_turno2 = arreglo_horas[0]
-                        aux_min1_turno2 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno2).split(":")
-                        aux_hora2_turno2 = arreglo_horas[0]
-                        aux_min2_turno2 = arreglo_horas[1]
-
-                        Domingo = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                   "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                   "hora1_turno2": aux_hora1_turno2, "min1_turno2": aux_min1_turno2,
-                                   "hora2_turno2": aux_hora2_turno2, "min2_turno2": aux_min2_turno2}
-                    else:
-                        # Se dividen el turno en horas
-                        arreglo_turno = (arreglo_horario[6]).split("-")
-                        hora1_turno1 = arreglo_turno[0]
-                        hora2_turno1 = arreglo_turno[1]
-
-                        arreglo_horas = (hora1_turno1).split(":")
-                        aux_hora1_turno1 = arreglo_horas[0]
-                        aux_min1_turno1 = arreglo_horas[1]
-
-                        arreglo_horas = (hora2_turno1).split(":")
-                        aux_hora2_turno1 = arreglo_horas[0]
-                        aux_min2_turno1 = arreglo_horas[1]
-                        Domingo = {"hora1_turno1": aux_hora1_turno1, "min1_turno1": aux_min1_turno1,
-                                   "hora2_turno1": aux_hora2_turno1, "min2_turno1": aux_min2_turno1,
-                                   "hora1_turno2": "", "min1_turno2": "", "hora2_turno2": "", "min2_turno2": ""}
-
-                json_horario = {"Lunes": Lunes, "Martes": Martes, "Miercoles": Miercoles, "Jueves": Jueves,
-                                "Viernes": Viernes, "Sabado": Sabado, "Domingo": Domingo}
-                #print(Jueves["min2_turno1"])
+                # Se toma el horario ya compilado y se separa en horas y minutos de cada turno para colocarlos en los inputs, asi el especialista solo edita y no tiene que escribir todo desde 0
+                json_horario = turnos_por_dia(obtener_horario(aux_especialista))
                 datos = {"horario": json_horario}
 
-                return render(request, "ventanas_especialista/horario.html", {"datos": datos})
+                return render(request, "ventanas_especialista/horario.html",
+                              {"datos": datos, "citas_canceladas": request.GET.get('citas_canceladas')})
             else:
                 return redirect('inicio_paciente')
         else:
@@ -453,118 +52,115 @@ class Horario(View):
     def put(self, request):
         aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
         aux_especialista = Especialista.objects.get(id_usuario_id=aux_usuario.id)
-        # Se concatenan los horarios de todos los dias
-        horario = ''
+        horario = self.horario_de_formulario(request.POST)
+
+        # Se valida el horario antes de guardar nada: un turno mal escrito dejaria el dia vacio y se darian de baja
+        # todas sus citas
+        try:
+            compilado = compilar_horario(horario)
+        except HorarioInvalido as error:
+            return JsonResponse({'Error': True, 'Descripcion': error.descripcion}, status=400)
+
+        # Si el nuevo horario deja fuera citas ya agendadas se pide confirmacion mostrando cuantas se darian de baja
+        afectadas = citas_fuera_de_horario(aux_especialista.id, compilado).count()
+        if afectadas and 'confirmar' not in request.POST:
+            return render(request, "ventanas_especialista/horario.html",
+                          {"datos": {"horario": turnos_por_dia(compilado)}, "citas_afectadas": afectadas})
+
+        # Se actualiza el horario en la BD y en la misma transaccion se dan de baja las citas futuras que quedaron fuera de el
+        with transaction.atomic():
+            aux_especialista.horario = horario
+            aux_especialista.save()
+            canceladas = dar_de_baja_fuera_de_horario(aux_especialista)
+
+        return redirect(reverse('horario_especialista') + '?citas_canceladas=' + str(canceladas))
+
+    # Arma el texto del horario (ver utils.horario) con los turnos del formulario; si no hay registro de horas para
+    # un dia, el dia queda vacio
+    @staticmethod
+    def horario_de_formulario(datos):
+        dias = []
+        for dia in DIAS_FORMULARIO:
+            turnos = []
+            # Se valida si se habilito cada turno
+            for turno in ('1', '2'):
+                if dia + '-hora' + turno in datos:
+                    turnos.append(datos.get(dia + '-hora' + turno, '') + ':' + datos.get(dia + '-min' + turno, '')
+                                  + '-' + datos.get(dia + '-hora' + turno + '-2', '') + ':'
+                                  + datos.get(dia + '-min' + turno + '-2', ''))
+            dias.append(', '.join(turnos))
+        return ';'.join(dias)
+
+# Clase para que el especialista consulte, agregue y elimine excepciones a su horario (vacaciones, dias festivos...)
+class Excepciones_horario(View):
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+    def especialista(self, request):
+        return Especialista.objects.filter(id_usuario__id_usuario=request.user).only('id').first()
 
-        # Primero se evalua que si haya registro de horas para un dia es especifico, si no lo hay, se le concatena solo un simbolo de ;
-        if "lunes-hora1" in request.POST:
-            # Se valida si se habilito el segundo turno
-            if "lunes-hora2" in request.POST:
-                lunes = request.POST.get('lunes-hora1') + ":" + request.POST.get('lunes-min1') + "-" + request.POST.get(
-                    'lunes-hora1-2') + ":" + request.POST.get('lunes-min1-2') + ", " + request.POST.get(
-                    'lunes-hora2') + ":" + request.POST.get('lunes-min2') + "-" + request.POST.get(
-                    'lunes-hora2-2') + ":" + request.POST.get('lunes-min2-2')
-            else:
-                lunes = request.POST.get('lunes-hora1') + ":" + request.POST.get('lunes-min1') + "-" + request.POST.get(
-                    'lunes-hora1-2') + ":" + request.POST.get('lunes-min1-2')
-            horario = lunes
-        else:
-            horario = ";"
-
-        if "martes-hora1" in request.POST:
-            # Se valida si se habilito el segundo turno
-            if "martes-hora2" in request.POST:
-                martes = request.POST.get('martes-hora1') + ":" + request.POST.get(
-                    'martes-min1') + "-" + request.POST.get('martes-hora1-2') + ":" + request.POST.get(
-                    'martes-min1-2') + ", " + request.POST.get('martes-hora2') + ":" + request.POST.get(
-                    'martes-min2') + "-" + request.POST.get('martes-hora2-2') + ":" + request.POST.get('martes-min2-2')
-            else:
-                martes = request.POST.get('martes-hora1') + ":" + request.POST.get(
-                    'martes-min1') + "-" + request.POST.get('martes-hora1-2') + ":" + request.POST.get('martes-min1-2')
-            horario += ";" + martes
-        else:
-            horario += ";"
-
-        if "miercoles-hora1" in request.POST:
-            # Se valida si se habilito el segundo turno
-            if "miercoles-hora2" in request.POST:
-                miercoles = request.POST.get('miercoles-hora1') + ":" + request.POST.get(
-                    'miercoles-min1') + "-" + request.POST.get('miercoles-hora1-2') + ":" + request.POST.get(
-                    'miercoles-min1-2') + ", " + request.POST.get('miercoles-hora2') + ":" + request.POST.get(
-                    'miercoles-min2') + "-" + request.POST.get('miercoles-hora2-2') + ":" + request.POST.get(
-                    'miercoles-min2-2')
-            else:
-                miercoles = request.POST.get('miercoles-hora1') + ":" + request.POST.get(
-                    'miercoles-min1') + "-" + request.POST.get('miercoles-hora1-2') + ":" + request.POST.get(
-                    'miercoles-min1-2')
-            horario += ";" + miercoles
-        else:
-            horario += ";"
-
-        if "jueves-hora1" in request.POST:
-            # Se valida si se habilito el segundo turno
-            if "jueves-hora2" in request.POST:
-                jueves = request.POST.get('jueves-hora1') + ":" + request.POST.get(
-                    'jueves-min1') + "-" + request.POST.get('jueves-hora1-2') + ":" + request.POST.get(
-                    'jueves-min1-2') + ", " + request.POST.get('jueves-hora2') + ":" + request.POST.get(
-                    'jueves-min2') + "-" + request.POST.get('jueves-hora2-2') + ":" + request.POST.get('jueves-min2-2')
-            else:
-                jueves = request.POST.get('jueves-hora1') + ":" + request.POST.get(
-                    'jueves-min1') + "-" + request.POST.get('jueves-hora1-2') + ":" + request.POST.get('jueves-min1-2')
-            horario += ";" + jueves
-        else:
-            horario += ";"
-
-        if "viernes-hora1" in request.POST:
-            # Se valida si se habilito el segundo turno
-            if "viernes-hora2" in request.POST:
-                viernes = request.POST.get('viernes-hora1') + ":" + request.POST.get(
-                    'viernes-min1') + "-" + request.POST.get('viernes-hora1-2') + ":" + request.POST.get(
-                    'viernes-min1-2') + ", " + request.POST.get('viernes-hora2') + ":" + request.POST.get(
-                    'viernes-min2') + "-" + request.POST.get('viernes-hora2-2') + ":" + request.POST.get(
-                    'viernes-min2-2')
-            else:
-                viernes = request.POST.get('viernes-hora1') + ":" + request.POST.get(
-                    'viernes-min1') + "-" + request.POST.get('viernes-hora1-2') + ":" + request.POST.get(
-                    'viernes-min1-2')
-            horario += ";" + viernes
-        else:
-            horario += ";"
-
-        if "sabado-hora1" in request.POST:
-            # Se valida si se habilito el segundo turno
-            if "sabado-hora2" in request.POST:
-                sabado = request.POST.get('sabado-hora1') + ":" + request.POST.get(
-                    'sabado-min1') + "-" + request.POST.get('sabado-hora1-2') + ":" + request.POST.get(
-                    'sabado-min1-2') + ", " + request.POST.get('sabado-hora2') + ":" + request.POST.get(
-                    'sabado-min2') + "-" + request.POST.get('sabado-hora2-2') + ":" + request.POST.get('sabado-min2-2')
-            else:
-                sabado = request.POST.get('sabado-hora1') + ":" + request.POST.get(
-                    'sabado-min1') + "-" + request.POST.get('sabado-hora1-2') + ":" + request.POST.get('sabado-min1-2')
-            horario += ";" + sabado
-        else:
-            horario += ";"
+    @method_decorator(login_required, name='dispatch')
+    def get(self, request, id=0):
+        aux_especialista = self.especialista(request)
+        if aux_especialista is None:
+            return JsonResponse({'Error': True, 'Descripcion': 'Solo los especialistas tienen horario'}, status=403)
+        # Solo las excepciones que aun no terminan
+        excepciones = ExcepcionHorario.objects.filter(id_especialista_id=aux_especialista.id,
+                                                      fecha_fin__gte=date.today()).order_by('fecha_inicio', 'id')
+        return JsonResponse({'excepciones': [{'id': excepcion.id,
+                                              'fecha_inicio': excepcion.fecha_inicio.isoformat(),
+                                              'fecha_fin': excepcion.fecha_fin.isoformat(),
+                                              'hora_inicio': excepcion.hora_inicio.strftime('%H:%M') if excepcion.hora_inicio else None,
+                                              'hora_fin': excepcion.hora_fin.strftime('%H:%M') if excepcion.hora_fin else None,
+                                              'motivo': excepcion.motivo}
+                                             for excepcion in excepciones]})
 
-        if "domingo-hora1" in request.POST:
-            # Se valida si se habilito el segundo turno
-            if "domingo-hora2" in request.POST:
-                domingo = request.POST.get('domingo-hora1') + ":" + request.POST.get(
-                    'domingo-min1') + "-" + request.POST.get('domingo-hora1-2') + ":" + request.POST.get(
-                    'domingo-min1-2') + ", " + request.POST.get('domingo-hora2') + ":" + request.POST.get(
-                    'domingo-min2') + "-" + request.POST.get('domingo-hora2-2') + ":" + request.POST.get(
-                    'domingo-min2-2')
-            else:
-                domingo = request.POST.get('domingo-hora1') + ":" + request.POST.get(
-                    'domingo-min1') + "-" + request.POST.get('domingo-hora1-2') + ":" + request.POST.get(
-                    'domingo-min1-2')
-            horario += ";" + domingo
-        else:
-            horario += ";"
+    @method_decorator(login_required, name='dispatch')
+    def post(self, request, id=0):
+        aux_especialista = self.especialista(request)
+        if aux_especialista is None:
+            return JsonResponse({'Error': True, 'Descripcion': 'Solo los especialistas tienen horario'}, status=403)
+        try:
+            jd = json.loads(request.body)
+            fecha_inicio = date.fromisoformat(jd['fecha_inicio'])
+            fecha_fin = date.fromisoformat(jd.get('fecha_fin') or jd['fecha_inicio'])
+            hora_inicio = datetime.strptime(jd['hora_inicio'], '%H:%M').time() if jd.get('hora_inicio') else None
+            hora_fin = datetime.strptime(jd['hora_fin'], '%H:%M').time() if jd.get('hora_fin') else None
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'Error': True, 'Descripcion': 'Las fechas deben tener el formato AAAA-MM-DD y las horas HH:MM'},
+                                status=400)
+        # Se valida que el rango sea correcto y que las horas vengan las dos o ninguna
+        if fecha_fin < fecha_inicio:
+            return JsonResponse({'Error': True, 'Descripcion': 'La fecha final es anterior a la inicial'}, status=400)
+        if (hora_inicio is None) != (hora_fin is None) or (hora_inicio and hora_fin <= hora_inicio):
+            return JsonResponse({'Error': True, 'Descripcion': 'El rango de horas no es valido'}, status=400)
+
+        excepcion = ExcepcionHorario.objects.create(id_especialista_id=aux_especialista.id, fecha_inicio=fecha_inicio,
+                                                    fecha_fin=fecha_fin, hora_inicio=hora_inicio, hora_fin=hora_fin,
+                                                    motivo=str(jd.get('motivo', ''))[:200])
+
+        # Las citas activas que ya estaban agendadas en ese rango no se cancelan, se avisa cuantas son
+        citas = Cita.objects.filter(id_especialista_id=aux_especialista.id, fecha__range=(fecha_inicio, fecha_fin),
+                                    estatus__in=['P', 'C'])
+        if hora_inicio:
+            # Igual que Bloqueos.bloqueado: una cita que empieza antes del rango pero termina dentro tambien choca
+            citas = citas.filter(hora__lt=hora_fin)
+            inicio = time_a_minutos(hora_inicio) - INTERVALO_CITA
+            if inicio >= 0:
+                citas = citas.filter(hora__gt=minutos_a_time(inicio))
+        return JsonResponse({'Success': True, 'id': excepcion.id, 'citas_afectadas': citas.count()})
 
-            # Se actualiza el horario en la BD
-        aux_especialista.horario = horario
-        aux_especialista.save()
+    @method_decorator(login_required, name='dispatch')
+    def delete(self, request, id=0):
+        aux_especialista = self.especialista(request)
+        if aux_especialista is None:
+            return JsonResponse({'Error': True, 'Descripcion': 'Solo los especialistas tienen horario'}, status=403)
+        # Solo se pueden eliminar excepciones propias
+        excepcion = ExcepcionHorario.objects.filter(id=id, id_especialista_id=aux_especialista.id).first()
+        if excepcion is None:
+            return JsonResponse({'Error': True, 'Descripcion': 'Excepcion no encontrada'}, status=404)
+        excepcion.delete()
+        return JsonResponse({'Success': True})
 
-        # arreglo_horario= horario.split(";")
-        # datos={"Lunes": arreglo_horario[0], "Martes":arreglo_horario[1], "Miercoles":arreglo_horario[2], "Jueves":arreglo_horario[3], "Viernes":arreglo_horario[4], "Sabado":arreglo_horario[5], "Domingo":arreglo_horario[6]}
-        return redirect('/configuracion/especialista/0/0')
\ No newline at end of file
@@ -8,9 +8,15 @@ from django.contrib.auth.models import User
 import json
 from django.http.response import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.db.models import Exists, OuterRef
 
 
 from moduloPrincipal.models.__init__ import *
+from moduloPrincipal.utils.horario import obtener_horario, tiene_horario, horario_por_dia, horas_por_dia, minutos_a_texto
+from moduloPrincipal.utils.disponibilidad import MAX_DIAS_CONSULTA, horarios_libres, primeros_libres
+from moduloPrincipal.utils.reservas import ReservaError, reservar_cita, reservar_serie
+from moduloPrincipal.utils.lista_espera import aceptar_oferta, cancelar_espera
+from moduloPrincipal.utils.paginacion import pagina_keyset
 
 # CLase para validar el formulario de registro de paciente y registrarlo en la BD
 class Registrarse_paciente(View):
@@ -124,9 +130,8 @@ class Configuracion_paciente(View):
     def get(self, request, message1=""):
         # Validacion de tipos de usaurio
         if (request.user.is_staff == 0):
-            aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-            if (aux_usuario.tipo == 'P'):
-                aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
+            if (request.actor.tipo == 'P'):
+                aux_usuario = request.actor.usuario
                 # Muestra un mensaje u otro dependiendo de si se hicieron los cambio correctamente
                 if message1 == "exito":
                     datos = {'usuario': aux_usuario, 'nombre': request.user.username, 'correo': request.user.email,
@@ -171,30 +176,47 @@ class Especialistas(View):
     def dispatch(self, request, *args, **kwargs):
         return super().dispatch(request, *args, **kwargs)
 
+    # Especialistas por pagina de cada lista (disponibles y confirmados)
+    ESPECIALISTAS_POR_PAGINA = 50
+
     @method_decorator(login_required(login_url='login'), name='dispatch')
     def get(self, request):
         # Validacion del tipo de usuario
         if (request.user.is_staff == 0):
-            aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-            if (aux_usuario.tipo == 'E'):
+            if (request.actor.tipo == 'E'):
                 return redirect("inicio_especialista")
-            aux_paciente = Paciente.objects.get(id_usuario_id=aux_usuario.id)
-
-            # Se obtienen todos los especialistas
-            especialistas = Especialista.objects.all()
-            # Se obtienen las solicitudes del paciene
-            solicitudes = Solicitudes.objects.filter(id_paciente=aux_paciente.id)
-
-            # Se hace una lista de los especialistas a los que ya se les envio una solicitud para filtrarlos en la interfaz
-            lista_solicitados = []
-            for solicitud in solicitudes:
-                for especialista in especialistas:
-                    if solicitud.id_especialista_id == especialista.id:
-                        lista_solicitados.append(especialista.id)
+            aux_paciente = request.actor.paciente
+            if aux_paciente is None:
+                return redirect('inicio_paciente')
+
+            # Se obtienen los especialistas activos, marcando en la misma consulta si el paciente ya les envio una
+            # solicitud y si alguna fue aceptada
+            solicitudes = Solicitudes.objects.filter(id_especialista=OuterRef('pk'), id_paciente=aux_paciente.id)
+            especialistas = (Especialista.objects.filter(estatus='1')
+                             .select_related('id_usuario__id_usuario', 'id_especialidad')
+                             .annotate(solicitado=Exists(solicitudes),
+                                       confirmado=Exists(solicitudes.filter(estatus='A'))))
+            try:
+                id_especialidad = int(request.GET.get('especialidad') or 0)
+            except ValueError:
+                id_especialidad = 0
+            if id_especialidad:
+                especialistas = especialistas.filter(id_especialidad_id=id_especialidad)
+
+            disponibles, siguiente_disponibles = pagina_keyset(especialistas.filter(solicitado=False), ('id',),
+                                                               request.GET.get('despues_disponibles'),
+                                                               self.ESPECIALISTAS_POR_PAGINA)
+            confirmados, siguiente_confirmados = pagina_keyset(especialistas.filter(confirmado=True), ('id',),
+                                                               request.GET.get('despues_confirmados'),
+                                                               self.ESPECIALISTAS_POR_PAGINA)
 
             return render(request, 'ventanas_paciente/listar_especialistas.html',
-                          {'especialistas': especialistas, 'lista_solicitados': lista_solicitados,
-                           'solicitudes': solicitudes})
+                          {'disponibles': disponibles, 'confirmados': confirmados,
+                           'siguiente_disponibles': siguiente_disponibles,
+                           'siguiente_confirmados': siguiente_confirmados,
+                           'especialidades': Especialidades.objects.order_by('nombre'),
+                           'especialidad': id_especialidad,
+                           'lista': 'confirmados' if request.GET.get('lista') == 'confirmados' else 'disponibles'})
 
         else:
             return redirect('inicio_admin')
@@ -218,20 +240,14 @@ class Informacion_especialista(View):
 
         # Validacion de tipos de usaurio
         if (request.user.is_staff == 0):
-            aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-
-            if (aux_usuario.tipo == 'P'):
+            if (request.actor.tipo == 'P'):
                 # Se obtiene la informacion del especialista
                 aux_user = User.objects.get(id=id_user)
                 aux_usuario = Usuario.objects.get(id=id_usuario)
                 aux_especialista = Especialista.objects.get(id=id_especialista)
 
-                # Se divide el horario por dias
-                arreglo_horario = (aux_especialista.horario).split(";")
-                json_horario = {"Lunes": arreglo_horario[0], "Martes": arreglo_horario[1],
-                                "Miercoles": arreglo_horario[2], "Jueves": arreglo_horario[3],
-                                "Viernes": arreglo_horario[4], "Sabado": arreglo_horario[5],
-                                "Domingo": arreglo_horario[6]}
+                # Se obtiene el horario de cada dia a partir del horario compilado
+                json_horario = horario_por_dia(obtener_horario(aux_especialista))
 
                 datos = {'usuario': aux_usuario, 'nombre': aux_user.first_name + " " + aux_user.last_name,
                          'correo': aux_user.email, 'info_ad': aux_especialista.info_ad,
@@ -268,12 +284,11 @@ class Agendar(View):
     def get(self, request, id):
         # Validacion de tipos de usuario
         if (request.user.is_staff == 0):
-            aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-            if (aux_usuario.tipo == 'E'):
+            if (request.actor.tipo == 'E'):
                 return redirect('inicio_especialista')
             else:
                 # se obtiene informacion del paciente
-                aux_paciente = Paciente.objects.get(id_usuario_id=aux_usuario.id)
+                aux_paciente = request.actor.paciente
                 # se valida que el paciente actual tenga una solicitud aceptada por parte del especialista
                 aux_solicitudes = Solicitudes.objects.filter(id_paciente_id=aux_paciente.id).filter(
                     id_especialista_id=id).values()
@@ -291,245 +306,17 @@ class Agendar(View):
 
                 # Se obtiene la informacion del especialista
                 aux_especialista = Especialista.objects.get(id=id)
+                horario = obtener_horario(aux_especialista)
 
                 # Validacion de que el especialista haya registrado un horario
-                if aux_especialista.horario == ';;;;;;;':
+                if not tiene_horario(horario):
                     return render(request, 'ventanas_paciente/agendar_cita.html',
                                   {'Error': 'El especialista no ha registrado un horario de atencion'})
 
-                arreglo_horario = (aux_especialista.horario).split(";")
-                json_horario = {"Lunes": arreglo_horario[0], "Martes": arreglo_horario[1],
-                                "Miercoles": arreglo_horario[2], "Jueves": arreglo_horario[3],
-                                "Viernes": arreglo_horario[4], "Sabado": arreglo_horario[5],
-                                "Domingo": arreglo_horario[6]}
-
-                # Se obtienen las horas intermedias para sacar cita a intervalos de 30 minutos
-                intervalo = 30
-
-                # Horas del lunes
-                if ", " in arreglo_horario[0]:
-                    aux_horas = (arreglo_horario[0].split(', '))
-                    turno1 = aux_horas[0]
-                    turno2 = aux_horas[1]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    aux_horas = turno1.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    # Arreglo que contendra las horas de cita del dia lunes
-                    horas_lunes = []
-                    # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                    horas_lunes = self.obtener_horas_intermedias(horas_lunes, inicio, fin, intervalo)
-                    # Se obtienen las horas de inicio y final del segundo turno
-                    aux_horas = turno2.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    horas_lunes = self.obtener_horas_intermedias(horas_lunes, inicio, fin, intervalo)
-                else:
-                    turno1 = arreglo_horario[0]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    if "-" in turno1:
-                        aux_horas = turno1.split('-')
-                        inicio = aux_horas[0]
-                        fin = aux_horas[1]
-                        # Arreglo que contendra las horas de cita del dia lunes
-                        horas_lunes = []
-                        # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                        horas_lunes = self.obtener_horas_intermedias(horas_lunes, inicio, fin, intervalo)
-                    else:
-                        horas_lunes = []
-
-                        # Horas del martes
-                if ", " in arreglo_horario[1]:
-                    aux_horas = (arreglo_horario[1].split(', '))
-                    turno1 = aux_horas[0]
-                    turno2 = aux_horas[1]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    aux_horas = turno1.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    # Arreglo que contendra las horas de cita del dia lunes
-                    horas_martes = []
-                    # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                    horas_martes = self.obtener_horas_intermedias(horas_martes, inicio, fin, intervalo)
-                    # Se obtienen las horas de inicio y final del segundo turno
-                    aux_horas = turno2.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    horas_martes = self.obtener_horas_intermedias(horas_martes, inicio, fin, intervalo)
-                else:
-                    turno1 = arreglo_horario[1]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    if "-" in turno1:
-                        aux_horas = turno1.split('-')
-                        inicio = aux_horas[0]
-                        fin = aux_horas[1]
-                        # Arreglo que contendra las horas de cita del dia lunes
-                        horas_martes = []
-                        # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                        horas_martes = self.obtener_horas_intermedias(horas_martes, inicio, fin, intervalo)
-                    else:
-                        horas_martes = []
-
-                # Horas del miercoles
-                if ", " in arreglo_horario[2]:
-                    aux_horas = (arreglo_horario[2].split(', '))
-                    turno1 = aux_horas[0]
-                    turno2 = aux_horas[1]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    aux_horas = turno1.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    # Arreglo que contendra las horas de cita del dia lunes
-                    horas_miercoles = []
-                    # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                    horas_miercoles = self.obtener_horas_intermedias(horas_miercoles, inicio, fin, intervalo)
-                    # Se obtienen las horas de inicio y final del segundo turno
-                    aux_horas = turno2.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    horas_miercoles = self.obtener_horas_intermedias(horas_miercoles, inicio, fin, intervalo)
-                else:
-                    turno1 = arreglo_horario[2]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    if "-" in turno1:
-                        aux_horas = turno1.split('-')
-                        inicio = aux_horas[0]
-                        fin = aux_horas[1]
-                        # Arreglo que contendra las horas de cita del dia lunes
-                        horas_miercoles = []
-                        # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                        horas_miercoles = self.obtener_horas_intermedias(horas_miercoles, inicio, fin, intervalo)
-                    else:
-                        horas_miercoles = []
-
-                # Horas del jueves
-                if ", " in arreglo_horario[3]:
-                    aux_horas = (arreglo_horario[3].split(', '))
-                    turno1 = aux_horas[0]
-                    turno2 = aux_horas[1]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    aux_horas = turno1.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    # Arreglo que contendra las horas de cita del dia lunes
-                    horas_jueves = []
-                    # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                    horas_jueves = self.obtener_horas_intermedias(horas_jueves, inicio, fin, intervalo)
-                    # Se obtienen las horas de inicio y final del segundo turno
-                    aux_horas = turno2.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    horas_jueves = self.obtener_horas_intermedias(horas_jueves, inicio, fin, intervalo)
-                else:
-                    turno1 = arreglo_horario[3]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    if "-" in turno1:
-                        aux_horas = turno1.split('-')
-                        inicio = aux_horas[0]
-                        fin = aux_horas[1]
-                        # Arreglo que contendra las horas de cita del dia lunes
-                        horas_jueves = []
-                        # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                        horas_jueves = self.obtener_horas_intermedias(horas_jueves, inicio, fin, intervalo)
-                    else:
-                        horas_jueves = []
-
-                # Horas del viernes
-                if ", " in arreglo_horario[4]:
-                    aux_horas = (arreglo_horario[4].split(', '))
-                    turno1 = aux_horas[0]
-                    turno2 = aux_horas[1]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    aux_horas = turno1.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    # Arreglo que contendra las horas de cita del dia lunes
-                    horas_viernes = []
-                    # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                    horas_viernes = self.obtener_horas_intermedias(horas_viernes, inicio, fin, intervalo)
-                    # Se obtienen las horas de inicio y final del segundo turno
-                    aux_horas = turno2.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    horas_viernes = self.obtener_horas_intermedias(horas_viernes, inicio, fin, intervalo)
-                else:
-                    turno1 = arreglo_horario[4]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    if "-" in turno1:
-                        aux_horas = turno1.split('-')
-                        inicio = aux_horas[0]
-                        fin = aux_horas[1]
-                        # Arreglo que contendra las horas de cita del dia lunes
-                        horas_viernes = []
-                        # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                        horas_viernes = self.obtener_horas_intermedias(horas_viernes, inicio, fin, intervalo)
-                    else:
-                        horas_viernes = []
-
-                # Horas del sabado
-                if ", " in arreglo_horario[5]:
-                    aux_horas = (arreglo_horario[5].split(', '))
-                    turno1 = aux_horas[0]
-                    turno2 = aux_horas[1]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    aux_horas = turno1.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    # Arreglo que contendra las horas de cita del dia lunes
-                    horas_sabado = []
-                    # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                    horas_sabado = self.obtener_horas_intermedias(horas_sabado, inicio, fin, intervalo)
-                    # Se obtienen las horas de inicio y final del segundo turno
-                    aux_horas = turno2.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    horas_sabado = self.obtener_horas_intermedias(horas_sabado, inicio, fin, intervalo)
+                json_horario = horario_por_dia(horario)
 
-                else:
-                    turno1 = arreglo_horario[5]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    if "-" in turno1:
-                        aux_horas = turno1.split('-')
-                        inicio = aux_horas[0]
-                        fin = aux_horas[1]
-                        # Arreglo que contendra las horas de cita del dia lunes
-                        horas_sabado = []
-                        # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                        horas_sabado = self.obtener_horas_intermedias(horas_sabado, inicio, fin, intervalo)
-                    else:
-                        horas_sabado = []
-
-                # Horas del domingo
-                if ", " in arreglo_horario[6]:
-                    aux_horas = (arreglo_horario[6].split(', '))
-                    turno1 = aux_horas[0]
-                    turno2 = aux_horas[1]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    aux_horas = turno1.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    # Arreglo que contendra las horas de cita del dia lunes
-                    horas_domingo = []
-                    # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                    horas_domingo = self.obtener_horas_intermedias(horas_domingo, inicio, fin, intervalo)
-                    # Se obtienen las horas de inicio y final del segundo turno
-                    aux_horas = turno2.split('-')
-                    inicio = aux_horas[0]
-                    fin = aux_horas[1]
-                    horas_domingo = self.obtener_horas_intermedias(horas_domingo, inicio, fin, intervalo)
-                else:
-                    turno1 = arreglo_horario[6]
-                    # Se obtienen las horas de inicio y final del primer turno
-                    if "-" in turno1:
-                        aux_horas = turno1.split('-')
-                        inicio = aux_horas[0]
-                        fin = aux_horas[1]
-                        # Arreglo que contendra las horas de cita del dia lunes
-                        horas_domingo = []
-                        # Se llama a la funcion que devolvera las horas intermedias entre la hora inicial y final
-                        horas_domingo = self.obtener_horas_intermedias(horas_domingo, inicio, fin, intervalo)
-                    else:
-                        horas_domingo = []
+                # Se obtienen las horas de cita de cada dia a intervalos de 30 minutos a partir del horario compilado
+                horas_lunes, horas_martes, horas_miercoles, horas_jueves, horas_viernes, horas_sabado, horas_domingo = horas_por_dia(horario)
 
                 # Se obtiene la fecha actual y se muestra la interfaz de agendar cita
                 fecha_actual = timezone.now()
@@ -557,42 +344,229 @@ class Agendar(View):
 
     @method_decorator(login_required, name='dispatch')
     def post(self, request):
-        jd = json.loads(request.body)
-        # Se valida que la hora no este ocupada
-        aux_citas = Cita.objects.filter(fecha=jd['fecha']).filter(id_especialista_id=jd['id_especialista']).filter(
-            hora__contains=jd['hora']).exclude(estatus="B").values()
-        if aux_citas:
-            return JsonResponse({'Error': True, 'Descripcion': "Ese dia y hora no estan disponibles para cita"})
-        else:
-            # Se valida que el paciente no tenga 2 citas registradas el mismo dia a la misma hora
-            aux_citas = Cita.objects.filter(fecha=jd['fecha']).filter(hora__contains=jd['hora']).filter(
-                id_paciente_id=jd['id_paciente'])
-            if aux_citas:
-                return JsonResponse(
-                    {'Error': True, 'Descripcion': "No puedes agendar 2 o mas citas para el mismo dia a la misma hora"})
-            # Se valida que el paciente no tenga 2 citas registradas el mismo dia con el mismo espeicailsta
-            aux_citas = Cita.objects.filter(fecha=jd['fecha']).filter(id_paciente_id=jd['id_paciente']).filter(
-                id_especialista_id=jd['id_especialista'])
-            if aux_citas:
+        # La cita siempre es del paciente que inicio sesion
+        paciente = request.actor.paciente
+        if paciente is None:
+            return JsonResponse({'Error': True, 'Descripcion': 'Solo los pacientes pueden agendar citas'}, status=403)
+        try:
+            jd = json.loads(request.body)
+            id_especialista = int(jd['id_especialista'])
+            if not Solicitudes.objects.filter(id_paciente=paciente, id_especialista_id=id_especialista,
+                                              estatus='A').exists():
                 return JsonResponse({'Error': True,
-                                     'Descripcion': "No puedes agendar 2 o mas citas para el mismo dia con el mismo especialista"})
-            cita = Cita.objects.create(fecha=jd['fecha'], hora=jd['hora'], estatus='P', motivo=jd['motivo'],
-                                       id_especialista_id=jd['id_especialista'], id_paciente_id=jd['id_paciente'])
-            cita.save()
-            return JsonResponse({'Success': True})
-
-    def obtener_horas_intermedias(request, horas_intermedias, inicio, fin, intervalo):
-        # Se convierten los string a objetos datetime
-        hora_inicio = datetime.strptime(inicio, "%H:%M")
-        hora_final = datetime.strptime(fin, "%H:%M")
-        # Calcular las horas intermedias en intervalos de 30 minutos
-        intervalo = timedelta(minutes=intervalo)
-        hora_actual = hora_inicio
-        # Se agregan las horas intermedias mientras la hora actual sea menor a la hora final
-        while hora_actual < hora_final:
-            horas_intermedias.append(hora_actual.strftime("%H:%M"))
-            hora_actual += intervalo
-        return horas_intermedias
+                                     'Descripcion': 'Este especialista no ha aceptado una solicitud tuya'}, status=403)
+            # Se valida que la hora no este ocupada y que el paciente no tenga otra cita a la misma hora o con el mismo especialista ese dia, dentro de una transaccion
+            reservar_cita(id_especialista, paciente.id, jd['fecha'], jd['hora'], jd.get('motivo', ''))
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'Error': True, 'Descripcion': 'Faltan datos de la cita'}, status=400)
+        except ReservaError as error:
+            return JsonResponse({'Error': True, 'Descripcion': error.descripcion})
+        return JsonResponse({'Success': True})
+
+# Clase para agendar una serie de citas con el mismo especialista (por ejemplo, una consulta cada 2 semanas)
+class Agendar_serie(View):
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+    @method_decorator(login_required(login_url='login'), name='dispatch')
+    def post(self, request):
+        # La serie siempre es del paciente que inicio sesion
+        paciente = request.actor.paciente
+        if paciente is None:
+            return JsonResponse({'Error': True, 'Descripcion': 'Solo los pacientes pueden agendar citas'}, status=403)
+        try:
+            jd = json.loads(request.body)
+            id_especialista = int(jd['id_especialista'])
+            if not Solicitudes.objects.filter(id_paciente=paciente, id_especialista_id=id_especialista,
+                                              estatus='A').exists():
+                return JsonResponse({'Error': True,
+                                     'Descripcion': 'Este especialista no ha aceptado una solicitud tuya'}, status=403)
+            creadas, conflictos = reservar_serie(id_especialista, paciente.id, jd['fecha'], jd['hora'],
+                                                 jd.get('cada_dias', 14), jd.get('repeticiones', 1),
+                                                 jd.get('motivo', ''), parcial=bool(jd.get('parcial', False)))
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'Error': True, 'Descripcion': 'Faltan datos de la serie de citas'}, status=400)
+        except ReservaError as error:
+            return JsonResponse({'Error': True, 'Descripcion': error.descripcion})
+
+        # Sin "parcial", si alguna fecha choca no se agenda ninguna y se regresan los conflictos de cada fecha
+        if conflictos and not creadas:
+            return JsonResponse({'Error': True, 'Descripcion': 'Algunas fechas de la serie no estan disponibles',
+                                 'conflictos': conflictos})
+        return JsonResponse({'Success': True,
+                             'citas': [{'id': cita.id, 'fecha': cita.fecha.isoformat()} for cita in creadas],
+                             'conflictos': conflictos})
+
+# Error de un rango de fechas no valido en las consultas de disponibilidad; ``descripcion`` se muestra al usuario
+class RangoFechasError(Exception):
+    def __init__(self, descripcion):
+        super().__init__(descripcion)
+        self.descripcion = descripcion
+
+# Lee el rango de fechas (desde/hasta) de una consulta de disponibilidad; lanza RangoFechasError si no es valido
+def leer_rango_fechas(request, dias_por_defecto):
+    # Si no se envian las fechas se consultan los dias siguientes al actual
+    manana = timezone.localdate() + timedelta(days=1)
+    try:
+        desde = date.fromisoformat(request.GET['desde']) if request.GET.get('desde') else manana
+        hasta = (date.fromisoformat(request.GET['hasta']) if request.GET.get('hasta')
+                 else desde + timedelta(days=dias_por_defecto - 1))
+    except ValueError:
+        raise RangoFechasError('Las fechas deben tener el formato AAAA-MM-DD')
+
+    # No se ofrecen horarios de dias pasados ni del dia actual, igual que en la ventana de agendar cita
+    desde = max(desde, manana)
+    if hasta < desde:
+        raise RangoFechasError('El rango de fechas no es valido')
+    if (hasta - desde).days >= MAX_DIAS_CONSULTA:
+        raise RangoFechasError('Solo se pueden consultar ' + str(MAX_DIAS_CONSULTA) + ' dias a la vez')
+    return desde, hasta
+
+# Clase para consultar los horarios realmente libres de un especialista antes de agendar
+class Disponibilidad(View):
+    @method_decorator(login_required, name='dispatch')
+    def get(self, request, id):
+        try:
+            aux_especialista = Especialista.objects.get(id=id)
+        except Especialista.DoesNotExist:
+            return JsonResponse({'Error': True, 'Descripcion': 'Especialista no encontrado'}, status=404)
+
+        try:
+            desde, hasta = leer_rango_fechas(request, 1)
+        except RangoFechasError as error:
+            return JsonResponse({'Error': True, 'Descripcion': error.descripcion}, status=400)
+
+        return JsonResponse({'id_especialista': aux_especialista.id,
+                             'desde': desde.isoformat(),
+                             'hasta': hasta.isoformat(),
+                             'disponibilidad': horarios_libres(aux_especialista, desde, hasta)})
+
+# Clase para buscar los primeros horarios libres entre todos los especialistas activos de una especialidad
+class Primeros_disponibles(View):
+    # Numero de horarios que se regresan si no se indica otro, y maximo permitido
+    LIMITE_POR_DEFECTO = 10
+    LIMITE_MAXIMO = 50
+
+    @method_decorator(login_required, name='dispatch')
+    def get(self, request, id):
+        if not Especialidades.objects.filter(id=id).exists():
+            return JsonResponse({'Error': True, 'Descripcion': 'Especialidad no encontrada'}, status=404)
+        try:
+            limite = int(request.GET.get('n', self.LIMITE_POR_DEFECTO))
+        except ValueError:
+            return JsonResponse({'Error': True, 'Descripcion': 'n debe ser un numero'}, status=400)
+        limite = min(max(limite, 1), self.LIMITE_MAXIMO)
+
+        try:
+            desde, hasta = leer_rango_fechas(request, 14)
+        except RangoFechasError as error:
+            return JsonResponse({'Error': True, 'Descripcion': error.descripcion}, status=400)
+
+        especialistas = {
+            especialista.id: especialista
+            for especialista in Especialista.objects.filter(id_especialidad_id=id, estatus=1)
+            .select_related('id_usuario__id_usuario')
+            .only('id', 'horario', 'horario_compilado', 'id_usuario__id_usuario__first_name',
+                  'id_usuario__id_usuario__last_name')
+        }
+        horarios = []
+        for fecha, minutos, id_especialista in primeros_libres(list(especialistas.values()), desde, hasta, limite):
+            usuario = especialistas[id_especialista].id_usuario.id_usuario
+            horarios.append({'id_especialista': id_especialista,
+                             'especialista': (usuario.first_name + ' ' + usuario.last_name).strip(),
+                             'fecha': fecha.isoformat(),
+                             'hora': minutos_a_texto(minutos)})
+
+        return JsonResponse({'id_especialidad': id,
+                             'desde': desde.isoformat(),
+                             'hasta': hasta.isoformat(),
+                             'horarios': horarios})
+
+# Clase para que el paciente se anote en la lista de espera de un especialista; los horarios que se liberen se le ofrecen con el comando procesar_lista_espera y aparecen aqui como 'oferta' hasta que los acepta
+class Lista_espera(View):
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+    @method_decorator(login_required(login_url='login'), name='dispatch')
+    def get(self, request):
+        paciente = request.actor.paciente
+        if paciente is None:
+            return JsonResponse({'Error': True, 'Descripcion': 'Solo los pacientes tienen lista de espera'}, status=403)
+        esperas = (ListaEspera.objects.filter(id_paciente=paciente).exclude(estatus='C')
+                   .select_related('id_cita').order_by('-creada'))
+        return JsonResponse({'lista_espera': [{'id': espera.id,
+                                               'id_especialista': espera.id_especialista_id,
+                                               'desde': espera.fecha_desde.isoformat(),
+                                               'hasta': espera.fecha_hasta.isoformat(),
+                                               'estatus': espera.estatus,
+                                               'oferta': {'fecha': espera.oferta_fecha.isoformat(),
+                                                          'hora': espera.oferta_hora.strftime('%H:%M'),
+                                                          'vence': espera.oferta_vence.isoformat()}
+                                               if espera.estatus == 'O' else None,
+                                               'cita': {'id': espera.id_cita.id,
+                                                        'fecha': espera.id_cita.fecha.isoformat(),
+                                                        'hora': espera.id_cita.hora.strftime('%H:%M')}
+                                               if espera.id_cita else None}
+                                              for espera in esperas]})
+
+    @method_decorator(login_required(login_url='login'), name='dispatch')
+    def post(self, request):
+        paciente = request.actor.paciente
+        if paciente is None:
+            return JsonResponse({'Error': True, 'Descripcion': 'Solo los pacientes tienen lista de espera'}, status=403)
+        try:
+            jd = json.loads(request.body)
+            id_especialista = int(jd['id_especialista'])
+            desde = date.fromisoformat(jd['desde'])
+            hasta = date.fromisoformat(jd['hasta'])
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'Error': True, 'Descripcion': 'Faltan datos de la lista de espera'}, status=400)
+
+        # Igual que al agendar, solo se ofrecen horarios a partir del dia siguiente
+        desde = max(desde, timezone.localdate() + timedelta(days=1))
+        if hasta < desde:
+            return JsonResponse({'Error': True, 'Descripcion': 'El rango de fechas no es valido'}, status=400)
+        if not Especialista.objects.filter(id=id_especialista, estatus=1).exists():
+            return JsonResponse({'Error': True, 'Descripcion': 'Especialista no encontrado'}, status=404)
+        if not Solicitudes.objects.filter(id_paciente=paciente, id_especialista_id=id_especialista,
+                                          estatus='A').exists():
+            return JsonResponse({'Error': True, 'Descripcion': 'Este especialista no ha aceptado una solicitud tuya'})
+        if ListaEspera.objects.filter(id_paciente=paciente, id_especialista_id=id_especialista,
+                                      estatus='E').exists():
+            return JsonResponse({'Error': True, 'Descripcion': 'Ya estas en la lista de espera de este especialista'})
+
+        espera = ListaEspera.objects.create(id_especialista_id=id_especialista, id_paciente=paciente,
+                                            fecha_desde=desde, fecha_hasta=hasta, motivo=jd.get('motivo', ''))
+        return JsonResponse({'Success': True, 'id': espera.id})
+
+    @method_decorator(login_required(login_url='login'), name='dispatch')
+    def delete(self, request, id):
+        paciente = request.actor.paciente
+        if paciente is None or not cancelar_espera(id, paciente.id):
+            return JsonResponse({'Error': True, 'Descripcion': 'Registro de lista de espera no encontrado'}, status=404)
+        return JsonResponse({'Success': True})
+
+# Clase para que el paciente acepte el horario que se le ofrecio desde la lista de espera; hasta entonces se agenda la cita
+class Aceptar_oferta(View):
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+    @method_decorator(login_required(login_url='login'), name='dispatch')
+    def post(self, request, id):
+        paciente = request.actor.paciente
+        if paciente is None:
+            return JsonResponse({'Error': True, 'Descripcion': 'Solo los pacientes tienen lista de espera'}, status=403)
+        try:
+            cita = aceptar_oferta(id, paciente.id)
+        except ReservaError as error:
+            return JsonResponse({'Error': True, 'Descripcion': error.descripcion})
+        return JsonResponse({'Success': True, 'id_cita': cita.id})
 
 # Clase para visualizar las citas agendadas del paciente
 class ListarCitas_Paciente(View):
@@ -603,11 +577,7 @@ class ListarCitas_Paciente(View):
 
     @method_decorator(login_required(login_url='login'), name='dispatch')
     def get(self, request):
-        usuario_id = Usuario.objects.get(id_usuario=request.user)
-        try:
-            paciente = Paciente.objects.filter(id_usuario=usuario_id).first()
-        except Especialista.DoesNotExist:
-            paciente = None
+        paciente = request.actor.paciente
         citas = Cita.objects.filter(id_paciente=paciente.id)
         for cita in citas:
             cita.fecha = cita.fecha.strftime('%Y-%m-%d')
@@ -638,8 +608,7 @@ class ListarCitas_Paciente(View):
 class Enviar_solicitud(View):
     @method_decorator(login_required, name='dispatch')
     def post(self, request, id_especialista):
-        aux_usuario = Usuario.objects.get(id_usuario_id=request.user.id)
-        aux_paciente = Paciente.objects.get(id_usuario_id=aux_usuario.id)
+        aux_paciente = request.actor.paciente
 
         solicitud = Solicitudes.objects.create(id_especialista_id=id_especialista, id_paciente_id=aux_paciente.id,
                                                estatus='P')
@@ -657,8 +626,7 @@ class Guardar_Ficha(View):
         peso = request.POST.get('peso')
         talla = request.POST.get('talla')
 
-        aux_usuario = Usuario.objects.get(id_usuario=request.user.id)
-        aux_paciente = Paciente.objects.get(id_usuario=aux_usuario.id)
+        aux_paciente = request.actor.paciente
 
         aux_paciente.genero = sexo
         aux_paciente.estado_civil = estado_civil
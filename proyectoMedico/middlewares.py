@@ -1,6 +1,11 @@
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from moduloPrincipal.utils.actor import resolver_actor
 
 class UserTypeMiddleware(MiddlewareMixin):
     def process_request(self, request):
         user_type = request.session.get('user_type')
         request.user_type = user_type
+        # Usuario con su paciente o especialista, se busca solo si la vista lo usa y una vez por peticion
+        request.actor = SimpleLazyObject(lambda: resolver_actor(request))
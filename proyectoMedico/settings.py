@@ -96,6 +96,17 @@ DATABASES = {
     }
 }
 
+# Con REDIS_URL el cache de Django es Redis, compartido por todos los procesos del servidor, y en el se guarda el
+# expediente clinico (una lectura por peticion). Sin REDIS_URL se usa el cache por proceso de Django (LocMemCache),
+# que no necesita tablas ni servicios extra; en ese caso el expediente no se guarda en cache (ver utils/expediente.py)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+
 
 
 